@@ -0,0 +1,140 @@
+import io
+import time
+import argparse
+from typing import Dict, List, Set
+import numpy as np
+from src.db_pool import db_pool
+from src.vector_retriever import Retriever, to_vector_literal
+
+TABLE = "ann_benchmark"
+
+SEARCH_SQL = f"SELECT id FROM {TABLE} ORDER BY embedding <=> %s::vector LIMIT %s"
+
+
+def synthetic_vectors(rng: np.random.Generator, n: int, centers: np.ndarray, noise: float = 0.35) -> np.ndarray:
+    """
+    Draw unit vectors clustered around topic centers, which is closer to real
+    embedding distributions than uniform noise (and harder for ANN indexes).
+    """
+    labels = rng.integers(0, len(centers), size=n)
+    vectors = centers[labels] + noise * rng.standard_normal((n, centers.shape[1])).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def create_table(dim: int) -> None:
+    """
+    (Re)create the benchmark table, leaving the real chunk table untouched.
+    """
+    with db_pool.connection() as conn, conn.cursor() as cur:
+        cur.execute("CREATE EXTENSION IF NOT EXISTS vector;")
+        cur.execute(f"DROP TABLE IF EXISTS {TABLE};")
+        cur.execute(f"CREATE TABLE {TABLE} (id BIGSERIAL PRIMARY KEY, embedding vector({dim}));")
+        conn.commit()
+
+
+def grow_table(rng: np.random.Generator, centers: np.ndarray, rows: int, block: int = 20_000) -> None:
+    """
+    Append rows to the benchmark table with COPY, block by block to bound memory.
+    Any existing index is dropped first so the load is not slowed by index maintenance.
+    """
+    with db_pool.connection() as conn, conn.cursor() as cur:
+        cur.execute(f"DROP INDEX IF EXISTS {TABLE}_embedding_idx;")
+        for start in range(0, rows, block):
+            vectors = synthetic_vectors(rng, min(block, rows - start), centers)
+            buf = io.StringIO("".join(to_vector_literal(v.tolist()) + "\n" for v in vectors))
+            cur.copy_expert(f"COPY {TABLE} (embedding) FROM STDIN", buf)
+            conn.commit()
+
+
+def build_index(method: str, rows: int) -> float:
+    """
+    (Re)build the ANN index and return the build time in seconds.
+    """
+    options = "m = 16, ef_construction = 64" if method == "hnsw" else f"lists = {max(1, rows // 1000) if rows <= 1_000_000 else int(rows ** 0.5)}"
+    with db_pool.connection() as conn, conn.cursor() as cur:
+        cur.execute(f"DROP INDEX IF EXISTS {TABLE}_embedding_idx;")
+        cur.execute("SET LOCAL maintenance_work_mem = '2GB';")
+        start = time.perf_counter()
+        cur.execute(f"CREATE INDEX {TABLE}_embedding_idx ON {TABLE} USING {method} (embedding vector_cosine_ops) WITH ({options});")
+        conn.commit()
+        cur.execute(f"ANALYZE {TABLE};")
+        conn.commit()
+    return time.perf_counter() - start
+
+
+def run_queries(queries: List[str], k: int, exact: bool, ef_search: int = 0, probes: int = 0):
+    """
+    Run each query on one pooled connection and return (result id sets, latencies in ms).
+    """
+    results: List[Set[int]] = []
+    latencies: List[float] = []
+    with db_pool.connection() as conn, conn.cursor() as cur:
+        for q in queries:
+            start = time.perf_counter()
+            if exact:
+                cur.execute("SET LOCAL enable_indexscan = off;")
+            else:
+                Retriever.apply_search_settings(cur, ef_search, probes)
+            cur.execute(SEARCH_SQL, (q, k))
+            results.append({row[0] for row in cur.fetchall()})
+            conn.rollback()
+            latencies.append((time.perf_counter() - start) * 1000)
+    return results, np.array(latencies)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark pgvector ANN recall@k and latency against exact search.")
+    parser.add_argument("--sizes", default="10000,100000", help="Comma-separated corpus sizes, ascending")
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--method", choices=["hnsw", "ivfflat"], default="hnsw")
+    parser.add_argument("--settings", default=None, help="ef_search (hnsw) or probes (ivfflat) values to sweep")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    sizes = sorted(int(s) for s in args.sizes.split(","))
+    settings = [int(s) for s in (args.settings or ("20,40,100,200" if args.method == "hnsw" else "1,5,10,40")).split(",")]
+
+    rng = np.random.default_rng(args.seed)
+    centers = rng.standard_normal((256, args.dim)).astype(np.float32)
+    queries = [to_vector_literal(v.tolist()) for v in synthetic_vectors(rng, args.queries, centers)]
+
+    create_table(args.dim)
+    loaded = 0
+    report: List[Dict[str, float]] = []
+
+    for size in sizes:
+        start = time.perf_counter()
+        grow_table(rng, centers, size - loaded)
+        loaded = size
+        print(f"\nLoaded {size:,} rows in {time.perf_counter() - start:.1f}s")
+
+        exact_ids, exact_ms = run_queries(queries, args.k, exact=True)
+        build_seconds = build_index(args.method, size)
+        print(f"Built {args.method} index in {build_seconds:.1f}s")
+
+        report.append({"rows": size, "setting": "exact", "recall": 1.0,
+                       "p50_ms": np.percentile(exact_ms, 50), "p99_ms": np.percentile(exact_ms, 99)})
+        for setting in settings:
+            ann_ids, ann_ms = run_queries(
+                queries, args.k, exact=False,
+                ef_search=setting if args.method == "hnsw" else 0,
+                probes=setting if args.method == "ivfflat" else 0,
+            )
+            recall = np.mean([len(a & e) / len(e) for a, e in zip(ann_ids, exact_ids) if e])
+            report.append({"rows": size, "setting": setting, "recall": recall,
+                           "p50_ms": np.percentile(ann_ms, 50), "p99_ms": np.percentile(ann_ms, 99)})
+
+    knob = "ef_search" if args.method == "hnsw" else "probes"
+    print(f"\n{'rows':>10} {knob:>10} {'recall@' + str(args.k):>10} {'p50 ms':>9} {'p99 ms':>9}")
+    for r in report:
+        print(f"{r['rows']:>10,} {str(r['setting']):>10} {r['recall']:>10.3f} {r['p50_ms']:>9.2f} {r['p99_ms']:>9.2f}")
+
+    with db_pool.connection() as conn, conn.cursor() as cur:
+        cur.execute(f"DROP TABLE IF EXISTS {TABLE};")
+        conn.commit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import json
+import time
+import argparse
+from typing import List
+import numpy as np
+from src.query import QueryMachine
+from src.embeddings_generator import count_tokens
+
+
+def load_questions(path: str) -> List[str]:
+    with open(path) as f:
+        return [json.loads(line)["inputs"]["question"] for line in f if line.strip()]
+
+
+def time_to_first_token(machine: QueryMachine, question: str, context: str) -> float:
+    """
+    Stream an answer and return seconds until its first token.
+    """
+    start = time.perf_counter()
+    stream = machine.get_answer_stream(question, context)
+    next(stream, None)
+    elapsed = time.perf_counter() - start
+    stream.close()
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare prompt size of raw and assembled retrieval context.")
+    parser.add_argument("--queries", default="eval/data/queries.jsonl")
+    parser.add_argument("--price-per-mtok", type=float, default=2.0, help="USD per million input tokens")
+    parser.add_argument("--ttft", action="store_true", help="Also measure time to first token (calls the chat API)")
+    args = parser.parse_args()
+
+    machine = QueryMachine(use_answer_cache=False)
+    questions = load_questions(args.queries)
+
+    raw_tokens, built_tokens, raw_ttft, built_ttft = [], [], [], []
+    for question in questions:
+        graph_chunks, vector_rows, _ = machine.retrieve_context(question)
+        # What the prompt received before context assembly: reprs of the concatenated results
+        raw_context = graph_chunks + vector_rows if graph_chunks else vector_rows
+        built_context = machine.context_builder.build(graph_chunks, vector_rows)
+
+        # Counted in the chat model's tokens, the ones the price is per
+        raw_tokens.append(count_tokens(machine.prompt_template.format(context=raw_context, question=question), machine.MODEL))
+        built_tokens.append(count_tokens(machine.prompt_template.format(context=built_context, question=question), machine.MODEL))
+        if args.ttft:
+            raw_ttft.append(time_to_first_token(machine, question, raw_context))
+            built_ttft.append(time_to_first_token(machine, question, built_context))
+
+    print(f"{len(questions)} questions, budget {machine.context_builder.token_budget} tokens\n")
+    print(f"{'context':<12} {'mean tok':>9} {'p95 tok':>9} {'$/1k answers':>13}" + (f" {'p50 TTFT s':>11}" if args.ttft else ""))
+    for name, tokens, ttft in [("raw", raw_tokens, raw_ttft), ("assembled", built_tokens, built_ttft)]:
+        cost = np.mean(tokens) * args.price_per_mtok / 1e6 * 1000
+        line = f"{name:<12} {np.mean(tokens):>9.0f} {np.percentile(tokens, 95):>9.0f} {cost:>13.3f}"
+        if args.ttft:
+            line += f" {np.percentile(ttft, 50):>11.3f}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+import os
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+import numpy as np
+from openai import OpenAI, AsyncOpenAI
+from src.query import QueryMachine
+from src.async_query import AsyncQueryMachine
+from src.embedding_cache import EmbeddingCache
+from src.embeddings_generator import Generator as EmbeddingsGenerator
+from src.fake_openai import FakeOpenAIServer
+from src.fake_backends import InMemoryGraph, InMemoryVectorStore, AsyncInMemoryGraph, AsyncInMemoryVectorStore
+
+
+class FakeQueryMachine(QueryMachine):
+    """
+    QueryMachine wired to the fake OpenAI server and in-memory graph and vector stores.
+    """
+
+    def __init__(self, base_url: str, graph_latency: float, vector_latency: float, cache_dir: str, **kwargs) -> None:
+        self.base_url = base_url
+        self.graph_latency = graph_latency
+        self.vector_latency = vector_latency
+        self.cache_dir = cache_dir
+        super().__init__(use_answer_cache=False, **kwargs)
+
+    def _create_clients(self) -> None:
+        self.db_search = InMemoryVectorStore(latency=self.vector_latency)
+        self.embeddings_generator = EmbeddingsGenerator(base_url=self.base_url, use_cache=False)
+        self.embeddings_generator.cache = EmbeddingCache(self.cache_dir)
+        self.graph_db_retriever = InMemoryGraph(latency=self.graph_latency)
+        self.openai_client = OpenAI(api_key="fake", base_url=self.base_url)
+        self.retrieval_executor = ThreadPoolExecutor(max_workers=self.retrieval_workers, thread_name_prefix="retrieval")
+
+
+class FakeAsyncQueryMachine(AsyncQueryMachine):
+    """
+    AsyncQueryMachine wired to the fake OpenAI server and in-memory graph and vector stores.
+    """
+
+    def __init__(self, base_url: str, graph_latency: float, vector_latency: float, cache_dir: str, **kwargs) -> None:
+        self.base_url = base_url
+        self.graph_latency = graph_latency
+        self.vector_latency = vector_latency
+        self.cache_dir = cache_dir
+        super().__init__(use_answer_cache=False, **kwargs)
+
+    def _create_clients(self) -> None:
+        self.db_search = AsyncInMemoryVectorStore(latency=self.vector_latency)
+        self.embedding_cache = EmbeddingCache(self.cache_dir)
+        self.graph_db_retriever = AsyncInMemoryGraph(latency=self.graph_latency)
+        self.openai_client = AsyncOpenAI(api_key="fake", base_url=self.base_url)
+
+
+def load_questions(path: str, n: int, repeat: bool) -> List[str]:
+    """
+    Cycle the dataset questions up to n requests. Unless repeat is set, each request's question
+    is made unique so embedding lookups miss the cache, as for fresh user traffic.
+    """
+    with open(path) as f:
+        questions = [json.loads(line)["inputs"]["question"] for line in f if line.strip()]
+    return [questions[i % len(questions)] + ("" if repeat else f" (request {i})") for i in range(n)]
+
+
+def run_sync(machine: QueryMachine, questions: List[str], concurrency: int) -> Tuple[List[float], List[float], float]:
+    def one(question: str) -> Tuple[float, float]:
+        start = time.perf_counter()
+        ttft = None
+        for _ in machine.enter_query(question, []):
+            if ttft is None:
+                ttft = time.perf_counter() - start
+        total = time.perf_counter() - start
+        return ttft if ttft is not None else total, total
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, questions))
+    wall = time.perf_counter() - start
+    return [r[0] for r in results], [r[1] for r in results], wall
+
+
+def run_async(machine: AsyncQueryMachine, questions: List[str], concurrency: int) -> Tuple[List[float], List[float], float]:
+    async def main() -> Tuple[List[Tuple[float, float]], float]:
+        slots = asyncio.Semaphore(concurrency)
+
+        async def one(question: str) -> Tuple[float, float]:
+            async with slots:
+                start = time.perf_counter()
+                ttft = None
+                async for _ in machine.enter_query(question, []):
+                    if ttft is None:
+                        ttft = time.perf_counter() - start
+                total = time.perf_counter() - start
+                return ttft if ttft is not None else total, total
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(one(q) for q in questions))
+        return results, time.perf_counter() - start
+
+    results, wall = asyncio.run(main())
+    return [r[0] for r in results], [r[1] for r in results], wall
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark QueryMachine.enter_query against local fake backends.")
+    parser.add_argument("--mode", choices=["sync", "async", "both"], default="both")
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=64, help="Requests per concurrency level")
+    parser.add_argument("--queries", default="eval/data/queries.jsonl")
+    parser.add_argument("--repeat-questions", action="store_true", help="Reuse identical questions (warm embedding cache)")
+    parser.add_argument("--embed-latency", type=float, default=0.1)
+    parser.add_argument("--chat-latency", type=float, default=0.4, help="Seconds to the first chat token")
+    parser.add_argument("--tokens-per-second", type=float, default=80.0)
+    parser.add_argument("--answer-tokens", type=int, default=150)
+    parser.add_argument("--graph-latency", type=float, default=0.03)
+    parser.add_argument("--vector-latency", type=float, default=0.01)
+    args = parser.parse_args()
+
+    # The fake server ignores credentials, but the OpenAI clients refuse to start without one
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+    levels = [int(c) for c in args.concurrency.split(",")]
+    modes = ["sync", "async"] if args.mode == "both" else [args.mode]
+
+    server = FakeOpenAIServer(
+        latency=args.embed_latency,
+        chat_latency=args.chat_latency,
+        tokens_per_second=args.tokens_per_second,
+        answer_tokens=args.answer_tokens,
+    )
+    # A throwaway embedding cache; EmbeddingCache flushes at exit, so the directory is left in place
+    cache_dir = tempfile.mkdtemp(prefix="bench_query_cache_")
+    with server:
+        print(f"fake backends: embed {args.embed_latency}s, first token {args.chat_latency}s, "
+              f"{args.tokens_per_second:g} tok/s x {args.answer_tokens}, graph {args.graph_latency}s, vector {args.vector_latency}s\n")
+        print(f"{'mode':<6} {'conc':>5} {'req/s':>7} {'TTFT p50':>9} {'p95':>7} {'p99':>7} {'e2e p50':>8} {'p95':>7} {'p99':>7}")
+
+        for mode in modes:
+            machine_class = FakeQueryMachine if mode == "sync" else FakeAsyncQueryMachine
+            machine = machine_class(server.base_url, args.graph_latency, args.vector_latency, cache_dir)
+            for concurrency in levels:
+                questions = load_questions(args.queries, args.requests, args.repeat_questions)
+                if mode == "sync":
+                    ttfts, totals, wall = run_sync(machine, questions, concurrency)
+                else:
+                    ttfts, totals, wall = run_async(machine, questions, concurrency)
+                t50, t95, t99 = np.percentile(ttfts, [50, 95, 99])
+                e50, e95, e99 = np.percentile(totals, [50, 95, 99])
+                print(f"{mode:<6} {concurrency:>5} {len(questions) / wall:>7.1f} {t50:>9.3f} {t95:>7.3f} {t99:>7.3f} "
+                      f"{e50:>8.3f} {e95:>7.3f} {e99:>7.3f}")
+
+
+if __name__ == "__main__":
+    main()
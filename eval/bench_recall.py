@@ -0,0 +1,200 @@
+import os
+import glob
+import json
+import time
+import argparse
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+import numpy as np
+from src.db_pool import db_pool
+from src.embedding_cache import normalize_text, text_digest
+from src.embeddings_generator import Generator as EmbeddingsGenerator
+from src.vector_retriever import get_retriever
+from src.context_builder import ContextBuilder
+from src.neo4j.scripts.graph_retriever import GraphModel
+
+TERMS_GLOB = "eval/data/rare_terms_*.json"
+
+
+def load_term_sets(pattern: str = TERMS_GLOB) -> Dict[str, Dict[str, List[int]]]:
+    """
+    Load every term -> chunk ids map, keyed by tier ("common", "medium", "rare").
+    """
+    tiers = {}
+    for path in sorted(glob.glob(pattern)):
+        tier = path.rsplit("rare_terms_", 1)[1].removesuffix(".json")
+        with open(path) as f:
+            tiers[tier] = json.load(f)
+    return tiers
+
+
+def chunk_ids_by_digest() -> Dict[bytes, int]:
+    """
+    Map each stored chunk's normalized text to its id, so graph results (chunk contents) can be scored.
+    """
+    with db_pool.connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT id, chunk FROM art_of_war_book_english")
+        return {text_digest(normalize_text(chunk)): chunk_id for chunk_id, chunk in cur.fetchall()}
+
+
+def embed_terms(terms: Sequence[str]) -> Dict[str, List[float]]:
+    """
+    Embed the terms in batched requests; the embedding cache makes repeat runs free.
+    """
+    generator = EmbeddingsGenerator(chunks=list(terms))
+    return {term: embedding for term, embedding in generator.generate_chunk_embeddings() if embedding is not None}
+
+
+def timed(search: Callable[[str], Any], terms: Sequence[str]) -> Tuple[List[Any], np.ndarray]:
+    """
+    Run search for each term and return the results and per-term latency in ms.
+    """
+    results, latencies = [], []
+    for term in terms:
+        start = time.perf_counter()
+        results.append(search(term))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return results, np.array(latencies)
+
+
+def ranked_ids(ids: Sequence[int], k: int) -> List[int]:
+    """
+    First k distinct ids in rank order; unknown chunks (-1) keep their rank slot.
+    """
+    seen, ranked = set(), []
+    for chunk_id in ids:
+        if chunk_id == -1 or chunk_id not in seen:
+            seen.add(chunk_id)
+            ranked.append(chunk_id)
+            if len(ranked) == k:
+                break
+    return ranked
+
+
+def score(retrieved: List[List[int]], relevant: List[List[int]], ks: Sequence[int]) -> Dict[str, float]:
+    """
+    Recall@k, hit rate@k and MRR for all queries at once.
+
+    Retrieved ids are padded into an (n_queries, k) matrix, and both retrieved and relevant
+    pairs are encoded as query_index * stride + chunk_id, so membership for every rank of
+    every query is a single np.isin over int64 keys.
+
+    Args:
+        retrieved (List[List[int]]): Ranked chunk ids per query (at most max(ks) each).
+        relevant (List[List[int]]): Relevant chunk ids per query.
+        ks (Sequence[int]): Cutoffs to report.
+
+    Returns:
+        Dict[str, float]: recall@k and hit@k for each k, and mrr.
+    """
+    n, depth = len(retrieved), max(ks)
+    stride = 1 + max(
+        max((max(ids) for ids in relevant if ids), default=0),
+        max((max(ids) for ids in retrieved if ids), default=0),
+    )
+    matrix = np.full((n, depth), -1, dtype=np.int64)
+    for i, ids in enumerate(retrieved):
+        matrix[i, :len(ids)] = ids[:depth]
+
+    rows = np.arange(n, dtype=np.int64)[:, None]
+    retrieved_keys = np.where(matrix >= 0, rows * stride + matrix, -1)
+    relevant_counts = np.array([len(ids) for ids in relevant])
+    relevant_keys = np.concatenate(
+        [i * stride + np.asarray(ids, dtype=np.int64) for i, ids in enumerate(relevant) if ids]
+    ) if relevant_counts.any() else np.empty(0, dtype=np.int64)
+    hits = np.isin(retrieved_keys, relevant_keys)
+
+    metrics = {}
+    cumulative = np.cumsum(hits, axis=1)
+    for k in ks:
+        found = cumulative[:, k - 1]
+        metrics[f"recall@{k}"] = float(np.mean(found / np.maximum(relevant_counts, 1)))
+        metrics[f"hit@{k}"] = float(np.mean(found > 0))
+    first = np.argmax(hits, axis=1)
+    metrics["mrr"] = float(np.mean(np.where(hits.any(axis=1), 1.0 / (first + 1), 0.0)))
+    return metrics
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="LLM-free retrieval benchmark: recall@k, MRR and latency over the rare-term sets.")
+    parser.add_argument("--k", default="1,5,10", help="Comma-separated cutoffs")
+    parser.add_argument("--tiers", default=None, help="Comma-separated tiers (default: every rare_terms_*.json)")
+    parser.add_argument("--max-terms", type=int, default=0, help="Sample at most this many terms per tier (0 = all)")
+    parser.add_argument("--backend", default=None, help="Vector backend: pgvector or numpy (default: RETRIEVER_BACKEND)")
+    parser.add_argument("--ef-search", type=int, default=None, help="hnsw.ef_search (pgvector only)")
+    parser.add_argument("--probes", type=int, default=None, help="ivfflat.probes (pgvector only)")
+    parser.add_argument("--skip-graph", action="store_true", help="Benchmark vector retrieval only")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    backend = (args.backend or os.getenv("RETRIEVER_BACKEND", "pgvector")).lower()
+    if backend != "pgvector" and (args.ef_search or args.probes):
+        parser.error(f"--ef-search and --probes only apply to the pgvector backend, not {backend}")
+
+    ks = sorted(int(k) for k in args.k.split(","))
+    depth = ks[-1]
+    tiers = load_term_sets()
+    if args.tiers:
+        tiers = {tier: tiers[tier] for tier in args.tiers.split(",")}
+    rng = np.random.default_rng(args.seed)
+    for tier, term_map in tiers.items():
+        if args.max_terms and len(term_map) > args.max_terms:
+            picked = rng.choice(len(term_map), size=args.max_terms, replace=False)
+            items = list(term_map.items())
+            tiers[tier] = dict(items[i] for i in sorted(picked))
+
+    all_terms = sorted({term for term_map in tiers.values() for term in term_map})
+    start = time.perf_counter()
+    embeddings = embed_terms(all_terms)
+    print(f"Embedded {len(embeddings)} terms in {time.perf_counter() - start:.1f}s (excluded from latencies)")
+
+    digest_to_id = chunk_ids_by_digest()
+    retriever = get_retriever(backend)
+    search_settings = {}
+    if args.ef_search:
+        search_settings["ef_search"] = args.ef_search
+    if args.probes:
+        search_settings["probes"] = args.probes
+    graph = None if args.skip_graph else GraphModel()
+
+    def vector_search(term: str) -> List[Dict[str, Any]]:
+        if term not in embeddings:
+            return []
+        return retriever.find_similar(embeddings[term], limit=depth, **search_settings) or []
+
+    def graph_ids(chunks: List[str]) -> List[int]:
+        return [digest_to_id.get(text_digest(normalize_text(chunk)), -1) for chunk in chunks]
+
+    print(f"\nk={','.join(map(str, ks))}; combined = graph and vector merged and ranked as in ContextBuilder, "
+          f"latency estimated as max(graph, vector) + merge")
+    header = f"{'tier':<8} {'method':<9} {'terms':>6} " + " ".join(f"{'R@' + str(k):>7}" for k in ks) \
+        + " " + " ".join(f"{'hit@' + str(k):>7}" for k in ks) + f" {'MRR':>6} {'p50 ms':>8} {'p95 ms':>8}"
+    print(header)
+
+    for tier, term_map in tiers.items():
+        terms = list(term_map)
+        relevant = [term_map[term] for term in terms]
+
+        vector_rows, vector_ms = timed(vector_search, terms)
+        results = {"vector": ([ranked_ids([row["id"] for row in rows], depth) for rows in vector_rows], vector_ms)}
+
+        if graph is not None:
+            graph_chunks, graph_ms = timed(graph.run, terms)
+            results["graph"] = ([ranked_ids(graph_ids(chunks), depth) for chunks in graph_chunks], graph_ms)
+
+            combined, merge_ms = [], []
+            for chunks, rows in zip(graph_chunks, vector_rows):
+                merge_start = time.perf_counter()
+                passages = ContextBuilder._rank(ContextBuilder._merge(chunks, rows))
+                combined.append(ranked_ids(graph_ids([p["text"] for p in passages]), depth))
+                merge_ms.append((time.perf_counter() - merge_start) * 1000)
+            results["combined"] = (combined, np.maximum(graph_ms, vector_ms) + np.array(merge_ms))
+
+        for method, (retrieved, latencies) in results.items():
+            metrics = score(retrieved, relevant, ks)
+            print(f"{tier:<8} {method:<9} {len(terms):>6} "
+                  + " ".join(f"{metrics[f'recall@{k}']:>7.3f}" for k in ks) + " "
+                  + " ".join(f"{metrics[f'hit@{k}']:>7.3f}" for k in ks)
+                  + f" {metrics['mrr']:>6.3f} {np.percentile(latencies, 50):>8.2f} {np.percentile(latencies, 95):>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
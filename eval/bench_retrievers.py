@@ -0,0 +1,62 @@
+import time
+import argparse
+from typing import Callable, List
+import numpy as np
+from src.vector_retriever import Retriever
+from src.numpy_retriever import NumpyRetriever
+
+
+def time_queries(search: Callable[[List[float]], list], queries: np.ndarray) -> np.ndarray:
+    """
+    Run each query through a search function and return per-query latency in ms.
+    """
+    latencies = []
+    for q in queries:
+        start = time.perf_counter()
+        search(q.tolist())
+        latencies.append((time.perf_counter() - start) * 1000)
+    return np.array(latencies)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare pgvector and in-process NumPy retrieval latency.")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=6)
+    parser.add_argument("--batch", type=int, default=64, help="Batch size for find_similar_batch")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    numpy_retriever = NumpyRetriever()
+    pg_retriever = Retriever()
+
+    # Queries are perturbed corpus vectors, so no embedding API calls are needed
+    rng = np.random.default_rng(args.seed)
+    picks = rng.integers(0, len(numpy_retriever.rows), size=args.queries)
+    queries = np.asarray(numpy_retriever.embeddings[picks]) + 0.02 * rng.standard_normal(
+        (args.queries, numpy_retriever.embeddings.shape[1])).astype(np.float32)
+
+    print(f"{len(numpy_retriever.rows):,} chunks, {args.queries} queries, k={args.k}\n")
+    print(f"{'backend':<22} {'p50 ms':>9} {'p99 ms':>9}")
+    for name, search in [
+        ("pgvector", lambda q: pg_retriever.find_similar(q, limit=args.k)),
+        ("numpy", lambda q: numpy_retriever.find_similar(q, limit=args.k)),
+    ]:
+        latencies = time_queries(search, queries)
+        print(f"{name:<22} {np.percentile(latencies, 50):>9.3f} {np.percentile(latencies, 99):>9.3f}")
+
+    start = time.perf_counter()
+    for i in range(0, len(queries), args.batch):
+        numpy_retriever.find_similar_batch(queries[i:i + args.batch], limit=args.k)
+    per_query = (time.perf_counter() - start) * 1000 / len(queries)
+    print(f"{'numpy batched':<22} {per_query:>9.3f} {'(mean)':>9}")
+
+    overlap = []
+    for q in queries[:50]:
+        pg_ids = {row['id'] for row in pg_retriever.find_similar(q.tolist(), limit=args.k) or []}
+        np_ids = {row['id'] for row in numpy_retriever.find_similar(q.tolist(), limit=args.k) or []}
+        overlap.append(len(pg_ids & np_ids) / max(1, len(np_ids)))
+    print(f"\nResult overlap@{args.k} (numpy is exact): {np.mean(overlap):.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+from typing import Dict, List
+import numpy as np
+
+QUESTION = "What did Sun Tzu say about the battle of the Fei river?"
+
+
+def eager_startup(model: str, entities_path: str) -> None:
+    """
+    The previous startup path: full pipeline, and every unique entity tokenized on each start.
+    """
+    import spacy
+    from spacy.matcher import PhraseMatcher
+
+    nlp = spacy.load(model)
+    matcher = PhraseMatcher(nlp.vocab)
+    with open(entities_path, 'r') as f:
+        data = json.load(f)
+    seen, patterns_by_label = set(), {}
+    for chunk in data:
+        for entity in chunk.get("entities", []):
+            key = (entity["text"].lower(), entity["label"])
+            if key not in seen:
+                seen.add(key)
+                patterns_by_label.setdefault(entity["label"], []).append(nlp.make_doc(entity["text"]))
+    for label, patterns in patterns_by_label.items():
+        matcher.add(label, patterns)
+    matcher(nlp(QUESTION))
+
+
+def lazy_startup(model: str, entities_path: str, patterns_path: str) -> None:
+    from src.spacy_helper import SpacyHelper
+
+    helper = SpacyHelper(model=model, entities_path=entities_path, patterns_path=patterns_path)
+    helper.parse_user_query_for_entities(QUESTION)
+
+
+def run_child(mode: str, args: argparse.Namespace) -> Dict[str, float]:
+    """
+    Start a fresh interpreter, time its startup path through the first query, and read its peak RSS.
+    """
+    start = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-m", "eval.bench_spacy_startup", "--child", mode,
+         "--model", args.model, "--entities", args.entities, "--patterns", args.patterns],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    wall = time.perf_counter() - start
+    child = json.loads(output.strip().splitlines()[-1])
+    return {"wall_s": wall, "init_s": child["init_s"], "rss_mb": child["rss_mb"]}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare SpacyHelper cold start with the eager full-pipeline startup.")
+    parser.add_argument("--model", default="en_core_web_sm")
+    parser.add_argument("--entities", default="assets/entities.json")
+    parser.add_argument("--patterns", default="assets/phrase_patterns.msgpack")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--child", choices=["eager", "lazy"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        start = time.perf_counter()
+        if args.child == "eager":
+            eager_startup(args.model, args.entities)
+        else:
+            lazy_startup(args.model, args.entities, args.patterns)
+        init_s = time.perf_counter() - start
+        # ru_maxrss is in kilobytes on Linux
+        rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        print(json.dumps({"init_s": init_s, "rss_mb": rss_mb}))
+        return
+
+    # Build the pattern artifact once, so the lazy runs measure a warm start
+    run_child("lazy", args)
+
+    print(f"{args.runs} cold starts each, first query included\n")
+    print(f"{'startup':<8} {'wall s':>8} {'init s':>8} {'peak RSS MB':>12}")
+    for mode in ("eager", "lazy"):
+        results: List[Dict[str, float]] = [run_child(mode, args) for _ in range(args.runs)]
+        print(f"{mode:<8} {np.median([r['wall_s'] for r in results]):>8.2f} "
+              f"{np.median([r['init_s'] for r in results]):>8.2f} "
+              f"{np.median([r['rss_mb'] for r in results]):>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,143 @@
+import os
+import json
+import time
+import random
+import sqlite3
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Type
 import numpy as np
 from dotenv import load_dotenv
 from pydantic import BaseModel, Field
 from openai import OpenAI
 from langchain_openai import ChatOpenAI
-from src.embeddings_generator import Generator
+from src.embeddings_generator import Generator, RETRYABLE_ERRORS
 
 load_dotenv()
 
 client = OpenAI()
 generator = Generator()
 
+JUDGE_CONCURRENCY = int(os.getenv("JUDGE_CONCURRENCY", "8"))
+JUDGE_MAX_RETRIES = int(os.getenv("JUDGE_MAX_RETRIES", "6"))
+GRADE_CACHE_PATH = os.getenv("GRADE_CACHE_PATH", "eval/results/grade_cache.sqlite")
+
+# ------------------------------------------------------------------------------
+# Judge engine: concurrency cap, rate-limit backoff and persistent grade cache
+# ------------------------------------------------------------------------------
+
+class GradeCache:
+    """
+    SQLite store of judge grades keyed by judge name, judge prompt version and a hash of the
+    judged content, so re-running an experiment does not re-grade unchanged examples.
+    """
+
+    def __init__(self, path: str = GRADE_CACHE_PATH) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS grades (
+                judge TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                input_hash TEXT NOT NULL,
+                grade TEXT NOT NULL,
+                PRIMARY KEY (judge, prompt_version, input_hash)
+            )
+        """)
+        self._db.commit()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, judge: str, prompt_version: str, input_hash: str) -> Optional[dict]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT grade FROM grades WHERE judge = ? AND prompt_version = ? AND input_hash = ?",
+                (judge, prompt_version, input_hash),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return json.loads(row[0])
+
+    def put(self, judge: str, prompt_version: str, input_hash: str, grade: dict) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO grades (judge, prompt_version, input_hash, grade) VALUES (?, ?, ?, ?)",
+                (judge, prompt_version, input_hash, json.dumps(grade)),
+            )
+            self._db.commit()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+grade_cache = GradeCache()
+_judge_slots = threading.BoundedSemaphore(JUDGE_CONCURRENCY)
+
+
+class Judge:
+    """
+    One LLM-as-judge grader. Grades are served from the grade cache when the same content
+    was graded with the same prompt version; otherwise the model is called with at most
+    JUDGE_CONCURRENCY calls in flight across all judges, retrying rate limits and transient
+    errors with exponential backoff.
+
+    Attributes:
+        name (str): Judge name, also the metric key.
+        instructions (str): System prompt.
+        grade_model (Type[BaseModel]): Structured output schema.
+        score_field (str): Boolean field of the schema used as the score.
+        prompt_version (str): Hash of the model, instructions and schema; changing any re-grades.
+    """
+
+    def __init__(self, name: str, instructions: str, grade_model: Type[BaseModel], score_field: str, model: str = "gpt-4o") -> None:
+        self.name = name
+        self.instructions = instructions
+        self.grade_model = grade_model
+        self.score_field = score_field
+        # _invoke is the only retry loop, so the client must not back off on its own as well
+        self.llm = ChatOpenAI(model=model, temperature=0, max_retries=0).with_structured_output(grade_model, method="json_schema", strict=True)
+        schema = json.dumps(grade_model.model_json_schema(), sort_keys=True)
+        self.prompt_version = hashlib.sha256(f"{model}\0{instructions}\0{schema}".encode("utf-8")).hexdigest()[:16]
+
+    def _invoke(self, content: str) -> BaseModel:
+        for attempt in range(JUDGE_MAX_RETRIES):
+            try:
+                with _judge_slots:
+                    return self.llm.invoke([
+                        {"role": "system", "content": self.instructions},
+                        {"role": "user", "content": content}
+                    ])
+            except RETRYABLE_ERRORS as e:
+                if attempt == JUDGE_MAX_RETRIES - 1:
+                    raise
+                delay = min(2 ** attempt, 60) + random.uniform(0, 1)
+                print(f"[{self.name}] retrying in {delay:.1f}s: {e}")
+                time.sleep(delay)
+
+    def grade(self, content: str) -> dict:
+        """
+        Grade one piece of judge input.
+
+        Args:
+            content (str): The user message for the judge.
+
+        Returns:
+            dict: {"key", "score", "explanation"}.
+        """
+        input_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        cached = grade_cache.get(self.name, self.prompt_version, input_hash)
+        if cached is not None:
+            return cached
+        grade = self._invoke(content)
+        result = {"key": self.name, "score": getattr(grade, self.score_field), "explanation": grade.explanation}
+        grade_cache.put(self.name, self.prompt_version, input_hash, result)
+        return result
+
 # ------------------------------------------------------------------------------
 # Correctness Evaluator
 # ------------------------------------------------------------------------------
@@ -44,20 +172,14 @@ Your task is to decide whether the STUDENT ANSWER is factually correct *relative
 Avoid judging style or completeness.
 """
 
-correctness_llm = ChatOpenAI(
-    model="gpt-4o", temperature=0
-).with_structured_output(CorrectnessGrade, method="json_schema", strict=True)
+correctness_judge = Judge("correctness", correctness_instructions, CorrectnessGrade, "correct")
 
 def correctness(inputs: dict, outputs: dict, reference_outputs: dict) -> dict:
     """Evaluate factual correctness against reference answer."""
     content = f"""QUESTION: {inputs['question']}
     GROUND TRUTH ANSWER: {reference_outputs['answer']}
     STUDENT ANSWER: {outputs['answer']}"""
-    grade = correctness_llm.invoke([
-        {"role": "system", "content": correctness_instructions},
-        {"role": "user", "content": content}
-    ])
-    return {"score": grade.correct, "explanation": grade.explanation}
+    return correctness_judge.grade(content)
 
 
 # ------------------------------------------------------------------------------
@@ -89,19 +211,13 @@ grounded = False → adds/contradicts
 Avoid judging style; reason strictly from FACTS.
 """
 
-grounded_llm = ChatOpenAI(
-    model="gpt-4o", temperature=0
-).with_structured_output(GroundedGrade, method="json_schema", strict=True)
+groundedness_judge = Judge("groundedness", grounded_instructions, GroundedGrade, "grounded")
 
 def groundedness(inputs: dict, outputs: dict) -> dict:
     """Evaluate if answer is grounded in retrieved documents."""
     doc_string = "\n\n".join(doc.page_content for doc in outputs["documents"])
     content = f"FACTS: {doc_string}\nSTUDENT ANSWER: {outputs['answer']}"
-    grade = grounded_llm.invoke([
-        {"role": "system", "content": grounded_instructions},
-        {"role": "user", "content": content}
-    ])
-    return {"score": grade.grounded, "explanation": grade.explanation}
+    return groundedness_judge.grade(content)
 
 
 # ------------------------------------------------------------------------------
@@ -131,18 +247,12 @@ relevant = False → off-topic
 Avoid judging style or factual correctness; reason strictly from content.
 """
 
-relevance_llm = ChatOpenAI(
-    model="gpt-4o", temperature=0
-).with_structured_output(RelevanceGrade, method="json_schema", strict=True)
+relevance_judge = Judge("relevance", relevance_instructions, RelevanceGrade, "relevant")
 
 def relevance(inputs: dict, outputs: dict) -> dict:
     """Evaluate if answer is relevant to question."""
     content = f"QUESTION: {inputs['question']}\nSTUDENT ANSWER: {outputs['answer']}"
-    grade = relevance_llm.invoke([
-        {"role": "system", "content": relevance_instructions},
-        {"role": "user", "content": content}
-    ])
-    return {"score": grade.relevant, "explanation": grade.explanation}
+    return relevance_judge.grade(content)
 
 
 # ------------------------------------------------------------------------------
@@ -174,16 +284,38 @@ relevant = False → fully unrelated
 Avoid judging correctness of answer itself.
 """
 
-retrieval_relevance_llm = ChatOpenAI(
-    model="gpt-4o", temperature=0
-).with_structured_output(RetrievalRelevanceGrade, method="json_schema", strict=True)
+retrieval_relevance_judge = Judge("retrieval_relevance", retrieval_relevance_instructions, RetrievalRelevanceGrade, "relevant")
 
 def retrieval_relevance(inputs: dict, outputs: dict) -> dict:
     """Evaluate if retrieved docs are relevant to question."""
     doc_string = "\n\n".join(doc.page_content for doc in outputs["documents"])
     content = f"FACTS: {doc_string}\nQUESTION: {inputs['question']}"
-    grade = retrieval_relevance_llm.invoke([
-        {"role": "system", "content": retrieval_relevance_instructions},
-        {"role": "user", "content": content}
-    ])
-    return {"score": grade.relevant, "explanation": grade.explanation}
+    return retrieval_relevance_judge.grade(content)
+
+
+# ------------------------------------------------------------------------------
+# All judges for one example, concurrently
+# ------------------------------------------------------------------------------
+
+# Fan-out threads only; the number of judge calls in flight is capped by JUDGE_CONCURRENCY
+_fanout = ThreadPoolExecutor(max_workers=32, thread_name_prefix="judge")
+
+def all_judges(inputs: dict, outputs: dict, reference_outputs: dict) -> dict:
+    """
+    Run the four judges on one example concurrently, returning one result per judge.
+    A judge that fails gets a result with score None, so the other grades are kept.
+    """
+    futures = [
+        (correctness_judge.name, _fanout.submit(correctness, inputs, outputs, reference_outputs)),
+        (groundedness_judge.name, _fanout.submit(groundedness, inputs, outputs)),
+        (relevance_judge.name, _fanout.submit(relevance, inputs, outputs)),
+        (retrieval_relevance_judge.name, _fanout.submit(retrieval_relevance, inputs, outputs)),
+    ]
+    results: List[dict] = []
+    for name, future in futures:
+        try:
+            results.append(future.result())
+        except Exception as e:
+            print(f"[{name}] judge failed:", e)
+            results.append({"key": name, "score": None, "comment": str(e)})
+    return {"results": results}
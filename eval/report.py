@@ -1,26 +1,109 @@
-import json
+import os
+import argparse
+from typing import List
+import numpy as np
 import pandas as pd
-import glob
-
-def load_latest_results():
-    files = sorted(glob.glob('eval/results/*.jsonl'))
-    if not files:
-        print("No results found.")
-        return None
-    latest = files[-1]
-    print(f"Loading {latest}")
-    with open(latest) as f:
-        return pd.DataFrame([json.loads(line) for line in f])
-
-df = load_latest_results()
-if df is not None:
-    print(df[['question', 'semantic_similarity', 'exact_match']])
-    print("\nAverage similarity:", df['semantic_similarity'].mean())
-    print("Exact match rate:", df['exact_match'].mean())
-
-    import matplotlib.pyplot as plt
-    df['semantic_similarity'].hist(bins=10)
-    plt.title("Semantic similarity distribution")
-    plt.xlabel("Similarity")
-    plt.ylabel("Count")
-    plt.show()
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+from eval.results_store import STORE_PATH, SCORE_PREFIX, list_runs, load_results
+
+
+def summarize(results: pd.DataFrame) -> pd.DataFrame:
+    """
+    Per-run example count, mean judge scores, latency percentiles and error count, oldest run first.
+    """
+    score_columns = [c for c in results.columns if c.startswith(SCORE_PREFIX)]
+    grouped = results.groupby("run_id", sort=True)
+    summary = grouped[score_columns].mean()
+    summary.columns = [c[len(SCORE_PREFIX):] for c in score_columns]
+    summary.insert(0, "examples", grouped.size())
+    summary.insert(1, "git_sha", grouped["git_sha"].first().str[:8])
+    summary["latency_p50"] = grouped["latency_s"].quantile(0.5)
+    summary["latency_p95"] = grouped["latency_s"].quantile(0.95)
+    summary["errors"] = grouped["error"].count()
+    return summary
+
+
+def run_label(run_id: str) -> str:
+    """
+    Short axis label for a run id, e.g. '20250713T124400-1a2b3c4d' -> '07-13 12:44 1a2b3c4d'.
+    Keeps both time and sha, since consecutive runs of one commit share the sha.
+    """
+    stamp, _, sha = run_id.partition("-")
+    if len(stamp) != 15 or stamp[8] != "T":
+        return run_id
+    return f"{stamp[4:6]}-{stamp[6:8]} {stamp[9:11]}:{stamp[11:13]} {sha}"
+
+
+def plot(summary: pd.DataFrame, results: pd.DataFrame, metrics: List[str], out_dir: str) -> List[str]:
+    """
+    Writes score trends and per-run latency distributions as PNG files.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    x = np.arange(len(summary))
+    labels = [run_label(run_id) for run_id in summary.index]
+    paths = []
+
+    fig, ax = plt.subplots(figsize=(max(8, len(summary) * 0.4), 5))
+    for metric in metrics:
+        ax.plot(x, summary[metric], marker="o", label=metric)
+    ax.set_xticks(x, labels, rotation=60, ha="right", fontsize=8)
+    ax.set_ylabel("Mean score")
+    ax.set_title("Judge scores by run")
+    ax.legend()
+    fig.tight_layout()
+    paths.append(os.path.join(out_dir, "scores.png"))
+    fig.savefig(paths[-1], dpi=120)
+    plt.close(fig)
+
+    latencies = [results.loc[results["run_id"] == run_id, "latency_s"].dropna() for run_id in summary.index]
+    fig, ax = plt.subplots(figsize=(max(8, len(summary) * 0.4), 5))
+    ax.boxplot(latencies, positions=x, showfliers=False)
+    ax.set_xticks(x, labels, rotation=60, ha="right", fontsize=8)
+    ax.set_ylabel("Seconds per example")
+    ax.set_title("Target latency by run")
+    fig.tight_layout()
+    paths.append(os.path.join(out_dir, "latency.png"))
+    fig.savefig(paths[-1], dpi=120)
+    plt.close(fig)
+    return paths
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare eval runs from the Parquet results store.")
+    parser.add_argument("--store", default=STORE_PATH)
+    parser.add_argument("--batch", default=None, help="Only runs of this batch_name")
+    parser.add_argument("--last", type=int, default=20, help="Compare the most recent N runs")
+    parser.add_argument("--runs", default=None, help="Comma-separated run ids (overrides --last)")
+    parser.add_argument("--out", default="eval/results/report", help="Directory for the plots")
+    args = parser.parse_args()
+
+    run_ids = args.runs.split(",") if args.runs else list_runs(args.store, args.batch)[-args.last:]
+    if not run_ids:
+        print(f"No runs found in {args.store}.")
+        return
+
+    # Answers and questions are never read; only run keys, scores and latency
+    results = load_results(["git_sha", "latency_s", "error", f"{SCORE_PREFIX}*"], run_ids, args.store)
+    if results.empty:
+        print("No results found for the selected runs.")
+        return
+
+    summary = summarize(results)
+    metrics = [c[len(SCORE_PREFIX):] for c in results.columns if c.startswith(SCORE_PREFIX)]
+    with pd.option_context("display.width", 200, "display.max_columns", None, "display.float_format", "{:.3f}".format):
+        print(summary)
+
+    if len(summary) >= 2:
+        previous, latest = summary.iloc[-2], summary.iloc[-1]
+        print(f"\n{summary.index[-1]} vs {summary.index[-2]}:")
+        for column in metrics + ["latency_p50", "latency_p95"]:
+            print(f"  {column:<20} {latest[column]:>8.3f} ({latest[column] - previous[column]:+.3f})")
+
+    for path in plot(summary, results, metrics, args.out):
+        print(f"Wrote {path}")
+
+
+if __name__ == "__main__":
+    main()
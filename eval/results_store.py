@@ -0,0 +1,131 @@
+import os
+import glob
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# Hive-partitioned Parquet: <store>/batch_name=<batch>/run_id=<run>/*.parquet, one directory per run
+STORE_PATH = os.getenv("EVAL_STORE_PATH", "eval/results/store")
+PARTITION_COLS = ["batch_name", "run_id"]
+SCORE_PREFIX = "score_"
+CONFIG_PREFIX = "config_"
+
+
+def new_run_id(git_sha: str) -> str:
+    """
+    Returns a run id that sorts by start time, e.g. '20250713T124400-1a2b3c4d'.
+    """
+    return f"{time.strftime('%Y%m%dT%H%M%S')}-{git_sha[:8]}"
+
+
+def result_rows(experiment_results: Iterable[Dict[str, Any]], run_id: str, batch_metadata: Dict[str, Any]) -> pd.DataFrame:
+    """
+    Flattens LangSmith experiment rows into one record per example.
+
+    Batch config fields are stored as strings in config_<field> columns, so runs with different
+    configs still share a schema; judge scores become score_<key> columns.
+
+    Args:
+        experiment_results (Iterable[Dict[str, Any]]): Rows from Client.evaluate, with 'run', 'example'
+            and 'evaluation_results' entries.
+        run_id (str): Id of this eval run.
+        batch_metadata (Dict[str, Any]): batch_config.yaml fields plus git_sha.
+
+    Returns:
+        pd.DataFrame: One row per example.
+    """
+    config = {f"{CONFIG_PREFIX}{key}": str(value) for key, value in batch_metadata.items() if key != "git_sha"}
+    records = []
+    for result in experiment_results:
+        run, example = result["run"], result["example"]
+        start, end = getattr(run, "start_time", None), getattr(run, "end_time", None)
+        record = {
+            "batch_name": str(batch_metadata.get("batch_name", "default")),
+            "run_id": run_id,
+            "git_sha": batch_metadata.get("git_sha", ""),
+            **config,
+            "example_id": str(example.id),
+            "question": (example.inputs or {}).get("question"),
+            "reference_answer": (example.outputs or {}).get("answer"),
+            "answer": (run.outputs or {}).get("answer"),
+            "latency_s": (end - start).total_seconds() if start and end else None,
+            "total_tokens": getattr(run, "total_tokens", None),
+            "error": run.error,
+        }
+        for evaluation in result["evaluation_results"]["results"]:
+            record[f"{SCORE_PREFIX}{evaluation.key}"] = evaluation.score
+        records.append(record)
+
+    # Fixed column types, so every run's files unify into one schema on read
+    frame = pd.DataFrame.from_records(records)
+    for column in frame.columns:
+        if column in ("latency_s", "total_tokens") or column.startswith(SCORE_PREFIX):
+            frame[column] = pd.to_numeric(frame[column], errors="coerce").astype("float64")
+        else:
+            frame[column] = frame[column].astype("string")
+    return frame
+
+
+def append_run(results: pd.DataFrame, path: str = STORE_PATH) -> None:
+    """
+    Writes one run's rows into the store, in a new batch_name=/run_id= partition.
+
+    Args:
+        results (pd.DataFrame): Rows from result_rows.
+        path (str): Store root directory.
+    """
+    table = pa.Table.from_pandas(results, preserve_index=False)
+    pq.write_to_dataset(table, root_path=path, partition_cols=PARTITION_COLS)
+
+
+def list_runs(path: str = STORE_PATH, batch_name: Optional[str] = None) -> List[str]:
+    """
+    Returns stored run ids, oldest first, from partition directory names alone (no files are opened).
+
+    Args:
+        path (str): Store root directory.
+        batch_name (Optional[str]): Only runs of this batch.
+
+    Returns:
+        List[str]: Run ids.
+    """
+    batch = "*" if batch_name is None else f"batch_name={batch_name}"
+    run_dirs = glob.glob(os.path.join(path, batch, "run_id=*"))
+    return sorted({os.path.basename(run_dir).split("=", 1)[1] for run_dir in run_dirs})
+
+
+def load_results(columns: Sequence[str], run_ids: Sequence[str], path: str = STORE_PATH) -> pd.DataFrame:
+    """
+    Reads selected columns of selected runs. Only the chosen runs' files are opened, and only
+    the requested column chunks are read from them.
+
+    Args:
+        columns (Sequence[str]): Columns to load; those absent from every selected run are skipped.
+            Score columns can be requested by prefix with 'score_*'.
+        run_ids (Sequence[str]): Runs to load.
+        path (str): Store root directory.
+
+    Returns:
+        pd.DataFrame: The requested columns, plus run_id.
+    """
+    files = [
+        file
+        for run_id in run_ids
+        for file in glob.glob(os.path.join(path, "*", f"run_id={run_id}", "*.parquet"))
+    ]
+    if not files:
+        return pd.DataFrame(columns=["run_id", *columns])
+
+    partitioning = ds.partitioning(pa.schema([("batch_name", pa.string()), ("run_id", pa.string())]), flavor="hive")
+    # Runs may differ in judges and config fields; unify their footers' schemas (missing columns read as null)
+    schema = pa.unify_schemas([pq.read_schema(file).remove_metadata() for file in files] + [partitioning.schema])
+    dataset = ds.dataset(files, schema=schema, format="parquet", partitioning=partitioning, partition_base_dir=path)
+
+    selected = []
+    for column in ["run_id", *columns]:
+        matches = [name for name in schema.names if name.startswith(column[:-1])] if column.endswith("*") else [column]
+        selected += [name for name in matches if name in schema.names and name not in selected]
+    return dataset.to_table(columns=selected).to_pandas()
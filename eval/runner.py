@@ -1,15 +1,19 @@
 import os
 import json
 from langsmith import Client
-from eval.evaluators import correctness, groundedness, relevance, retrieval_relevance
+from eval.evaluators import all_judges, grade_cache
 from eval.pipeline import load_target, load_batch_metadata
+from eval.results_store import STORE_PATH, append_run, new_run_id, result_rows
 
 DATASET_NAME = "art_of_war"
+# Examples processed at once; judge calls are further capped by JUDGE_CONCURRENCY
+MAX_CONCURRENCY = int(os.getenv("EVAL_MAX_CONCURRENCY", "8"))
 
 def main():
     langsmith_client = Client(api_key=os.getenv("LANGCHAIN_API_KEY"))
     target = load_target()
     batch_metadata = load_batch_metadata()
+    run_id = new_run_id(batch_metadata["git_sha"])
 
     existing = langsmith_client.list_datasets(dataset_name=DATASET_NAME)
     if existing:
@@ -26,18 +30,19 @@ def main():
     experiment_results = langsmith_client.evaluate(
         target,
         data=DATASET_NAME,
-        evaluators=[correctness, groundedness, relevance, retrieval_relevance],
+        evaluators=[all_judges],
         experiment_prefix=f"rag-{batch_metadata['version']}",
-        metadata=batch_metadata
+        metadata={**batch_metadata, "run_id": run_id},
+        max_concurrency=MAX_CONCURRENCY,
     )
 
-    output_file = 'eval/data/results.jsonl'
-    with open(output_file, 'w') as f:
-        for result in experiment_results:
-            json.dump(result, f)
-            f.write('\n')
+    # Each run becomes its own partition; earlier runs are kept for eval/report.py to compare
+    results = result_rows(experiment_results, run_id, batch_metadata)
+    append_run(results)
 
-    print(f"✅ Evaluation complete. Results saved to: {output_file}")
+    cache_stats = grade_cache.stats()
+    print(f"Grade cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses")
+    print(f"✅ Evaluation complete. {len(results)} results saved to {STORE_PATH} as run {run_id}")
 
 if __name__ == "__main__":
     main()
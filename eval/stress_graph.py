@@ -0,0 +1,104 @@
+import time
+import random
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple
+import numpy as np
+from src.neo4j.scripts.graph_retriever import GraphModel
+
+
+def sample_entities(model: GraphModel, n: int) -> List[Dict[str, str]]:
+    """
+    Pick entities that are linked to at least one chunk.
+    """
+    query = """
+        MATCH (e)-[:MENTIONED_IN]->(:CHUNK)
+        WHERE e.name IS NOT NULL
+        WITH DISTINCT e
+        RETURN e.name AS text, [l IN labels(e) WHERE l <> 'Entity'][0] AS label
+        LIMIT $limit
+    """
+    with model.driver.session() as session:
+        records = list(session.run(query, {"limit": n}))
+    return [{"text": r["text"], "label": r["label"]} for r in records if r["label"]]
+
+
+def build_questions(entities: List[Dict[str, str]], rng: random.Random) -> List[str]:
+    """
+    Questions naming one or two entities, plus "who"/"when" questions that also draw from the generic sample pools.
+    """
+    questions = [f"Tell me about {e['text']}." for e in entities]
+    questions += [f"Tell me about {a['text']} and {b['text']}." for a, b in (rng.sample(entities, 2) for _ in entities)]
+    questions += [f"Who was involved with {e['text']}?" for e in rng.sample(entities, len(entities) // 4)]
+    questions += [f"When did {e['text']} matter?" for e in rng.sample(entities, len(entities) // 4)]
+    return questions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Check GraphModel returns isolated results under concurrent load.")
+    parser.add_argument("--users", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=20, help="Requests per user")
+    parser.add_argument("--entities", type=int, default=100)
+    parser.add_argument("--method", choices=["run", "entity"], default="run",
+                        help="Drive the full GraphModel.run path (spaCy parse, entity query, generic pools) "
+                             "or execute_entity_query alone")
+    args = parser.parse_args()
+
+    model = GraphModel()
+    entities = sample_entities(model, args.entities)
+    if len(entities) < 2:
+        raise SystemExit("Need at least two entities in the graph to run the stress test")
+
+    rng = random.Random(0)
+    if args.method == "run":
+        questions = build_questions(entities, rng)
+        call: Callable[[int], List[str]] = lambda i: model.run(questions[i])
+        parsed = [model.spacy_helper.parse_user_query_for_entities(q) for q in questions]
+        workloads = [named for named, _ in parsed]
+        pooled = [
+            {chunk for label in model.generic_labels(generics) for chunk in model.generic_pool.pools.get(label, [])}
+            for _, generics in parsed
+        ]
+    else:
+        workloads = [[e] for e in entities] + [rng.sample(entities, 2) for _ in entities]
+        call = lambda i: model.execute_entity_query(workloads[i])
+        pooled = [set() for _ in workloads]
+
+    # Expected entity results come from a sequential pass. run() adds random samples from the
+    # generic pools and truncates to MAX_CHUNKS, so where either applies every returned chunk must
+    # come from the entity results or the pools; otherwise results must match exactly.
+    expected = [sorted(model.execute_entity_query(entities_i)) for entities_i in workloads]
+
+    def check(i: int, result: List[str]) -> bool:
+        if not pooled[i] and len(expected[i]) <= model.MAX_CHUNKS:
+            return sorted(result) == expected[i]
+        return set(result) <= set(expected[i]) | pooled[i]
+
+    def user(user_id: int) -> Tuple[int, List[float]]:
+        user_rng = random.Random(user_id)
+        errors, latencies = 0, []
+        for _ in range(args.requests):
+            i = user_rng.randrange(len(workloads))
+            start = time.perf_counter()
+            result = call(i)
+            latencies.append((time.perf_counter() - start) * 1000)
+            errors += not check(i, result)
+        return errors, latencies
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.users) as pool:
+        outcomes = list(pool.map(user, range(args.users)))
+    elapsed = time.perf_counter() - start
+
+    mismatches = sum(errors for errors, _ in outcomes)
+    latencies = np.concatenate([lat for _, lat in outcomes])
+    total = args.users * args.requests
+    print(f"{args.method}: {args.users} users x {args.requests} requests: {total / elapsed:.1f} req/s")
+    print(f"p50 {np.percentile(latencies, 50):.1f} ms, p99 {np.percentile(latencies, 99):.1f} ms")
+    print(f"Mismatched results: {mismatches}/{total}")
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,40 @@
-from fastapi import FastAPI
+import os
+import logging
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
 import gradio as gr
-from src.query import QueryMachine
+from src.async_query import AsyncQueryMachine
+from src.metrics import CONTENT_TYPE, registry
+from src.profiling import profile_requested
 
-app = FastAPI()
+# One line per answered question with its stage breakdown (JSON), plus warnings
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(asctime)s %(levelname)s %(name)s %(message)s")
 
-query_machine = QueryMachine()
+# Async throughout: a streaming conversation waits on the event loop, not on a worker thread
+query_machine = AsyncQueryMachine()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    await query_machine.close()
+
+app = FastAPI(lifespan=lifespan)
+
+class Question(BaseModel):
+    question: str
+
+@app.post("/answer/stream")
+async def stream_answer(payload: Question, request: Request):
+    # Plain-text stream of answer deltas for clients that append text themselves
+    deltas = query_machine.stream_answer_deltas(payload.question, profile=profile_requested(request.headers))
+    return StreamingResponse(deltas, media_type="text/plain")
+
+@app.get("/metrics")
+def metrics():
+    # Prometheus scrape target: stage latency histograms, token and error counters, cache and pool gauges
+    return PlainTextResponse(registry.render(), media_type=CONTENT_TYPE)
 
 def create_gradio_interface():
     with gr.Blocks() as demo:
@@ -15,7 +45,13 @@ def create_gradio_interface():
         def reset():
             return [], ""
 
-        msg.submit(query_machine.enter_query, [msg, chatbot], [chatbot], queue=True)
+        async def answer(message, history, request: gr.Request):
+            # Gradio passes the HTTP request, so a profiling header works for the chat UI too
+            headers = request.headers if request else None
+            async for updated_history in query_machine.enter_query(message, history, profile=profile_requested(headers)):
+                yield updated_history
+
+        msg.submit(answer, [msg, chatbot], [chatbot], queue=True)
         clear.click(reset, outputs=[chatbot, msg])
     return demo
 
@@ -0,0 +1,330 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from functools import partial
+from typing import Any, Callable, Dict, Generator, List, Optional
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEFAULT_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", "assets/answer_cache.sqlite")
+UNKNOWN_CORPUS_VERSION = "unknown"
+# Seconds between attempts to determine the corpus version while it is unknown
+VERSION_RETRY_SECONDS = float(os.getenv("ANSWER_CACHE_VERSION_RETRY", "60"))
+# Seconds between checks that a known corpus version is still current (a re-ingest changes it)
+VERSION_CHECK_SECONDS = float(os.getenv("ANSWER_CACHE_VERSION_CHECK", "30"))
+
+
+def corpus_version(retriever: Optional[Any] = None) -> str:
+    """
+    Identify the indexed corpus, so answers built from an older corpus are never replayed.
+
+    Uses ANSWER_CACHE_CORPUS_VERSION when set, then the retriever's own corpus_version()
+    (e.g. the NumPy snapshot actually being served), otherwise a digest of the content_hash
+    of every embedded chunk in PostgreSQL.
+
+    Args:
+        retriever (Optional[Any]): The vector retriever answers are built from.
+
+    Returns:
+        str: Corpus version, or "unknown" if it could not be determined.
+    """
+    version = os.getenv("ANSWER_CACHE_CORPUS_VERSION")
+    if version:
+        return version
+    if hasattr(retriever, "corpus_version"):
+        return retriever.corpus_version()
+    try:
+        from src.db_pool import db_pool
+
+        with db_pool.connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                SELECT md5(coalesce(string_agg(content_hash, ',' ORDER BY content_hash), ''))
+                FROM art_of_war_book_english
+                WHERE embedding IS NOT NULL;
+            """)
+            return cur.fetchone()[0]
+    except Exception as e:
+        print("Could not determine corpus version for the answer cache:", e)
+        return UNKNOWN_CORPUS_VERSION
+
+
+def prompt_key(prompt_template: str, model: str) -> str:
+    """
+    Hash the prompt template and chat model an answer was generated with.
+    """
+    return hashlib.sha256(f"{model}\0{prompt_template}".encode("utf-8")).hexdigest()
+
+
+class SemanticAnswerCache:
+    """
+    Cache of generated answers keyed by question embedding.
+
+    A question whose embedding has cosine similarity of at least `threshold` with a cached
+    question is answered from the cache. Entries are only visible to lookups with the same
+    corpus version and prompt key, expire after ttl_seconds, and the least recently used
+    are evicted beyond max_entries. Entries persist in SQLite; the embeddings of live
+    entries are also held in memory as a normalized matrix, so a lookup is one matrix-vector product.
+
+    The corpus version is resolved again every version_check_seconds, so after a re-ingest
+    lookups and stores move to the new version's entries. While it is unknown (e.g. the
+    database is down) nothing is looked up or stored, and it is retried every VERSION_RETRY_SECONDS.
+
+    Attributes:
+        path (str): SQLite database file.
+        threshold (float): Minimum cosine similarity for a hit.
+        ttl_seconds (float): Age after which an entry is no longer served.
+        max_entries (int): Entries kept before least recently used ones are evicted.
+        version_check_seconds (float): Interval between re-resolving the corpus version.
+        corpus_version (str): Corpus version entries are stored under and looked up with.
+        prompt_key (str): Prompt template + model hash entries are stored under and looked up with.
+    """
+
+    def __init__(
+        self,
+        prompt_key: str,
+        corpus_version: str,
+        path: str = DEFAULT_CACHE_PATH,
+        threshold: float = 0.95,
+        ttl_seconds: float = 7 * 24 * 3600,
+        max_entries: int = 5000,
+        version_source: Callable[[], str] = corpus_version,
+        version_check_seconds: float = VERSION_CHECK_SECONDS,
+    ) -> None:
+        """
+        Open (or create) the cache and load the live entries for this corpus version and prompt.
+
+        Args:
+            prompt_key (str): Hash of the prompt template and model, see prompt_key().
+            corpus_version (str): Corpus version, see corpus_version().
+            path (str): SQLite database file.
+            threshold (float): Minimum cosine similarity for a hit.
+            ttl_seconds (float): Age after which an entry is no longer served.
+            max_entries (int): Entries kept before least recently used ones are evicted.
+            version_source (Callable[[], str]): Resolves the current corpus version.
+            version_check_seconds (float): Interval between re-resolving the corpus version.
+        """
+        self.path = path
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.corpus_version = corpus_version
+        self.prompt_key = prompt_key
+        self.version_source = version_source
+        self.version_check_seconds = version_check_seconds
+        self._version_checked_at = time.monotonic()
+
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS answers (
+                id INTEGER PRIMARY KEY,
+                corpus_version TEXT NOT NULL,
+                prompt_key TEXT NOT NULL,
+                question TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                answer TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS answers_scope ON answers (corpus_version, prompt_key)")
+        self._db.commit()
+
+        self._ids: List[int] = []
+        self._created: List[float] = []
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._load()
+
+    @classmethod
+    def from_env(cls, prompt_template: str, model: str, retriever: Optional[Any] = None) -> "SemanticAnswerCache":
+        """
+        Build a cache for a prompt template and model from environment variables
+        (ANSWER_CACHE_PATH, ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_TTL, ANSWER_CACHE_MAX_ENTRIES).
+        The corpus version is taken from the retriever serving the answers, see corpus_version().
+        """
+        version_source = partial(corpus_version, retriever)
+        return cls(
+            prompt_key=prompt_key(prompt_template, model),
+            corpus_version=version_source(),
+            path=DEFAULT_CACHE_PATH,
+            threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95")),
+            ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL", str(7 * 24 * 3600))),
+            max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "5000")),
+            version_source=version_source,
+        )
+
+    def _load(self) -> None:
+        """
+        Drop expired entries and load the embeddings of this scope's live entries.
+        """
+        cutoff = time.time() - self.ttl_seconds
+        self._db.execute("DELETE FROM answers WHERE created_at < ?", (cutoff,))
+        self._db.commit()
+        rows = self._db.execute(
+            "SELECT id, embedding, created_at FROM answers WHERE corpus_version = ? AND prompt_key = ? ORDER BY id",
+            (self.corpus_version, self.prompt_key),
+        ).fetchall()
+        self._ids = [row[0] for row in rows]
+        self._created = [row[2] for row in rows]
+        if rows:
+            self._matrix = np.stack([np.frombuffer(row[1], dtype=np.float32) for row in rows])
+        else:
+            self._matrix = np.zeros((0, 0), dtype=np.float32)
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def _remove(self, positions: List[int]) -> None:
+        """
+        Delete entries by their row position in the in-memory matrix. Caller holds the lock.
+        """
+        if not positions:
+            return
+        ids = [self._ids[p] for p in positions]
+        self._db.executemany("DELETE FROM answers WHERE id = ?", [(i,) for i in ids])
+        self._db.commit()
+        keep = np.setdiff1d(np.arange(len(self._ids)), positions)
+        self._matrix = self._matrix[keep]
+        self._ids = [self._ids[p] for p in keep]
+        self._created = [self._created[p] for p in keep]
+        self.evictions += len(positions)
+
+    def _version_known(self) -> bool:
+        """
+        Whether the corpus version is known. It is resolved again at most every
+        version_check_seconds (VERSION_RETRY_SECONDS while unknown); when it changed,
+        the entries of the new version are loaded in place of the old ones.
+        """
+        now = time.monotonic()
+        with self._lock:
+            known = self.corpus_version != UNKNOWN_CORPUS_VERSION
+            interval = self.version_check_seconds if known else VERSION_RETRY_SECONDS
+            if now - self._version_checked_at < interval:
+                return known
+            self._version_checked_at = now
+        version = self.version_source()
+        with self._lock:
+            if version != self.corpus_version:
+                self.corpus_version = version
+                self._load()
+        return version != UNKNOWN_CORPUS_VERSION
+
+    def lookup(self, embedding: List[float]) -> Optional[str]:
+        """
+        Find the cached answer to the most similar previous question, if similar enough.
+
+        Args:
+            embedding (List[float]): Embedding of the new question.
+
+        Returns:
+            Optional[str]: The cached answer, or None on a miss.
+        """
+        if not self._version_known():
+            with self._lock:
+                self.misses += 1
+            return None
+        query = self._normalize(embedding)
+        with self._lock:
+            # Expire stale entries first, so one cannot shadow a fresh match just below it
+            now = time.time()
+            self._remove([p for p, created in enumerate(self._created) if now - created >= self.ttl_seconds])
+            if self._ids and self._matrix.shape[1] == query.shape[0]:
+                scores = self._matrix @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    row = self._db.execute("SELECT answer FROM answers WHERE id = ?", (self._ids[best],)).fetchone()
+                    if row is not None:
+                        self._db.execute("UPDATE answers SET last_used = ? WHERE id = ?", (now, self._ids[best]))
+                        self._db.commit()
+                        self.hits += 1
+                        return row[0]
+            self.misses += 1
+            return None
+
+    def store(self, question: str, embedding: List[float], answer: str) -> None:
+        """
+        Cache a completed answer, evicting expired and then least recently used entries.
+
+        Args:
+            question (str): The question answered.
+            embedding (List[float]): Embedding of the question.
+            answer (str): The full generated answer.
+        """
+        # An answer stored under "unknown" could be replayed after the corpus changes
+        if not self._version_known():
+            return
+        vector = self._normalize(embedding)
+        now = time.time()
+        with self._lock:
+            cursor = self._db.execute(
+                """
+                INSERT INTO answers (corpus_version, prompt_key, question, embedding, answer, created_at, last_used)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (self.corpus_version, self.prompt_key, question, vector.tobytes(), answer, now, now),
+            )
+            self._db.commit()
+            if self._ids and self._matrix.shape[1] != vector.shape[0]:
+                # Embedding model changed: entries of the old dimension can never match again
+                self._remove(list(range(len(self._ids))))
+            self._matrix = np.vstack([self._matrix, vector]) if self._ids else vector[None, :]
+            self._ids.append(cursor.lastrowid)
+            self._created.append(now)
+            self.stores += 1
+
+            expired = [p for p, created in enumerate(self._created) if now - created >= self.ttl_seconds]
+            self._remove(expired)
+            overflow = len(self._ids) - self.max_entries
+            if overflow > 0:
+                oldest = self._db.execute(
+                    """
+                    SELECT id FROM answers WHERE corpus_version = ? AND prompt_key = ?
+                    ORDER BY last_used LIMIT ?
+                    """,
+                    (self.corpus_version, self.prompt_key, overflow),
+                ).fetchall()
+                position = {entry_id: p for p, entry_id in enumerate(self._ids)}
+                self._remove([position[row[0]] for row in oldest])
+
+    @staticmethod
+    def replay(answer: str, chunk_chars: int = 64) -> Generator[str, None, None]:
+        """
+        Stream a cached answer back in pieces, like a live completion.
+
+        Args:
+            answer (str): The cached answer.
+            chunk_chars (int): Characters per piece.
+
+        Yields:
+            str: Consecutive pieces of the answer.
+        """
+        for start in range(0, len(answer), chunk_chars):
+            yield answer[start:start + chunk_chars]
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Return hit/miss counters, hit rate and occupancy.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "entries": len(self._ids),
+            }
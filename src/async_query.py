@@ -0,0 +1,335 @@
+import os
+import time
+import asyncio
+import inspect
+import logging
+from typing import Any, AsyncGenerator, AsyncIterable, Awaitable, Dict, List, Optional, Tuple, Union
+
+from dotenv import load_dotenv
+from openai import AsyncOpenAI
+
+from src.query import QueryMachine, TokenCoalescer
+from src.vector_retriever import get_async_retriever
+from src.embedding_cache import EmbeddingCache, get_embedding_cache
+from src.spacy_helper import get_spacy_helper
+from src.context_builder import DEFAULT_TOKEN_BUDGET
+from src.neo4j.scripts.graph_retriever import AsyncGraphModel
+from src.metrics import RequestTrace, record_error, record_stage, span
+from src.profiling import RequestProfiler
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncQueryMachine(QueryMachine):
+    """
+    Asyncio variant of QueryMachine, built on AsyncOpenAI, Neo4j's async driver and asyncpg.
+
+    Every I/O wait is an await on the event loop, so a request streaming an answer holds
+    no thread and one process can serve many concurrent conversations. enter_query is an
+    async generator that Gradio and FastAPI's StreamingResponse consume directly.
+    """
+
+    def __init__(
+        self,
+        model: str = 'gpt-4.1',
+        graph_timeout: float = 5.0,
+        vector_timeout: float = 5.0,
+        flush_interval: float = 0.05,
+        flush_chars: int = 512,
+        embedding_model: str = 'text-embedding-3-small',
+        use_answer_cache: bool = True,
+        context_token_budget: int = DEFAULT_TOKEN_BUDGET,
+    ) -> None:
+        """
+        Initializes all required components and clients.
+
+        Args:
+            model (str): OpenAI model to use for completions.
+            graph_timeout (float): Seconds to wait for the Neo4j branch before answering without it.
+            vector_timeout (float): Seconds to wait for the embedding + pgvector branch before answering without it.
+            flush_interval (float): Seconds to coalesce streamed tokens before sending an update.
+            flush_chars (int): Buffered characters that force an update before flush_interval elapses.
+            embedding_model (str): OpenAI model used to embed questions.
+            use_answer_cache (bool): Replay stored answers to near-duplicate questions instead of generating them.
+            context_token_budget (int): Maximum tokens of retrieved context in the prompt.
+        """
+        self.embedding_model = embedding_model
+        super().__init__(
+            model=model,
+            graph_timeout=graph_timeout,
+            vector_timeout=vector_timeout,
+            flush_interval=flush_interval,
+            flush_chars=flush_chars,
+            use_answer_cache=use_answer_cache,
+            context_token_budget=context_token_budget,
+        )
+
+    def _create_clients(self) -> None:
+        self.db_search = get_async_retriever()
+        self.spacy_helper = get_spacy_helper()
+        self.embedding_cache: EmbeddingCache = get_embedding_cache(self.embedding_model)
+        self.graph_db_retriever = AsyncGraphModel()
+        self.openai_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+    def query_embedding_cache(self) -> Optional[EmbeddingCache]:
+        return self.embedding_cache
+
+    async def embed_query(self, query: str) -> Optional[List[float]]:
+        """
+        Embeds a question, using the shared embedding cache when possible.
+
+        Args:
+            query (str): The user question.
+
+        Returns:
+            Optional[List[float]]: The embedding vector, or None if an error occurred.
+        """
+        with span("embed"):
+            cached = self.embedding_cache.get(query)
+            if cached is not None:
+                return cached
+            try:
+                response = await self.openai_client.embeddings.create(model=self.embedding_model, input=query)
+                embedding = response.data[0].embedding
+                # put may flush the cache index to disk; lookups above are in-memory or mmap reads
+                await asyncio.to_thread(self.embedding_cache.put, query, embedding)
+                return embedding
+            except Exception as e:
+                record_error("embed")
+                logger.warning("Error generating embedding: %s", e)
+                return None
+
+    async def vector_search(self, query: str, limit: int = 6) -> Optional[List[Dict[str, Any]]]:
+        """
+        Embeds the query and retrieves the most similar chunks from the vector database.
+
+        Args:
+            query (str): The user question.
+            limit (int): Maximum number of chunks to return.
+
+        Returns:
+            Optional[List[Dict[str, Any]]]: Matching rows, or None if either step failed.
+        """
+        query_embedding = await self.embed_query(query)
+        if query_embedding is None:
+            return None
+        with span("pgvector"):
+            if inspect.iscoroutinefunction(self.db_search.find_similar):
+                return await self.db_search.find_similar(query_embedding, limit=limit)
+            # The numpy backend searches synchronously; its matrix product runs off the event loop
+            return await asyncio.to_thread(self.db_search.find_similar, query_embedding, limit=limit)
+
+    async def _result_within(self, branch_result: Awaitable[Any], timeout: float, branch: str) -> Optional[Any]:
+        """
+        Awaits a retrieval branch for at most timeout seconds, returning None if it timed out or failed.
+        """
+        try:
+            return await asyncio.wait_for(branch_result, timeout=timeout)
+        except asyncio.TimeoutError:
+            self._branch_failed(branch)
+        except Exception as e:
+            self._branch_failed(branch, e)
+        return None
+
+    async def retrieve_context(self, query: str) -> Tuple[List[str], List[Dict[str, Any]], bool]:
+        """
+        Runs graph retrieval and embedding + vector retrieval concurrently, each with its own timeout.
+        A branch that is slow or fails contributes nothing rather than blocking the answer.
+
+        Args:
+            query (str): The user question.
+
+        Returns:
+            Tuple[List[str], List[Dict[str, Any]], bool]: Graph chunks, vector rows, and whether
+            both branches answered in time.
+        """
+        graph_db_chunks, vector_context = await asyncio.gather(
+            self._result_within(self.graph_db_retriever.run(query), self.graph_timeout, "graph"),
+            self._result_within(self.vector_search(query), self.vector_timeout, "vector"),
+        )
+        return self._retrieved(graph_db_chunks, vector_context)
+
+    async def build_context(self, query: str) -> Tuple[str, bool]:
+        """
+        Retrieves graph and vector context for a question and assembles it into a
+        deduplicated, token-budgeted context block.
+
+        Args:
+            query (str): The user question.
+
+        Returns:
+            Tuple[str, bool]: Rendered context passed to the prompt, and whether it is complete:
+            both branches answered and something was retrieved.
+        """
+        with span("retrieval"):
+            graph_db_chunks, vector_context, complete = await self.retrieve_context(query)
+        return self._assemble_context(graph_db_chunks, vector_context, complete)
+
+    async def get_answer_stream(
+        self,
+        question: str,
+        context: Union[str, List[dict]],
+        trace: Optional[RequestTrace] = None,
+    ) -> AsyncGenerator[str, None]:
+        """
+        Streams the response from the OpenAI chat completion API.
+
+        Args:
+            question (str): The user question.
+            context (Union[str, List[dict]]): Retrieved context relevant to the question.
+            trace (Optional[RequestTrace]): Request trace receiving the LLM timings and token usage.
+
+        Yields:
+            str: Partial tokens from the streamed response.
+        """
+        start = time.perf_counter()
+        first_token = True
+        try:
+            response_stream = await self.openai_client.chat.completions.create(
+                **self._completion_request(question, context)
+            )
+
+            async for event in response_stream:
+                text = self._event_text(event, trace)
+                if text:
+                    if first_token:
+                        record_stage("llm_first_token", time.perf_counter() - start, trace)
+                        first_token = False
+                    yield text
+
+        except Exception as e:
+            yield self._stream_error(e, trace)
+
+        finally:
+            record_stage("llm_stream", time.perf_counter() - start, trace)
+
+    async def coalesce_tokens(self, tokens: AsyncIterable[str]) -> AsyncGenerator[str, None]:
+        """
+        Groups streamed tokens into larger deltas, flushing once flush_interval has passed
+        since the last flush or flush_chars characters are buffered, and at the end of the stream.
+
+        Args:
+            tokens (AsyncIterable[str]): Token stream, e.g. from get_answer_stream.
+
+        Yields:
+            str: Concatenated deltas.
+        """
+        coalescer = TokenCoalescer(self.flush_interval, self.flush_chars)
+        async for token in tokens:
+            delta = coalescer.add(token)
+            if delta:
+                yield delta
+        delta = coalescer.flush()
+        if delta:
+            yield delta
+
+    async def answer_tokens(self, question: str) -> AsyncGenerator[str, None]:
+        """
+        Streams the answer to a question, replaying a cached answer when a near-duplicate
+        question was answered before, and otherwise retrieving context and generating one.
+        Completed answers are added to the cache; failed or abandoned streams, and answers
+        given while a retrieval branch was missing, are not.
+        Stages are timed and logged as in QueryMachine.answer_tokens.
+
+        Args:
+            question (str): The user question.
+
+        Yields:
+            str: Partial tokens of the answer.
+        """
+        trace = RequestTrace()
+        outcome = "abandoned"
+        try:
+            embedding = None
+            if self.answer_cache:
+                with trace.active():
+                    embedding = await self.embed_query(question)
+                    with span("answer_cache"):
+                        # SQLite reads and commits run off the event loop
+                        cached = await asyncio.to_thread(self.answer_cache.lookup, embedding) if embedding is not None else None
+                self._record_cache_lookup(trace, cached)
+                if cached is not None:
+                    for piece in self.answer_cache.replay(cached):
+                        trace.first_token()
+                        yield piece
+                    outcome = "cached"
+                    return
+
+            # Tasks started by gather inherit the active trace
+            with trace.active():
+                context, complete = await self.build_context(question)
+
+            answer_parts: List[str] = []
+            async for token in self.get_answer_stream(question, context, trace):
+                trace.first_token()
+                answer_parts.append(token)
+                yield token
+
+            outcome, store = self._answer_outcome(answer_parts, embedding, complete)
+            if store:
+                await asyncio.to_thread(self.answer_cache.store, question, embedding, "".join(answer_parts))
+        finally:
+            trace.finish(outcome)
+
+    async def stream_answer_deltas(self, question: str, profile: Optional[bool] = None) -> AsyncGenerator[str, None]:
+        """
+        Answers a question as a stream of coalesced text deltas.
+
+        Args:
+            question (str): The user question.
+            profile (Optional[bool]): Force (True) or skip (False) profiling this request;
+                None profiles it with probability PROFILE_SAMPLE_RATE.
+
+        Yields:
+            str: Answer text deltas.
+        """
+        deltas = self.coalesce_tokens(self.answer_tokens(question))
+        profiler = RequestProfiler.for_request(profile, name="enter_query")
+        async for delta in profiler.profile_async_iterator(deltas) if profiler else deltas:
+            yield delta
+
+    async def enter_query(
+        self,
+        website_input: Optional[str] = None,
+        history: Optional[List[dict]] = None,
+        profile: Optional[bool] = None,
+    ) -> AsyncGenerator[List[dict], None]:
+        """
+        Orchestrates the full query process: answer cache lookup, context retrieval and response streaming.
+        Unlike QueryMachine.enter_query there is no CLI prompt; an empty input yields nothing.
+
+        Args:
+            website_input (Optional[str]): User input from the website.
+            history (Optional[List[dict]]): Previous messages for multi-turn dialogue.
+            profile (Optional[bool]): Force (True) or skip (False) profiling this request;
+                None profiles it with probability PROFILE_SAMPLE_RATE.
+
+        Yields:
+            List[dict]: Chat history updated with streaming assistant content.
+        """
+        try:
+            query = website_input or ""
+            if not query:
+                return
+
+            answer_parts: List[str] = []
+            updated_history = self._history_with_question(history, query)
+
+            async for delta in self.stream_answer_deltas(query, profile):
+                answer_parts.append(delta)
+                yield self._history_with_answer(updated_history, answer_parts)
+
+        except Exception as e:
+            record_error("query")
+            logger.error("Error while prompting %s: %s", self.MODEL, e)
+
+    async def close(self) -> None:
+        """
+        Close the database pool, graph drivers and OpenAI client.
+        """
+        if hasattr(self.db_search, "close"):
+            await self.db_search.close()
+        await self.graph_db_retriever.close()
+        await self.openai_client.close()
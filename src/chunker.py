@@ -1,13 +1,47 @@
 import os
 import re
 import json
-from typing import List, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional
 from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
 from langchain_experimental.text_splitter import SemanticChunker
 from langchain_openai.embeddings import OpenAIEmbeddings
+from src.embedding_cache import get_embedding_cache
 
 load_dotenv()
 
+
+class CachedEmbeddings(Embeddings):
+    """
+    LangChain embeddings backed by the shared on-disk embedding cache.
+
+    SemanticChunker embeds the same sentence groups every time a text is chunked, whatever
+    the breakpoint settings, so after the first run re-chunking makes no API calls.
+    Misses from one embed_documents call are sent to the wrapped model in a single request.
+    """
+
+    def __init__(self, embeddings: OpenAIEmbeddings) -> None:
+        """
+        Args:
+            embeddings (OpenAIEmbeddings): Model used for cache misses; its model name selects the cache.
+        """
+        self.embeddings = embeddings
+        self.cache = get_embedding_cache(embeddings.model)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        results: List[Optional[List[float]]] = [self.cache.get(text) for text in texts]
+        missing = [i for i, vector in enumerate(results) if vector is None]
+        if missing:
+            vectors = self.embeddings.embed_documents([texts[i] for i in missing])
+            for i, vector in zip(missing, vectors):
+                self.cache.put(texts[i], vector)
+                results[i] = vector
+        return results
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
 class Chunker:
     """
     A class to process and semantically chunk a book into smaller parts.
@@ -17,6 +51,7 @@ class Chunker:
         breakpoint_threshold_type (str): The threshold type for chunking (e.g. "percentile").
         breakpoint_threshold_amount (float): The numerical threshold used in chunking.
         min_chunk_size (int): Minimum character length for a chunk.
+        max_workers (int): Chapters chunked concurrently.
     """
 
     def __init__(
@@ -25,6 +60,7 @@ class Chunker:
         breakpoint_threshold_type: str = "percentile",
         breakpoint_threshold_amount: float = 50.0,
         min_chunk_size: int = 200,
+        max_workers: int = 8,
     ):
         """
         Initialize the Chunker with book text and chunking parameters.
@@ -34,11 +70,13 @@ class Chunker:
             breakpoint_threshold_type (str): Method used to determine chunk breakpoints.
             breakpoint_threshold_amount (float): Amount used in threshold calculation.
             min_chunk_size (int): Minimum length of each chunk in characters.
+            max_workers (int): Chapters chunked concurrently, bounding parallel embedding requests.
         """
         self.raw_book = book
         self.breakpoint_threshold_type = breakpoint_threshold_type
         self.breakpoint_threshold_amount = breakpoint_threshold_amount
         self.min_chunk_size = min_chunk_size
+        self.max_workers = max_workers
 
     def clean_book_file(self) -> str:
         """
@@ -81,9 +119,40 @@ class Chunker:
             })
         return chapters
 
+    def text_splitter(self) -> SemanticChunker:
+        """
+        Build a SemanticChunker with this chunker's breakpoint settings and cached embeddings.
+        It holds no per-document state, so one instance can chunk chapters concurrently.
+        """
+        return SemanticChunker(
+            CachedEmbeddings(OpenAIEmbeddings(api_key=os.getenv('OPENAI_API_KEY'))),
+            breakpoint_threshold_type=self.breakpoint_threshold_type,
+            breakpoint_threshold_amount=self.breakpoint_threshold_amount,
+            min_chunk_size=self.min_chunk_size,
+        )
+
+    @staticmethod
+    def chunk_chapter(chapter: Dict[str, str], text_splitter: SemanticChunker) -> List[Dict[str, str]]:
+        """
+        Semantically chunk one chapter.
+
+        Args:
+            chapter (Dict[str, str]): Chapter dictionary with 'chapter' and 'content' keys.
+            text_splitter (SemanticChunker): Splitter from text_splitter().
+
+        Returns:
+            List[Dict[str, str]]: List of chunk dictionaries with 'chapter' and 'content' keys.
+        """
+        return [
+            {'chapter': chapter['chapter'], 'content': doc.page_content}
+            for doc in text_splitter.create_documents([chapter['content']])
+        ]
+
     def semantic_chunk(self, chapters: List[Dict[str, str]]) -> List[Dict[str, str]]:
         """
         Perform semantic chunking on chapter content using OpenAI embeddings.
+        Chapters are chunked concurrently, and sentence embeddings come from the
+        embedding cache when they have been computed before.
 
         Args:
             chapters (List[Dict[str, str]]): List of chapter dictionaries.
@@ -91,21 +160,11 @@ class Chunker:
         Returns:
             List[Dict[str, str]]: List of chunk dictionaries with 'chapter' and 'content' keys.
         """
-        text_splitter = SemanticChunker(
-            OpenAIEmbeddings(api_key=os.getenv('OPENAI_API_KEY')),
-            breakpoint_threshold_type=self.breakpoint_threshold_type,
-            breakpoint_threshold_amount=self.breakpoint_threshold_amount,
-            min_chunk_size=self.min_chunk_size,
-        )
+        text_splitter = self.text_splitter()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            chunks_by_chapter = list(executor.map(lambda chapter: self.chunk_chapter(chapter, text_splitter), chapters))
 
-        chunks = []
-        for chapter in chapters:
-            docs = text_splitter.create_documents([chapter['content']])
-            for doc in docs:
-                chunks.append({
-                    'chapter': chapter['chapter'],
-                    'content': doc.page_content
-                })
+        chunks = [chunk for chapter_chunks in chunks_by_chapter for chunk in chapter_chunks]
 
         print('**************** Chunk data ****************')
         print(f"\nNumber of chunks: {len(chunks)}")
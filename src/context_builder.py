@@ -0,0 +1,162 @@
+import os
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+from dotenv import load_dotenv
+from src.embedding_cache import normalize_text, text_digest
+from src.embeddings_generator import count_tokens
+
+load_dotenv()
+
+DEFAULT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))
+
+
+def load_chapters(rows: Optional[Iterable[Dict[str, Any]]] = None) -> Dict[bytes, str]:
+    """
+    Map each stored chunk's normalized text to its chapter, so graph results (bare chunk
+    contents) can be labelled with their chapter like vector rows.
+
+    Args:
+        rows (Optional[Iterable[Dict[str, Any]]]): Rows with 'chunk' and 'chapter' keys, e.g.
+            NumpyRetriever.rows; read from PostgreSQL when None.
+
+    Returns:
+        Dict[bytes, str]: Chapter by text digest; empty if the chunks could not be read.
+    """
+    if rows is None:
+        try:
+            from src.db_pool import db_pool
+
+            with db_pool.connection() as conn, conn.cursor() as cur:
+                cur.execute("SELECT chunk, chapter FROM art_of_war_book_english;")
+                rows = [{"chunk": chunk, "chapter": chapter} for chunk, chapter in cur.fetchall()]
+        except Exception as e:
+            print("Could not load chunk chapters for graph results:", e)
+            return {}
+    return {
+        text_digest(normalize_text(row["chunk"])): row["chapter"]
+        for row in rows
+        if row.get("chunk") and row.get("chapter")
+    }
+
+
+class ContextBuilder:
+    """
+    Assembles retrieved graph chunks and vector rows into the prompt's context block.
+
+    Chunks are deduplicated across both sources by a hash of their normalized text, so a
+    passage found by Neo4j and pgvector appears once. They are then ranked: passages
+    found by both sources first, then vector and graph results interleaved (vector rows
+    by similarity, graph chunks in retrieval order, entity matches before generic samples).
+    Ranked chunks are added while they fit in a token budget and rendered as numbered
+    plain-text passages, so the prompt carries no Python reprs and is identical for
+    identical retrieval results.
+
+    Attributes:
+        token_budget (int): Maximum tokens of rendered context.
+        chapters (Dict[bytes, str]): Chapter by text digest for graph chunks, see load_chapters().
+        model (str): Chat model the context is sent to; the budget is counted in its tokens.
+    """
+
+    def __init__(
+        self,
+        token_budget: int = DEFAULT_TOKEN_BUDGET,
+        chapters: Optional[Dict[bytes, str]] = None,
+        model: str = "gpt-4.1",
+    ) -> None:
+        """
+        Args:
+            token_budget (int): Maximum tokens of rendered context.
+            chapters (Optional[Dict[bytes, str]]): Chapter by text digest for graph chunks, see load_chapters().
+            model (str): Chat model the context is sent to; the budget is counted in its tokens.
+        """
+        self.token_budget = token_budget
+        self.chapters: Dict[bytes, str] = chapters or {}
+        self.model = model
+
+    @staticmethod
+    def _merge(
+        graph_chunks: Sequence[str],
+        vector_rows: Sequence[Dict[str, Any]],
+        chapters: Optional[Dict[bytes, str]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Deduplicate both sources into passages with text, chapter and which sources found them.
+        Graph chunks carry no chapter of their own; it is looked up in chapters.
+        """
+        passages: Dict[bytes, Dict[str, Any]] = {}
+
+        for rank, row in enumerate(vector_rows):
+            text = normalize_text(row.get("chunk") or "")
+            if not text:
+                continue
+            key = text_digest(text)
+            if key not in passages:
+                passages[key] = {"text": text, "chapter": row.get("chapter"), "vector_rank": rank, "graph_rank": None}
+
+        for rank, chunk in enumerate(graph_chunks):
+            text = normalize_text(chunk or "")
+            if not text:
+                continue
+            key = text_digest(text)
+            if key in passages:
+                if passages[key]["graph_rank"] is None:
+                    passages[key]["graph_rank"] = rank
+            else:
+                chapter = chapters.get(key) if chapters else None
+                passages[key] = {"text": text, "chapter": chapter, "vector_rank": None, "graph_rank": rank}
+
+        return list(passages.values())
+
+    @staticmethod
+    def _rank(passages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        both = [p for p in passages if p["vector_rank"] is not None and p["graph_rank"] is not None]
+        vector_only = [p for p in passages if p["graph_rank"] is None]
+        graph_only = [p for p in passages if p["vector_rank"] is None]
+
+        both.sort(key=lambda p: (p["vector_rank"], p["graph_rank"]))
+        vector_only.sort(key=lambda p: p["vector_rank"])
+        graph_only.sort(key=lambda p: p["graph_rank"])
+
+        ranked = list(both)
+        for i in range(max(len(vector_only), len(graph_only))):
+            ranked += vector_only[i:i + 1] + graph_only[i:i + 1]
+        return ranked
+
+    @staticmethod
+    def render_passage(number: int, passage: Dict[str, Any]) -> str:
+        """
+        Render one passage, e.g. '[1] Chapter: Laying Plans' followed by its text.
+        """
+        header = f"[{number}] Chapter: {passage['chapter']}" if passage["chapter"] else f"[{number}]"
+        return f"{header}\n{passage['text']}"
+
+    def build(
+        self,
+        graph_chunks: Sequence[str],
+        vector_rows: Sequence[Dict[str, Any]],
+        token_budget: Optional[int] = None,
+    ) -> str:
+        """
+        Deduplicate, rank and trim retrieved chunks, and render them for the prompt.
+
+        Args:
+            graph_chunks (Sequence[str]): Chunk contents from the knowledge graph.
+            vector_rows (Sequence[Dict[str, Any]]): Rows with 'chunk' and 'chapter' keys from vector search, most similar first.
+            token_budget (Optional[int]): Overrides the builder's token budget.
+
+        Returns:
+            str: Rendered context; passages that would overflow the budget are skipped.
+        """
+        budget = self.token_budget if token_budget is None else token_budget
+        rendered: List[str] = []
+        used = 0
+
+        for passage in self._rank(self._merge(graph_chunks, vector_rows, self.chapters)):
+            text = self.render_passage(len(rendered) + 1, passage)
+            # Passages are joined by a blank line, which costs about one token
+            tokens = count_tokens(text, self.model) + 1
+            if used + tokens > budget:
+                continue
+            rendered.append(text)
+            used += tokens
+
+        return "\n\n".join(rendered)
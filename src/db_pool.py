@@ -1,14 +1,277 @@
-from psycopg2 import pool
 import os
+import time
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Generator, Optional, Sequence
+import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
+from psycopg2 import pool
 from dotenv import load_dotenv
 load_dotenv()
 
-db_pool = pool.SimpleConnectionPool(
-    minconn=1,
-    maxconn=22,
-    host="localhost",
-    port=5432,
-    user="postgres",
-    database="art_of_war",
-    password=os.getenv('DB_PASSWORD')
-)
\ No newline at end of file
+
+def connection_settings_from_env() -> Dict[str, Any]:
+    """
+    Connection settings shared by the sync and async pools (PGVECTOR_HOST, PGVECTOR_PORT,
+    PGVECTOR_USER, PGVECTOR_DB, DB_PASSWORD). The keys are accepted by both psycopg2 and asyncpg.
+    """
+    return {
+        "host": os.getenv("PGVECTOR_HOST", "localhost"),
+        "port": int(os.getenv("PGVECTOR_PORT", "5432")),
+        "user": os.getenv("PGVECTOR_USER", "postgres"),
+        "database": os.getenv("PGVECTOR_DB", "art_of_war"),
+        "password": os.getenv("DB_PASSWORD"),
+    }
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    """
+    A psycopg2 connection that remembers which statements it has prepared
+    and when it was last handed back to the pool.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared: set[str] = set()
+        self.last_used: float = time.monotonic()
+
+
+class PoolTimeout(pool.PoolError):
+    """
+    Raised when no connection becomes available within the acquire timeout.
+    """
+
+
+class PgPool:
+    """
+    A thread-safe PostgreSQL connection pool.
+
+    Wraps psycopg2's ThreadedConnectionPool with a semaphore so callers wait for a free
+    connection (up to acquire_timeout) instead of failing as soon as the pool is exhausted,
+    health-checks connections as they are handed out, and tracks saturation metrics.
+    The underlying pool is created on first use, so importing this module never connects.
+
+    Attributes:
+        minconn (int): Connections opened when the pool is created.
+        maxconn (int): Upper bound on open connections.
+        acquire_timeout (float): Seconds to wait for a free connection before raising PoolTimeout.
+        health_check_after (float): Idle seconds after which a connection is pinged before reuse.
+    """
+
+    def __init__(
+        self,
+        minconn: int = 1,
+        maxconn: int = 22,
+        acquire_timeout: float = 10.0,
+        health_check_after: float = 30.0,
+        **conn_kwargs: Any,
+    ) -> None:
+        """
+        Configure the pool.
+
+        Args:
+            minconn (int): Connections opened when the pool is created.
+            maxconn (int): Upper bound on open connections.
+            acquire_timeout (float): Seconds to wait for a free connection.
+            health_check_after (float): Idle seconds after which a connection is pinged before reuse.
+            **conn_kwargs: Keyword arguments passed to psycopg2.connect.
+        """
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.acquire_timeout = acquire_timeout
+        self.health_check_after = health_check_after
+        self.conn_kwargs = conn_kwargs
+
+        self._pool: Optional[pool.ThreadedConnectionPool] = None
+        self._pool_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._stats_lock = threading.Lock()
+        self._in_use = 0
+        self._waiting = 0
+        self._checkouts = 0
+        self._timeouts = 0
+        self._broken = 0
+        self._wait_seconds = 0.0
+        self._max_wait_seconds = 0.0
+
+    @classmethod
+    def from_env(cls) -> "PgPool":
+        """
+        Build a pool from environment variables (PGVECTOR_HOST, PGVECTOR_PORT, PGVECTOR_USER,
+        PGVECTOR_DB, DB_PASSWORD, DB_POOL_MIN, DB_POOL_MAX, DB_POOL_TIMEOUT).
+        """
+        return cls(
+            minconn=int(os.getenv("DB_POOL_MIN", "1")),
+            maxconn=int(os.getenv("DB_POOL_MAX", "22")),
+            acquire_timeout=float(os.getenv("DB_POOL_TIMEOUT", "10")),
+            **connection_settings_from_env(),
+        )
+
+    def _get_pool(self) -> pool.ThreadedConnectionPool:
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = pool.ThreadedConnectionPool(
+                        self.minconn, self.maxconn, connection_factory=PooledConnection, **self.conn_kwargs
+                    )
+        return self._pool
+
+    def _is_healthy(self, conn: PooledConnection) -> bool:
+        """
+        Cheap liveness check: closed connections fail immediately, and connections idle
+        for longer than health_check_after are pinged with SELECT 1.
+        """
+        if conn.closed:
+            return False
+        if time.monotonic() - conn.last_used < self.health_check_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self, timeout: Optional[float] = None) -> PooledConnection:
+        """
+        Take a healthy connection from the pool, waiting for one to be returned if necessary.
+        Every connection obtained here must be given back with putconn.
+
+        Args:
+            timeout (Optional[float]): Seconds to wait; defaults to acquire_timeout.
+
+        Returns:
+            PooledConnection: An open connection.
+
+        Raises:
+            PoolTimeout: If no connection became available in time.
+        """
+        timeout = self.acquire_timeout if timeout is None else timeout
+        start = time.monotonic()
+        with self._stats_lock:
+            self._waiting += 1
+        acquired = self._slots.acquire(timeout=timeout)
+        waited = time.monotonic() - start
+        with self._stats_lock:
+            self._waiting -= 1
+            if not acquired:
+                self._timeouts += 1
+            else:
+                self._in_use += 1
+                self._checkouts += 1
+                self._wait_seconds += waited
+                self._max_wait_seconds = max(self._max_wait_seconds, waited)
+        if not acquired:
+            raise PoolTimeout(f"No database connection available after {timeout:.1f}s")
+
+        try:
+            threaded_pool = self._get_pool()
+            conn = threaded_pool.getconn()
+            if not self._is_healthy(conn):
+                with self._stats_lock:
+                    self._broken += 1
+                threaded_pool.putconn(conn, close=True)
+                conn = threaded_pool.getconn()
+            return conn
+        except Exception:
+            self._release_slot()
+            raise
+
+    def putconn(self, conn: PooledConnection, close: bool = False) -> None:
+        """
+        Return a connection to the pool, rolling back any open transaction.
+
+        Args:
+            conn (PooledConnection): Connection obtained from getconn.
+            close (bool): Discard the connection instead of keeping it for reuse.
+        """
+        try:
+            conn.last_used = time.monotonic()
+            self._get_pool().putconn(conn, close=close or bool(conn.closed))
+        finally:
+            self._release_slot()
+
+    def _release_slot(self) -> None:
+        with self._stats_lock:
+            self._in_use -= 1
+        self._slots.release()
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None) -> Generator[PooledConnection, None, None]:
+        """
+        Context manager that checks out a connection and always gives it back.
+
+        Yields:
+            Generator[PooledConnection, None, None]: An open connection.
+        """
+        conn = self.getconn(timeout)
+        close = False
+        try:
+            yield conn
+        except (psycopg2.InterfaceError, psycopg2.OperationalError):
+            close = True
+            raise
+        finally:
+            self.putconn(conn, close=close)
+
+    def execute_prepared(self, cur: psycopg2.extensions.cursor, name: str, sql: str, params: Sequence[Any]) -> None:
+        """
+        Execute a statement through a server-side prepared statement, preparing it once per connection.
+
+        Args:
+            cur (cursor): Cursor on a connection from this pool.
+            name (str): Prepared statement name.
+            sql (str): Statement body using $1, $2, ... placeholders.
+            params (Sequence[Any]): Parameters for the statement.
+        """
+        conn: PooledConnection = cur.connection
+        if name not in conn.prepared:
+            cur.execute(f"PREPARE {name} AS {sql}")
+            conn.prepared.add(name)
+        execute = f"EXECUTE {name}({', '.join(['%s'] * len(params))})"
+        if conn.autocommit:
+            # No transaction state to lose; a failed EXECUTE can simply be retried
+            savepoint = ""
+        else:
+            # Sent in the same round trip as EXECUTE; lets a failure be undone without rolling
+            # back the caller's transaction (and its SET LOCAL settings). Released at transaction end.
+            savepoint = "SAVEPOINT execute_prepared; "
+        try:
+            cur.execute(savepoint + execute, params)
+        except psycopg2.errors.InvalidSqlStatementName:
+            # The statement was lost (e.g. server-side DISCARD ALL), and with it every other one
+            if savepoint:
+                cur.execute("ROLLBACK TO SAVEPOINT execute_prepared")
+            conn.prepared.clear()
+            cur.execute(f"PREPARE {name} AS {sql}")
+            conn.prepared.add(name)
+            cur.execute(execute, params)
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Return pool saturation metrics.
+        """
+        with self._stats_lock:
+            return {
+                "maxconn": self.maxconn,
+                "in_use": self._in_use,
+                "waiting": self._waiting,
+                "checkouts": self._checkouts,
+                "timeouts": self._timeouts,
+                "broken_connections": self._broken,
+                "wait_seconds_total": self._wait_seconds,
+                "max_wait_seconds": self._max_wait_seconds,
+                "saturation": self._in_use / self.maxconn,
+            }
+
+    def closeall(self) -> None:
+        """
+        Close every connection held by the pool.
+        """
+        if self._pool is not None:
+            self._pool.closeall()
+
+
+db_pool = PgPool.from_env()
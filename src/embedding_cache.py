@@ -0,0 +1,249 @@
+import os
+import re
+import json
+import atexit
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEFAULT_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "assets/embedding_cache")
+DEFAULT_MAX_MB = int(os.getenv("EMBEDDING_CACHE_MAX_MB", "512"))
+
+_caches: Dict[str, "EmbeddingCache"] = {}
+_caches_lock = threading.Lock()
+
+def get_embedding_cache(model: str) -> "EmbeddingCache":
+    """
+    Returns the process-wide EmbeddingCache for an embedding model.
+    """
+    with _caches_lock:
+        if model not in _caches:
+            _caches[model] = EmbeddingCache(os.path.join(DEFAULT_CACHE_DIR, model))
+        return _caches[model]
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalize text before hashing so trivially different inputs share a cache entry.
+
+    Args:
+        text (str): Raw input text.
+
+    Returns:
+        str: NFC-normalized text with whitespace collapsed and trimmed.
+    """
+    return re.sub(r'\s+', ' ', unicodedata.normalize('NFC', text)).strip()
+
+
+def text_digest(text: str) -> bytes:
+    """
+    Return the 16-byte content hash used as a cache key.
+    """
+    return hashlib.sha256(normalize_text(text).encode('utf-8')).digest()[:16]
+
+
+class EmbeddingCache:
+    """
+    A content-addressed, on-disk embedding cache for a single embedding model.
+
+    Vectors live in a memory-mapped float32 matrix (one row per slot), with a parallel
+    matrix of 16-byte key digests so a row is only trusted if its digest matches.
+    A JSON index maps digests to slots in least-recently-used order; when the matrix
+    is full the least recently used slot is reused. An in-process LRU of recent vectors
+    sits in front of the memory map.
+
+    The cache is safe to share between threads. Separate processes may read the same
+    cache, but only one should write to it at a time.
+
+    Attributes:
+        path (str): Directory holding the cache files.
+        max_bytes (int): Size budget for the vector matrix.
+        hits (int): Lookups served from the in-process LRU.
+        disk_hits (int): Lookups served from the memory-mapped matrix.
+        misses (int): Lookups not found in the cache.
+    """
+
+    INDEX_FILE = "index.json"
+    VECTORS_FILE = "vectors.f32"
+    DIGESTS_FILE = "digests.bin"
+
+    def __init__(self, path: str, max_mb: float = DEFAULT_MAX_MB, lru_size: int = 4096, flush_every: int = 256):
+        """
+        Open (or lazily create) a cache directory.
+
+        Args:
+            path (str): Directory holding the cache files.
+            max_mb (float): Size budget for the vector matrix in megabytes.
+            lru_size (int): Number of vectors held in the in-process LRU.
+            flush_every (int): Persist the index after this many new entries.
+        """
+        self.path = path
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.lru_size = lru_size
+        self.flush_every = flush_every
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._lock = threading.RLock()
+        self._lru: OrderedDict[bytes, np.ndarray] = OrderedDict()
+        self._index: OrderedDict[bytes, int] = OrderedDict()
+        self._vectors: Optional[np.memmap] = None
+        self._digests: Optional[np.memmap] = None
+        self._capacity = 0
+        self._dimensions = 0
+        self._unflushed = 0
+
+        self._load()
+        atexit.register(self.flush)
+
+    def _load(self) -> None:
+        """
+        Open existing cache files, if any.
+        """
+        index_path = os.path.join(self.path, self.INDEX_FILE)
+        if not os.path.exists(index_path):
+            return
+        try:
+            with open(index_path, 'r') as f:
+                data = json.load(f)
+            self._open_matrices(data["capacity"], data["dimensions"], create=False)
+            for key_hex, slot in data["entries"]:
+                self._index[bytes.fromhex(key_hex)] = slot
+        except Exception as e:
+            print(f'Ignoring unreadable embedding cache at {self.path}:', e)
+            self._index.clear()
+            self._vectors = self._digests = None
+
+    def _open_matrices(self, capacity: int, dimensions: int, create: bool) -> None:
+        """
+        Memory-map the vector and digest matrices, creating them if requested.
+        """
+        mode = 'w+' if create else 'r+'
+        if create:
+            os.makedirs(self.path, exist_ok=True)
+        self._vectors = np.memmap(os.path.join(self.path, self.VECTORS_FILE), dtype=np.float32,
+                                  mode=mode, shape=(capacity, dimensions))
+        self._digests = np.memmap(os.path.join(self.path, self.DIGESTS_FILE), dtype=np.uint8,
+                                  mode=mode, shape=(capacity, 16))
+        self._capacity = capacity
+        self._dimensions = dimensions
+
+    def get(self, text: str) -> Optional[List[float]]:
+        """
+        Look up the cached embedding for a text.
+
+        Args:
+            text (str): Input text (normalized before hashing).
+
+        Returns:
+            Optional[List[float]]: The cached embedding, or None on a miss.
+        """
+        key = text_digest(text)
+        with self._lock:
+            vector = self._lru.get(key)
+            if vector is not None:
+                self._lru.move_to_end(key)
+                if key in self._index:
+                    self._index.move_to_end(key)
+                self.hits += 1
+                return vector.tolist()
+
+            slot = self._index.get(key)
+            if slot is not None and bytes(self._digests[slot]) == key:
+                vector = np.array(self._vectors[slot])
+                self._index.move_to_end(key)
+                self._remember(key, vector)
+                self.disk_hits += 1
+                return vector.tolist()
+
+            self.misses += 1
+            return None
+
+    def put(self, text: str, embedding: Optional[List[float]]) -> None:
+        """
+        Store an embedding, evicting the least recently used entry if the cache is full.
+
+        Args:
+            text (str): Input text the embedding was generated from.
+            embedding (Optional[List[float]]): The embedding; None is ignored.
+        """
+        if embedding is None:
+            return
+        key = text_digest(text)
+        vector = np.asarray(embedding, dtype=np.float32)
+
+        with self._lock:
+            if self._vectors is None:
+                capacity = max(1, self.max_bytes // (vector.shape[0] * 4))
+                self._open_matrices(capacity, vector.shape[0], create=True)
+            if vector.shape[0] != self._dimensions:
+                print(f'Embedding of length {vector.shape[0]} does not fit cache of dimension {self._dimensions}')
+                return
+
+            slot = self._index.get(key)
+            if slot is None:
+                if len(self._index) < self._capacity:
+                    slot = len(self._index)
+                else:
+                    evicted, slot = self._index.popitem(last=False)
+                    self._lru.pop(evicted, None)
+
+            self._vectors[slot] = vector
+            self._digests[slot] = np.frombuffer(key, dtype=np.uint8)
+            self._index[key] = slot
+            self._index.move_to_end(key)
+            self._remember(key, vector)
+
+            self._unflushed += 1
+            if self._unflushed >= self.flush_every:
+                self.flush()
+
+    def _remember(self, key: bytes, vector: np.ndarray) -> None:
+        """
+        Insert a vector into the in-process LRU.
+        """
+        self._lru[key] = vector
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+    def flush(self) -> None:
+        """
+        Flush the memory maps and atomically rewrite the index file.
+        """
+        with self._lock:
+            if self._vectors is None or not self._unflushed:
+                return
+            self._vectors.flush()
+            self._digests.flush()
+            index_path = os.path.join(self.path, self.INDEX_FILE)
+            tmp_path = index_path + ".tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump({
+                    "capacity": self._capacity,
+                    "dimensions": self._dimensions,
+                    "entries": [[key.hex(), slot] for key, slot in self._index.items()],
+                }, f)
+            os.replace(tmp_path, index_path)
+            self._unflushed = 0
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Return hit/miss counters and occupancy.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "entries": len(self._index),
+                "capacity": self._capacity,
+            }
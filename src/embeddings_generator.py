@@ -1,62 +1,250 @@
 import os
-from typing import Optional, List, Generator, Tuple
-from openai import OpenAI
+import time
+import random
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Optional, List, Generator, Tuple, Any, Deque, Union, Dict
+import tiktoken
+from openai import OpenAI, RateLimitError, APIConnectionError, APITimeoutError, InternalServerError
 from dotenv import load_dotenv
+from src.embedding_cache import EmbeddingCache, get_embedding_cache
+from src.metrics import record_error
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Errors worth retrying: throttling and transient network/server failures.
+RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+
+# Embedding batches and chunks are budgeted in the embedding models' tokens (cl100k_base)
+DEFAULT_TOKENIZER_MODEL = "text-embedding-3-small"
+
+_encodings: Dict[str, Union[tiktoken.Encoding, bool]] = {}
+
+def count_tokens(text: str, model: str = DEFAULT_TOKENIZER_MODEL) -> int:
+    """
+    Count tokens in a text as an OpenAI model tokenizes it, using tiktoken.encoding_for_model
+    (e.g. cl100k_base for the embedding models, o200k_base for gpt-4o and gpt-4.1).
+    Models tiktoken does not know yet are counted with o200k_base. Falls back to a conservative
+    3-characters-per-token estimate if the encoding cannot be loaded (tiktoken downloads it on first use).
+
+    Args:
+        text (str): The text to measure.
+        model (str): Model whose tokenizer to count with.
+
+    Returns:
+        int: Number of tokens.
+    """
+    encoding = _encodings.get(model)
+    if encoding is None:
+        try:
+            try:
+                encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                encoding = tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            print(f'Could not load tiktoken encoding for {model}, estimating token counts:', e)
+            encoding = False
+        _encodings[model] = encoding
+    if encoding is False:
+        return len(text) // 3 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
 class Generator:
     """
     A class to generate embeddings for text chunks using OpenAI's embedding models.
-    
+
     Attributes:
-        chunks (Optional[List[str]]): A list of text chunks to embed.
+        chunks (Optional[List[Union[str, Dict[str, str]]]]): Text chunks (or chunk dicts with a 'content' key) to embed.
         embedding_model (str): The name of the OpenAI embedding model to use.
         openai_client (OpenAI): OpenAI API client instance.
+        batched (bool): Whether generate_chunk_embeddings packs chunks into batched requests.
+        max_batch_tokens (int): Token budget for a single embeddings request.
+        max_batch_size (int): Maximum number of inputs in a single embeddings request.
+        max_workers (int): Number of batch requests kept in flight concurrently.
+        max_retries (int): Attempts per batch before giving up on it.
+        cache (Optional[EmbeddingCache]): Persistent embedding cache consulted before calling the API.
     """
 
-    def __init__(self, chunks: Optional[List[str]] = None, embedding_model: str = 'text-embedding-3-small'):
+    def __init__(
+        self,
+        chunks: Optional[List[Union[str, Dict[str, str]]]] = None,
+        embedding_model: str = 'text-embedding-3-small',
+        batched: bool = True,
+        max_batch_tokens: int = 100_000,
+        max_batch_size: int = 512,
+        max_workers: int = 4,
+        max_retries: int = 5,
+        base_url: Optional[str] = None,
+        use_cache: bool = True,
+    ):
         """
         Initialize the Generator with optional text chunks and an embedding model.
-        
+
         Args:
-            chunks (Optional[List[str]]): A list of strings to be embedded.
+            chunks (Optional[List[Union[str, Dict[str, str]]]]): Strings or chunk dicts to be embedded.
             embedding_model (str): The OpenAI model to use for embeddings.
+            batched (bool): Pack chunks into concurrent batched requests instead of one request per chunk.
+            max_batch_tokens (int): Token budget per embeddings request (the API caps this at 300k).
+            max_batch_size (int): Maximum inputs per embeddings request (the API caps this at 2048).
+            max_workers (int): Number of batches embedded concurrently.
+            max_retries (int): Attempts per batch on rate limits and transient errors.
+            base_url (Optional[str]): Alternative API endpoint, e.g. a local fake embeddings server.
+            use_cache (bool): Serve repeated texts from the shared on-disk embedding cache.
         """
-        self.openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.openai_client = OpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            base_url=base_url or os.getenv("OPENAI_BASE_URL"),
+        )
         self.chunks = chunks
         self.embedding_model = embedding_model
+        self.batched = batched
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.cache: Optional[EmbeddingCache] = get_embedding_cache(embedding_model) if use_cache else None
+
+    @staticmethod
+    def _chunk_text(chunk: Union[str, Dict[str, str]]) -> str:
+        """
+        Return the text to embed for a chunk, which may be a plain string or a chunk dict.
+        """
+        return chunk['content'] if isinstance(chunk, dict) else chunk
 
     def generate_single_embedding(self, text: str) -> Optional[List[float]]:
         """
-        Generate an embedding for a single text input.
-        
+        Generate an embedding for a single text input, using the cache when possible.
+
         Args:
             text (str): The input text to embed.
-        
+
         Returns:
             Optional[List[float]]: The embedding vector, or None if an error occurred.
         """
+        if self.cache:
+            cached = self.cache.get(text)
+            if cached is not None:
+                return cached
         try:
             response = self.openai_client.embeddings.create(
                 model=self.embedding_model,
                 input=text
             )
-            return response.data[0].embedding
+            embedding = response.data[0].embedding
+            if self.cache:
+                self.cache.put(text, embedding)
+            return embedding
         except Exception as e:
-            print('Error generating embedding:', e)
+            record_error("embed")
+            logger.warning("Error generating embedding: %s", e)
             return None
 
-    def generate_chunk_embeddings(self) -> Generator[Tuple[str, Optional[List[float]]], None, None]:
+    def embed_batch(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """
+        Embed a list of texts in a single request, retrying with exponential backoff
+        on rate limits and transient errors. Cached texts are not sent to the API.
+
+        Args:
+            texts (List[str]): The texts to embed.
+
+        Returns:
+            List[Optional[List[float]]]: One embedding per text, in input order. Uncached
+            entries are None if the batch still failed after max_retries attempts.
+        """
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        if self.cache:
+            for i, text in enumerate(texts):
+                results[i] = self.cache.get(text)
+        missing = [i for i, embedding in enumerate(results) if embedding is None]
+        if not missing:
+            return results
+
+        for attempt in range(self.max_retries):
+            try:
+                response = self.openai_client.embeddings.create(
+                    model=self.embedding_model,
+                    input=[texts[i] for i in missing]
+                )
+                for i, item in zip(missing, sorted(response.data, key=lambda d: d.index)):
+                    results[i] = item.embedding
+                    if self.cache:
+                        self.cache.put(texts[i], item.embedding)
+                return results
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_retries - 1:
+                    print(f'Giving up on batch of {len(texts)} after {self.max_retries} attempts:', e)
+                    break
+                delay = min(2 ** attempt, 30) + random.uniform(0, 1)
+                print(f'Retrying batch of {len(texts)} in {delay:.1f}s:', e)
+                time.sleep(delay)
+            except Exception as e:
+                print('Error generating batch embeddings:', e)
+                break
+        return results
+
+    def pack_batches(self, chunks: List[Any]) -> Generator[List[Any], None, None]:
+        """
+        Group chunks into batches that respect both the token budget and the input count limit.
+
+        Args:
+            chunks (List[Any]): Strings or chunk dicts, in input order.
+
+        Yields:
+            List[Any]: Consecutive runs of chunks, each small enough for one request.
+        """
+        batch: List[Any] = []
+        batch_tokens = 0
+        for chunk in chunks:
+            tokens = count_tokens(self._chunk_text(chunk), self.embedding_model)
+            if batch and (batch_tokens + tokens > self.max_batch_tokens or len(batch) >= self.max_batch_size):
+                yield batch
+                batch, batch_tokens = [], 0
+            batch.append(chunk)
+            batch_tokens += tokens
+        if batch:
+            yield batch
+
+    def generate_chunk_embeddings_batched(self) -> Generator[Tuple[Any, Optional[List[float]]], None, None]:
+        """
+        Generate embeddings for all chunks using batched requests, with up to max_workers
+        batches in flight at once. Results are yielded in input order.
+
+        Yields:
+            Tuple[Any, Optional[List[float]]]: Each chunk and its corresponding embedding.
+        """
+        pending: Deque[Tuple[List[Any], Future]] = deque()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for batch in self.pack_batches(self.chunks):
+                texts = [self._chunk_text(chunk) for chunk in batch]
+                pending.append((batch, executor.submit(self.embed_batch, texts)))
+
+                # Bound the read-ahead so memory stays flat on large corpora
+                if len(pending) >= self.max_workers * 2:
+                    done_batch, future = pending.popleft()
+                    yield from zip(done_batch, future.result())
+
+            while pending:
+                done_batch, future = pending.popleft()
+                yield from zip(done_batch, future.result())
+
+    def generate_chunk_embeddings(self) -> Generator[Tuple[Any, Optional[List[float]]], None, None]:
         """
         Generate embeddings for all chunks stored in the instance.
 
         Yields:
-            Tuple[str, Optional[List[float]]]: Each chunk and its corresponding embedding.
+            Tuple[Any, Optional[List[float]]]: Each chunk and its corresponding embedding.
         """
         try:
+            if self.batched:
+                yield from self.generate_chunk_embeddings_batched()
+                return
+
             for chunk in self.chunks:
-                embedding = self.generate_single_embedding(chunk)
+                embedding = self.generate_single_embedding(self._chunk_text(chunk))
                 yield (chunk, embedding)
         except Exception as e:
             print("Error generating embeddings:", e)
@@ -0,0 +1,101 @@
+import os
+import csv
+import json
+import time
+import argparse
+from typing import Any, Dict, Iterator, List, Tuple
+import spacy
+from src.spacy_helper import SpacyHelper
+from src.reformat_json_to_csv import CSV_HEADER, entity_rows
+
+
+def iter_chunk_texts(chunks: List[Dict[str, Any]]) -> Iterator[Tuple[str, int]]:
+    """
+    Yield (text, chunk_id) pairs for nlp.pipe; chunks without an 'id' are numbered by position.
+    """
+    for i, chunk in enumerate(chunks):
+        yield chunk['content'], chunk.get('id', i)
+
+
+def extract_entities(
+    chunks: List[Dict[str, Any]],
+    json_path: str = 'assets/entities.json',
+    csv_path: str = 'assets/entities.csv',
+    model: str = "en_core_web_sm",
+    batch_size: int = 64,
+    n_process: int = 1,
+) -> int:
+    """
+    Run NER over every chunk and write entities.json and entities.csv as results arrive.
+
+    Chunks are streamed through nlp.pipe with only the NER components loaded, across
+    n_process worker processes. Output goes to temporary files that replace the
+    targets once extraction completes, so an interrupted run leaves the old files intact.
+
+    Args:
+        chunks (List[Dict[str, Any]]): Chunk dictionaries with 'content' (and optionally 'id', 'chapter').
+        json_path (str): Output JSON: one entry per chunk with its entities.
+        csv_path (str): Output CSV of chunk_id, entity_text, label for the Neo4j loader.
+        model (str): spaCy model name.
+        batch_size (int): Texts per nlp.pipe batch.
+        n_process (int): Worker processes (-1 for one per CPU).
+
+    Returns:
+        int: Number of entities written to the JSON file.
+    """
+    exclude = [name for name in SpacyHelper.PIPES if name not in SpacyHelper.NER_PIPES]
+    nlp = spacy.load(model, exclude=exclude)
+
+    for path in (json_path, csv_path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    json_tmp, csv_tmp = json_path + ".tmp", csv_path + ".tmp"
+
+    start = time.perf_counter()
+    entity_count = 0
+    with open(json_tmp, 'w', encoding='utf-8') as json_file, \
+            open(csv_tmp, 'w', newline='', encoding='utf-8') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(CSV_HEADER)
+        json_file.write("[")
+
+        docs = nlp.pipe(iter_chunk_texts(chunks), as_tuples=True, batch_size=batch_size, n_process=n_process)
+        for i, (doc, chunk_id) in enumerate(docs):
+            seen = set()
+            entities = []
+            for ent in doc.ents:
+                if (ent.text, ent.label_) not in seen:
+                    seen.add((ent.text, ent.label_))
+                    entities.append({"text": ent.text, "label": ent.label_})
+
+            item = {"chunk_id": chunk_id, "entities": entities}
+            json_file.write(("\n" if i == 0 else ",\n") + json.dumps(item, ensure_ascii=False))
+            writer.writerows(entity_rows(item, i))
+            entity_count += len(entities)
+
+            if (i + 1) % 1000 == 0:
+                print(f"{i + 1} chunks ({(i + 1) / (time.perf_counter() - start):,.0f} chunks/sec)")
+
+        json_file.write("\n]\n")
+
+    os.replace(json_tmp, json_path)
+    os.replace(csv_tmp, csv_path)
+    elapsed = time.perf_counter() - start
+    print(f"✅ {entity_count} entities from {len(chunks)} chunks in {elapsed:.1f}s "
+          f"({len(chunks) / elapsed:,.0f} chunks/sec, n_process={n_process})")
+    return entity_count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract named entities from chunks into entities.json and entities.csv.")
+    parser.add_argument("--chunks", default="assets/chunks.json")
+    parser.add_argument("--json", default="assets/entities.json")
+    parser.add_argument("--csv", default="assets/entities.csv")
+    parser.add_argument("--model", default="en_core_web_sm")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--n-process", type=int, default=os.cpu_count() or 1, help="Worker processes (-1 for one per CPU)")
+    args = parser.parse_args()
+
+    with open(args.chunks, 'r', encoding='utf-8') as f:
+        chunks = json.load(f)
+
+    extract_entities(chunks, args.json, args.csv, model=args.model, batch_size=args.batch_size, n_process=args.n_process)
@@ -0,0 +1,115 @@
+import time
+import asyncio
+import random
+from typing import Any, Dict, List, Optional
+import numpy as np
+
+
+def synthetic_chunks(n_chunks: int = 2000, words_per_chunk: int = 120, seed: int = 0) -> List[Dict[str, Any]]:
+    """
+    Generate a reproducible stand-in corpus of chunk rows.
+
+    Args:
+        n_chunks (int): Number of chunks.
+        words_per_chunk (int): Words per chunk.
+        seed (int): Random seed.
+
+    Returns:
+        List[Dict[str, Any]]: Rows with 'id', 'chunk' and 'chapter' keys.
+    """
+    rng = random.Random(seed)
+    vocabulary = ["army", "general", "terrain", "deception", "victory", "enemy", "river", "spies",
+                  "strategy", "supplies", "ruler", "battle", "attack", "defense", "season", "march"]
+    return [
+        {
+            "id": i + 1,
+            "chunk": " ".join(rng.choice(vocabulary) for _ in range(words_per_chunk)),
+            "chapter": f"Chapter {i // 100 + 1}",
+        }
+        for i in range(n_chunks)
+    ]
+
+
+class InMemoryVectorStore:
+    """
+    In-process stand-in for the pgvector Retriever: exact cosine search over random unit
+    vectors, plus a fixed simulated round-trip latency per query.
+
+    Attributes:
+        rows (List[Dict[str, Any]]): Chunk rows returned by searches.
+        latency (float): Seconds added to every search.
+    """
+
+    def __init__(self, rows: Optional[List[Dict[str, Any]]] = None, dimensions: int = 1536, latency: float = 0.005, seed: int = 0) -> None:
+        self.rows = rows if rows is not None else synthetic_chunks(seed=seed)
+        self.latency = latency
+        rng = np.random.default_rng(seed)
+        matrix = rng.standard_normal((len(self.rows), dimensions)).astype(np.float32)
+        self.embeddings = matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+    def _search(self, embedding: List[float], limit: int) -> List[Dict[str, Any]]:
+        query = np.asarray(embedding, dtype=np.float32)
+        scores = self.embeddings @ (query / (np.linalg.norm(query) or 1.0))
+        top = np.argsort(-scores)[:limit]
+        return [{**self.rows[i], "similarity": float(scores[i])} for i in top]
+
+    def find_similar(self, embedding: List[float], limit: int = 5) -> List[Dict[str, Any]]:
+        """
+        Same contract as Retriever.find_similar.
+        """
+        time.sleep(self.latency)
+        return self._search(embedding, limit)
+
+
+class InMemoryGraph:
+    """
+    Stand-in for GraphModel: returns a deterministic selection of chunk texts per question
+    after a simulated query latency.
+
+    Attributes:
+        chunks (List[str]): Chunk texts to draw from.
+        latency (float): Seconds added to every run.
+        max_chunks (int): Chunks returned per question.
+    """
+
+    def __init__(self, chunks: Optional[List[str]] = None, latency: float = 0.02, max_chunks: int = 10) -> None:
+        self.chunks = chunks if chunks is not None else [row["chunk"] for row in synthetic_chunks()]
+        self.latency = latency
+        self.max_chunks = max_chunks
+
+    def _select(self, user_message: str) -> List[str]:
+        rng = random.Random(user_message)
+        return rng.sample(self.chunks, min(self.max_chunks, len(self.chunks)))
+
+    def run(self, user_message: str) -> List[str]:
+        """
+        Same contract as GraphModel.run.
+        """
+        time.sleep(self.latency)
+        return self._select(user_message)
+
+
+class AsyncInMemoryGraph(InMemoryGraph):
+    """
+    Stand-in for AsyncGraphModel.
+    """
+
+    async def run(self, user_message: str) -> List[str]:
+        await asyncio.sleep(self.latency)
+        return self._select(user_message)
+
+    async def close(self) -> None:
+        pass
+
+
+class AsyncInMemoryVectorStore(InMemoryVectorStore):
+    """
+    Stand-in for AsyncRetriever.
+    """
+
+    async def find_similar(self, embedding: List[float], limit: int = 5) -> List[Dict[str, Any]]:
+        await asyncio.sleep(self.latency)
+        return self._search(embedding, limit)
+
+    async def close(self) -> None:
+        pass
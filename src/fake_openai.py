@@ -0,0 +1,257 @@
+import json
+import time
+import hashlib
+import random
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import List, Tuple
+
+
+class FakeOpenAIServer:
+    """
+    A local stand-in for the OpenAI embeddings and chat completions endpoints, used to
+    exercise the embedding pipeline and the query path without network access or API cost.
+
+    Embeddings are deterministic pseudo-random unit vectors seeded by the input text,
+    so identical inputs always map to identical vectors. Chat completions answer with
+    answer_tokens filler words, streamed as server-sent events when requested: the first
+    token arrives after chat_latency seconds and the rest at tokens_per_second.
+
+    Attributes:
+        host (str): Interface to bind.
+        port (int): Port to bind (0 picks a free port).
+        dimensions (int): Length of returned embedding vectors.
+        latency (float): Seconds of simulated latency per embeddings request.
+        chat_latency (float): Seconds before the first chat token.
+        tokens_per_second (float): Chat token rate after the first token.
+        answer_tokens (int): Tokens in every chat answer.
+        requests_served (int): Number of embeddings requests handled.
+        inputs_served (int): Number of individual texts embedded.
+        chat_requests_served (int): Number of chat completions handled.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        dimensions: int = 1536,
+        latency: float = 0.2,
+        chat_latency: float = 0.5,
+        tokens_per_second: float = 50.0,
+        answer_tokens: int = 200,
+    ):
+        """
+        Initialize the server configuration. Call start() to begin serving.
+
+        Args:
+            host (str): Interface to bind.
+            port (int): Port to bind (0 picks a free port).
+            dimensions (int): Length of returned embedding vectors.
+            latency (float): Seconds of simulated latency added to every embeddings request.
+            chat_latency (float): Seconds before the first chat token.
+            tokens_per_second (float): Chat token rate after the first token (0 for no delay).
+            answer_tokens (int): Tokens in every chat answer.
+        """
+        self.host = host
+        self.port = port
+        self.dimensions = dimensions
+        self.latency = latency
+        self.chat_latency = chat_latency
+        self.tokens_per_second = tokens_per_second
+        self.answer_tokens = answer_tokens
+        self.requests_served = 0
+        self.inputs_served = 0
+        self.chat_requests_served = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        """
+        Base URL to pass to the OpenAI client (e.g. Generator(base_url=...)).
+        """
+        return f"http://{self.host}:{self.port}/v1"
+
+    def embed(self, text: str) -> List[float]:
+        """
+        Produce a deterministic unit vector for a text.
+
+        Args:
+            text (str): Input text.
+
+        Returns:
+            List[float]: The embedding vector.
+        """
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+        rng = random.Random(seed)
+        vector = [rng.gauss(0.0, 1.0) for _ in range(self.dimensions)]
+        norm = sum(v * v for v in vector) ** 0.5
+        return [v / norm for v in vector]
+
+    def answer(self) -> List[str]:
+        """
+        The tokens of every chat answer.
+        """
+        words = ["All", " warfare", " is", " based", " on", " deception", "."]
+        return [words[i % len(words)] for i in range(self.answer_tokens)]
+
+    def _make_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status: int, payload: dict) -> None:
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+
+                if self.path.rstrip("/").endswith("/embeddings"):
+                    inputs = request.get("input", [])
+                    if isinstance(inputs, str):
+                        inputs = [inputs]
+                    time.sleep(fake.latency)
+                    with fake._lock:
+                        fake.requests_served += 1
+                        fake.inputs_served += len(inputs)
+                    self._send_json(200, {
+                        "object": "list",
+                        "model": request.get("model", ""),
+                        "data": [
+                            {"object": "embedding", "index": i, "embedding": fake.embed(text)}
+                            for i, text in enumerate(inputs)
+                        ],
+                        "usage": {"prompt_tokens": 0, "total_tokens": 0},
+                    })
+                elif self.path.rstrip("/").endswith("/chat/completions"):
+                    with fake._lock:
+                        fake.chat_requests_served += 1
+                    if request.get("stream"):
+                        self._stream_chat(request)
+                    else:
+                        time.sleep(fake.chat_latency)
+                        self._send_json(200, {
+                            "id": "chatcmpl-fake",
+                            "object": "chat.completion",
+                            "created": int(time.time()),
+                            "model": request.get("model", ""),
+                            "choices": [{
+                                "index": 0,
+                                "message": {"role": "assistant", "content": "".join(fake.answer())},
+                                "finish_reason": "stop",
+                            }],
+                            "usage": {"prompt_tokens": 0, "completion_tokens": fake.answer_tokens, "total_tokens": fake.answer_tokens},
+                        })
+                else:
+                    self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+            def _stream_chat(self, request: dict) -> None:
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.end_headers()
+
+                def event(delta: dict, finish_reason=None) -> None:
+                    chunk = {
+                        "id": "chatcmpl-fake",
+                        "object": "chat.completion.chunk",
+                        "created": int(time.time()),
+                        "model": request.get("model", ""),
+                        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                    }
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+
+                time.sleep(fake.chat_latency)
+                event({"role": "assistant", "content": ""})
+                interval = 1.0 / fake.tokens_per_second if fake.tokens_per_second > 0 else 0.0
+                for i, token in enumerate(fake.answer()):
+                    if i and interval:
+                        time.sleep(interval)
+                    event({"content": token})
+                event({}, finish_reason="stop")
+                if (request.get("stream_options") or {}).get("include_usage"):
+                    usage = {"prompt_tokens": 0, "completion_tokens": fake.answer_tokens, "total_tokens": fake.answer_tokens}
+                    chunk = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()),
+                             "model": request.get("model", ""), "choices": [], "usage": usage}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+                self.close_connection = True
+
+        return Handler
+
+    def start(self) -> "FakeOpenAIServer":
+        """
+        Start serving on a background thread.
+
+        Returns:
+            FakeOpenAIServer: self, with port resolved.
+        """
+        self._server = ThreadingHTTPServer((self.host, self.port), self._make_handler())
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """
+        Stop the server and release the port.
+        """
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> "FakeOpenAIServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def compare_serial_and_batched(n_chunks: int = 200, latency: float = 0.2) -> Tuple[float, float]:
+    """
+    Embed the same synthetic chunks serially and in batched mode against the fake server,
+    check both produce identical ordered output, and return their wall times.
+
+    Args:
+        n_chunks (int): Number of synthetic chunks.
+        latency (float): Simulated per-request latency in seconds.
+
+    Returns:
+        Tuple[float, float]: (serial seconds, batched seconds).
+    """
+    from src.embeddings_generator import Generator
+
+    chunks = [{"chapter": f"Chapter {i // 20}", "content": f"synthetic chunk {i} " * 40} for i in range(n_chunks)]
+
+    with FakeOpenAIServer(latency=latency) as server:
+        serial = Generator(chunks, batched=False, base_url=server.base_url, use_cache=False)
+        start = time.perf_counter()
+        serial_results = list(serial.generate_chunk_embeddings())
+        serial_time = time.perf_counter() - start
+
+        batched = Generator(chunks, batched=True, max_batch_size=32, base_url=server.base_url, use_cache=False)
+        start = time.perf_counter()
+        batched_results = list(batched.generate_chunk_embeddings())
+        batched_time = time.perf_counter() - start
+
+    assert [c for c, _ in serial_results] == chunks == [c for c, _ in batched_results]
+    assert [e for _, e in serial_results] == [e for _, e in batched_results]
+    return serial_time, batched_time
+
+
+if __name__ == "__main__":
+    serial_time, batched_time = compare_serial_and_batched()
+    print(f"Serial:  {serial_time:.2f}s")
+    print(f"Batched: {batched_time:.2f}s ({serial_time / batched_time:.1f}x faster)")
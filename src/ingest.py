@@ -0,0 +1,416 @@
+import os
+import json
+import time
+import queue
+import hashlib
+import argparse
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from src.chunker import Chunker
+from src.embeddings_generator import Generator, count_tokens
+from src.setup_vector_db import DB_setup_helper, chunk_hash
+
+_END = object()
+
+
+class PipelineAborted(Exception):
+    """
+    Raised inside a stage when another stage has failed.
+    """
+
+
+class ChapterDone:
+    """
+    Marker that follows the last chunk of a chapter through every stage; the store stage
+    checkpoints the chapter when it sees it.
+    """
+
+    def __init__(self, key: str) -> None:
+        self.key = key
+
+
+class StageStats:
+    """
+    Per-stage counters: items emitted, and time spent waiting for input (starved) or for
+    room downstream (blocked by backpressure). Shared by the stage's workers, so updates go through add().
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.items = 0
+        self.starved_seconds = 0.0
+        self.blocked_seconds = 0.0
+        self.started = 0.0
+        self.finished: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def add(self, items: int = 0, starved: float = 0.0, blocked: float = 0.0) -> None:
+        with self._lock:
+            self.items += items
+            self.starved_seconds += starved
+            self.blocked_seconds += blocked
+
+    def rate(self) -> float:
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        return self.items / elapsed if elapsed > 0 else 0.0
+
+
+class Pipeline:
+    """
+    Runs a source iterable through stages connected by bounded queues, one or more threads
+    per stage. Each stage is a function from an iterable of inputs to an iterable of outputs,
+    so stages overlap and a slow stage applies backpressure to those before it instead of
+    letting items pile up in memory. A failure in any stage aborts the others and is re-raised.
+
+    Attributes:
+        queue_size (int): Capacity of each queue between stages.
+        report_every (float): Seconds between progress lines.
+    """
+
+    def __init__(self, queue_size: int = 64, report_every: float = 10.0) -> None:
+        self.queue_size = queue_size
+        self.report_every = report_every
+        self.stages: List[Dict[str, Any]] = []
+        self._abort = threading.Event()
+        self._errors: List[BaseException] = []
+
+    def add(self, name: str, transform: Callable[[Iterable[Any]], Iterable[Any]], workers: int = 1) -> "Pipeline":
+        """
+        Append a stage.
+
+        Args:
+            name (str): Name used in throughput reports.
+            transform (Callable[[Iterable[Any]], Iterable[Any]]): Maps the stage's input stream to its output stream.
+                With several workers each gets its own share of the input.
+            workers (int): Threads running the transform.
+
+        Returns:
+            Pipeline: self, for chaining.
+        """
+        self.stages.append({"name": name, "transform": transform, "workers": workers, "stats": StageStats(name)})
+        return self
+
+    def _put(self, q: queue.Queue, item: Any, stats: Optional[StageStats]) -> None:
+        start = time.perf_counter()
+        while True:
+            if self._abort.is_set():
+                raise PipelineAborted()
+            try:
+                q.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        if stats:
+            stats.add(blocked=time.perf_counter() - start)
+
+    def _drain(self, q: queue.Queue, stats: StageStats) -> Iterator[Any]:
+        while True:
+            start = time.perf_counter()
+            while True:
+                if self._abort.is_set():
+                    raise PipelineAborted()
+                try:
+                    item = q.get(timeout=0.1)
+                    break
+                except queue.Empty:
+                    continue
+            stats.add(starved=time.perf_counter() - start)
+            if item is _END:
+                return
+            yield item
+
+    def _run_worker(self, stage: Dict[str, Any], inbox: queue.Queue, outbox: Optional[queue.Queue],
+                    downstream_workers: int, remaining: List[int], lock: threading.Lock) -> None:
+        stats: StageStats = stage["stats"]
+        try:
+            for item in stage["transform"](self._drain(inbox, stats)):
+                if not isinstance(item, ChapterDone):
+                    stats.add(items=1)
+                if outbox is not None:
+                    self._put(outbox, item, stats)
+            # The last worker of a stage to finish ends the stream for every downstream worker
+            with lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                stats.finished = time.perf_counter()
+                if outbox is not None:
+                    for _ in range(downstream_workers):
+                        self._put(outbox, _END, None)
+        except PipelineAborted:
+            pass
+        except BaseException as e:
+            self._errors.append(e)
+            self._abort.set()
+
+    def report(self) -> str:
+        return "  ".join(
+            f"{stage['name']}: {stage['stats'].items} ({stage['stats'].rate():,.1f}/s)" for stage in self.stages
+        )
+
+    def run(self, source: Iterable[Any]) -> List[StageStats]:
+        """
+        Feed the source through every stage and wait for the last one to finish.
+
+        Args:
+            source (Iterable[Any]): Items for the first stage.
+
+        Returns:
+            List[StageStats]: Throughput counters, one per stage.
+        """
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        threads: List[threading.Thread] = []
+        start = time.perf_counter()
+        for i, stage in enumerate(self.stages):
+            stage["stats"].started = start
+            outbox = queues[i + 1] if i + 1 < len(self.stages) else None
+            downstream = self.stages[i + 1]["workers"] if outbox is not None else 0
+            remaining, lock = [stage["workers"]], threading.Lock()
+            for w in range(stage["workers"]):
+                thread = threading.Thread(
+                    target=self._run_worker,
+                    args=(stage, queues[i], outbox, downstream, remaining, lock),
+                    name=f"{stage['name']}-{w}",
+                    daemon=True,
+                )
+                thread.start()
+                threads.append(thread)
+
+        def feed() -> None:
+            try:
+                for item in source:
+                    self._put(queues[0], item, None)
+                for _ in range(self.stages[0]["workers"]):
+                    self._put(queues[0], _END, None)
+            except PipelineAborted:
+                pass
+            except BaseException as e:
+                self._errors.append(e)
+                self._abort.set()
+
+        feeder = threading.Thread(target=feed, name="source", daemon=True)
+        feeder.start()
+
+        last_report = time.perf_counter()
+        for thread in [feeder] + threads:
+            while thread.is_alive():
+                thread.join(timeout=0.5)
+                if time.perf_counter() - last_report >= self.report_every:
+                    print(f"[{time.perf_counter() - start:.0f}s] {self.report()}")
+                    last_report = time.perf_counter()
+
+        if self._errors:
+            raise self._errors[0]
+        return [stage["stats"] for stage in self.stages]
+
+
+class IngestCheckpoint:
+    """
+    Records which chapters are fully stored, so an interrupted ingest resumes after them.
+    The checkpoint is tied to a fingerprint of the source text and chunking settings and
+    is discarded when they change.
+    """
+
+    def __init__(self, path: str, fingerprint: str) -> None:
+        self.path = path
+        self.fingerprint = fingerprint
+        self.done: Set[str] = set()
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get("fingerprint") == fingerprint:
+                    self.done = set(data["chapters"])
+            except Exception as e:
+                print("Ignoring unreadable ingest checkpoint:", e)
+
+    def mark_done(self, key: str) -> None:
+        with self._lock:
+            self.done.add(key)
+            tmp = self.path + ".tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({"fingerprint": self.fingerprint, "chapters": sorted(self.done)}, f)
+            os.replace(tmp, self.path)
+
+
+def chapter_key(chapter: Dict[str, str]) -> str:
+    return hashlib.sha256(f"{chapter['chapter']}\x00{chapter['content']}".encode('utf-8')).hexdigest()
+
+
+def ingest(
+    raw_text_path: str = 'assets/art_of_war_for_rag.txt',
+    checkpoint_path: str = 'assets/ingest_checkpoint.json',
+    chunk_workers: int = 8,
+    embed_workers: int = 4,
+    embed_batch_size: int = 256,
+    store_batch_size: int = 500,
+    queue_size: int = 64,
+    bulk: bool = True,
+    chunker_kwargs: Optional[Dict[str, Any]] = None,
+) -> List[StageStats]:
+    """
+    Clean, chunk, embed and store a book as one streaming pipeline.
+
+    Chapters flow through a chunk stage (chunk_workers threads), an embed stage that
+    batches chunks into embeddings requests (embed_workers in flight, results kept in
+    order), and a store stage that upserts batches by
+    content_hash. Chunks already stored are not re-embedded. Each chapter is checkpointed
+    once all its chunks are stored; a rerun skips checkpointed chapters.
+
+    Args:
+        raw_text_path (str): Raw book text.
+        checkpoint_path (str): Checkpoint file of completed chapters.
+        chunk_workers (int): Chapters chunked concurrently.
+        embed_workers (int): Embeddings requests in flight at once.
+        embed_batch_size (int): Maximum chunks per embeddings request.
+        store_batch_size (int): Rows per database transaction.
+        queue_size (int): Capacity of each queue between stages.
+        bulk (bool): Write rows with binary COPY instead of INSERTs.
+        chunker_kwargs (Optional[Dict[str, Any]]): Chunker settings, e.g. breakpoint_threshold_amount.
+
+    Returns:
+        List[StageStats]: Throughput counters for each stage.
+    """
+    with open(raw_text_path, encoding='iso-8859-1') as f:
+        raw_book = f.read()
+    chunker = Chunker(raw_book, **(chunker_kwargs or {}))
+    chapters = chunker.split_by_chapters(chunker.clean_book_file())
+
+    fingerprint = hashlib.sha256(
+        (raw_book + json.dumps(chunker_kwargs or {}, sort_keys=True)).encode('utf-8')
+    ).hexdigest()
+    checkpoint = IngestCheckpoint(checkpoint_path, fingerprint)
+    pending = [chapter for chapter in chapters if chapter_key(chapter) not in checkpoint.done]
+    print(f"{len(chapters) - len(pending)} chapters already ingested, {len(pending)} to go")
+
+    db_setup_helper = DB_setup_helper()
+    db_setup_helper.create_table()
+    stored = db_setup_helper.stored_hashes()
+    generator = Generator(max_batch_size=embed_batch_size, max_workers=embed_workers)
+    text_splitter = chunker.text_splitter()
+
+    def chunk_stage(chapters_in: Iterable[Dict[str, str]]) -> Iterator[Any]:
+        for chapter in chapters_in:
+            key = chapter_key(chapter)
+            for chunk in chunker.chunk_chapter(chapter, text_splitter):
+                yield {"chapter_key": key, "chunk": chunk, "hash": chunk_hash(chunk)}
+            yield ChapterDone(key)
+
+    def embed_stage(items: Iterable[Any]) -> Iterator[Any]:
+        batch: List[Dict[str, Any]] = []
+        batch_tokens = 0
+        # Requests in flight and chapter markers, in input order, so a marker still follows its chapter's chunks
+        pending: Deque[Tuple[Any, Optional[Future]]] = deque()
+
+        with ThreadPoolExecutor(max_workers=generator.max_workers, thread_name_prefix="embed-request") as executor:
+            def submit() -> None:
+                nonlocal batch, batch_tokens
+                if batch:
+                    texts = [item["chunk"]["content"] for item in batch]
+                    pending.append((batch, executor.submit(generator.embed_batch, texts)))
+                    batch, batch_tokens = [], 0
+
+            def ready(limit: int) -> Iterator[Any]:
+                # Emit finished entries from the front; block on the oldest while too many are pending
+                while pending and (len(pending) > limit or pending[0][1] is None or pending[0][1].done()):
+                    entry, future = pending.popleft()
+                    if future is None:
+                        yield entry
+                        continue
+                    for item, embedding in zip(entry, future.result()):
+                        yield {**item, "embedding": embedding}
+
+            for item in items:
+                if isinstance(item, ChapterDone):
+                    submit()
+                    pending.append((item, None))
+                elif item["hash"] not in stored:
+                    tokens = count_tokens(item["chunk"]["content"])
+                    if batch and (batch_tokens + tokens > generator.max_batch_tokens or len(batch) >= embed_batch_size):
+                        submit()
+                    batch.append(item)
+                    batch_tokens += tokens
+                yield from ready(generator.max_workers * 2)
+            submit()
+            yield from ready(0)
+
+    def store_stage(items: Iterable[Any]) -> Iterator[Any]:
+        rows: List[tuple] = []
+        failed: Set[str] = set()
+
+        def flush() -> None:
+            if rows:
+                db_setup_helper.upsert_rows(rows, bulk=bulk)
+                rows.clear()
+
+        for item in items:
+            if isinstance(item, ChapterDone):
+                flush()
+                if item.key in failed:
+                    print("Chapter left uncheckpointed after embedding failures; rerun to retry it")
+                else:
+                    checkpoint.mark_done(item.key)
+                yield item
+                continue
+            if item["embedding"] is None:
+                failed.add(item["chapter_key"])
+                continue
+            chunk = item["chunk"]
+            rows.append((chunk['content'], chunk['chapter'], item["embedding"], item["hash"]))
+            if len(rows) >= store_batch_size:
+                flush()
+            yield item
+        flush()
+
+    pipeline = (
+        Pipeline(queue_size=queue_size)
+        .add("chunk", chunk_stage, workers=chunk_workers)
+        .add("embed", embed_stage)
+        .add("store", store_stage)
+    )
+    start = time.perf_counter()
+    stats = pipeline.run(pending)
+    elapsed = time.perf_counter() - start
+
+    print(f"\n✅ Ingest finished in {elapsed:.1f}s")
+    print(f"{'stage':<8} {'items':>8} {'items/s':>9} {'starved s':>10} {'blocked s':>10}")
+    for stage in stats:
+        print(f"{stage.name:<8} {stage.items:>8} {stage.rate():>9.1f} "
+              f"{stage.starved_seconds:>10.1f} {stage.blocked_seconds:>10.1f}")
+
+    db_setup_helper.create_vector_index(method="hnsw")
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream a book through cleaning, chunking, embedding and storage.")
+    parser.add_argument("--raw-text", default="assets/art_of_war_for_rag.txt")
+    parser.add_argument("--checkpoint", default="assets/ingest_checkpoint.json")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and process every chapter")
+    parser.add_argument("--chunk-workers", type=int, default=8)
+    parser.add_argument("--embed-workers", type=int, default=4, help="Embeddings requests in flight")
+    parser.add_argument("--embed-batch-size", type=int, default=256)
+    parser.add_argument("--store-batch-size", type=int, default=500)
+    parser.add_argument("--queue-size", type=int, default=64)
+    parser.add_argument("--inserts", action="store_true", help="Write rows with INSERTs instead of binary COPY")
+    parser.add_argument("--threshold", type=float, default=50.0, help="Chunker breakpoint_threshold_amount")
+    args = parser.parse_args()
+
+    if args.restart and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+
+    ingest(
+        raw_text_path=args.raw_text,
+        checkpoint_path=args.checkpoint,
+        chunk_workers=args.chunk_workers,
+        embed_workers=args.embed_workers,
+        embed_batch_size=args.embed_batch_size,
+        store_batch_size=args.store_batch_size,
+        queue_size=args.queue_size,
+        bulk=not args.inserts,
+        chunker_kwargs={"breakpoint_threshold_amount": args.threshold},
+    )
@@ -0,0 +1,295 @@
+import json
+import time
+import uuid
+import logging
+import threading
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; spans range from sub-millisecond cache lookups to multi-second LLM streams
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(labelnames: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """
+    Monotonic counter with optional labels, rendered in the Prometheus text format.
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value:g}")
+        return lines
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram with optional labels, rendered in the Prometheus text format.
+    An observation is a scan over the bucket bounds and two additions under a lock.
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [bucket counts..., +Inf count], sum
+        self._series: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            series[0][index] += 1
+            series[1][0] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    bucket_labels = _format_labels(self.labelnames, key, 'le="%s"' % le)
+                    lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {total[0]:.6f}")
+                lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Holds the process's counters and histograms, plus stats callables (e.g. PgPool.stats)
+    whose numeric values are exported as gauges when /metrics is scraped.
+    """
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, Any] = {}
+        self._stats: Dict[str, Callable[[], Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        with self._lock:
+            return self._metrics.setdefault(name, Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        with self._lock:
+            return self._metrics.setdefault(name, Histogram(name, documentation, labelnames, buckets))
+
+    def register_stats(self, prefix: str, stats: Callable[[], Dict[str, Any]]) -> None:
+        """
+        Export each numeric value returned by stats() as a gauge named rag_<prefix>_<key>.
+        Registering the same prefix again replaces the previous source.
+
+        Args:
+            prefix (str): Metric name prefix, e.g. "db_pool".
+            stats (Callable[[], Dict[str, Any]]): Called on every scrape.
+        """
+        with self._lock:
+            self._stats[prefix] = stats
+
+    def render(self) -> str:
+        """
+        Returns every metric in the Prometheus text exposition format.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+            stats_sources = list(self._stats.items())
+
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        for prefix, stats in stats_sources:
+            try:
+                values = stats()
+            except Exception as e:
+                logger.warning("Could not collect %s stats: %s", prefix, e)
+                continue
+            for key, value in values.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    name = f"rag_{prefix}_{key}"
+                    lines.extend([f"# TYPE {name} gauge", f"{name} {value:g}"])
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.histogram("rag_stage_seconds", "Time spent in each query stage.", ["stage"])
+REQUEST_SECONDS = registry.histogram("rag_request_seconds", "End-to-end answer time.", ["outcome"])
+TIME_TO_FIRST_TOKEN = registry.histogram("rag_time_to_first_token_seconds", "Time from question to first answer token.")
+LLM_TOKENS = registry.counter("rag_llm_tokens_total", "Prompt and completion tokens reported by the chat API.", ["kind"])
+CACHE_LOOKUPS = registry.counter("rag_cache_lookups_total", "Cache lookups on the query path.", ["cache", "result"])
+ERRORS = registry.counter("rag_errors_total", "Failures and timeouts on the query path.", ["stage", "kind"])
+
+_current_trace: ContextVar[Optional["RequestTrace"]] = ContextVar("current_trace", default=None)
+
+
+def record_stage(stage: str, seconds: float, trace: Optional["RequestTrace"] = None) -> None:
+    """
+    Add a stage timing to the stage histogram and to the given or active request trace, if any.
+    """
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    trace = trace or _current_trace.get()
+    if trace is not None:
+        trace.add(stage, seconds)
+
+
+def record_error(stage: str, kind: str = "error", trace: Optional["RequestTrace"] = None) -> None:
+    """
+    Count a failure or timeout, and note it on the given or active request trace, if any.
+    """
+    ERRORS.inc(stage=stage, kind=kind)
+    trace = trace or _current_trace.get()
+    if trace is not None:
+        trace.errors.append(f"{stage}:{kind}")
+
+
+class span:
+    """
+    Context manager timing one stage of the query path:
+
+        with span("pgvector"):
+            rows = retriever.find_similar(embedding)
+
+    An exception leaving the block is counted in rag_errors_total and re-raised.
+    """
+
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage: str) -> None:
+        self.stage = stage
+
+    def __enter__(self) -> "span":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        record_stage(self.stage, time.perf_counter() - self.start)
+        # Cancellation (e.g. a branch timeout) is counted by whoever imposed it
+        if exc_type is not None and issubclass(exc_type, Exception):
+            record_error(self.stage)
+
+
+class RequestTrace:
+    """
+    Per-request stage breakdown, logged as a single JSON line when the request finishes.
+
+    Spans record into the trace that is active in their context. Activate it only around
+    code that does not yield (see active()); threads started for the request must be given
+    a copy of the context (contextvars.copy_context().run).
+
+    Attributes:
+        request_id (str): Short random id included in the log line.
+        stages (Dict[str, float]): Seconds per stage, summed over repeats.
+        fields (Dict[str, Any]): Extra values for the log line (cache result, token counts, ...).
+        errors (List[str]): "stage:kind" entries for failures and timeouts.
+    """
+
+    def __init__(self) -> None:
+        self.request_id = uuid.uuid4().hex[:12]
+        self.start = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.fields: Dict[str, Any] = {}
+        self.errors: List[str] = []
+        self._first_token_at: Optional[float] = None
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def active(self) -> "_ActiveTrace":
+        """
+        Make this the current trace for the duration of a with block.
+        """
+        return _ActiveTrace(self)
+
+    def first_token(self) -> None:
+        """
+        Mark the first answer token; later calls are ignored.
+        """
+        if self._first_token_at is None:
+            self._first_token_at = time.perf_counter()
+            TIME_TO_FIRST_TOKEN.observe(self._first_token_at - self.start)
+
+    def finish(self, outcome: str) -> None:
+        """
+        Record the request duration and log the breakdown.
+
+        Args:
+            outcome (str): "ok", "cached", "error" or "abandoned".
+        """
+        elapsed = time.perf_counter() - self.start
+        REQUEST_SECONDS.observe(elapsed, outcome=outcome)
+        if logger.isEnabledFor(logging.INFO):
+            entry = {
+                "event": "query",
+                "request_id": self.request_id,
+                "outcome": outcome,
+                "total_ms": round(elapsed * 1000, 1),
+                "ttft_ms": round((self._first_token_at - self.start) * 1000, 1) if self._first_token_at else None,
+                "stages_ms": {stage: round(seconds * 1000, 1) for stage, seconds in self.stages.items()},
+                **self.fields,
+            }
+            if self.errors:
+                entry["errors"] = self.errors
+            logger.info(json.dumps(entry))
+
+
+class _ActiveTrace:
+    __slots__ = ("trace", "token")
+
+    def __init__(self, trace: RequestTrace) -> None:
+        self.trace = trace
+
+    def __enter__(self) -> RequestTrace:
+        self.token = _current_trace.set(self.trace)
+        return self.trace
+
+    def __exit__(self, *exc) -> None:
+        _current_trace.reset(self.token)
+
+
+def record_usage(usage: Any, trace: Optional[RequestTrace] = None) -> None:
+    """
+    Count the prompt and completion tokens of a chat completion's usage block.
+    """
+    if usage is None:
+        return
+    LLM_TOKENS.inc(usage.prompt_tokens, kind="prompt")
+    LLM_TOKENS.inc(usage.completion_tokens, kind="completion")
+    if trace is not None:
+        trace.fields["prompt_tokens"] = usage.prompt_tokens
+        trace.fields["completion_tokens"] = usage.completion_tokens
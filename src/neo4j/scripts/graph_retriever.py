@@ -1,41 +1,218 @@
 import os
-from typing import List, Dict, Optional, Tuple, Any
+import json
+import time
+import asyncio
+import logging
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Tuple, Any, Iterable
 from dotenv import load_dotenv
-from neo4j import GraphDatabase, Driver
+from neo4j import GraphDatabase, Driver, AsyncGraphDatabase, AsyncDriver
 from src.spacy_helper import get_spacy_helper
+from src.metrics import record_error, span
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+
+class GenericSamplePool:
+    """
+    Precomputed per-label pools of chunk contents for generic questions ("who", "when", "battle").
+
+    Sampling a label's chunks straight from the graph touches every entity of that label and
+    every chunk linked to it. Instead, each label's pool (one random chunk per entity, for up to
+    pool_size entities) is computed once, cached to a local JSON file, and refreshed in the
+    background once it is older than refresh_seconds. Requests then draw from memory.
+
+    The entity loader rebuilds the file after reloading the graph (see load_entities.py);
+    running pools notice the rewritten file within check_seconds and load it.
+
+    Attributes:
+        pool_size (int): Maximum chunks kept per label.
+        refresh_seconds (float): Age after which pools are rebuilt.
+        cache_path (str): Local JSON file the pools are persisted to.
+        check_seconds (float): Interval between checks for a file rewritten by another process.
+    """
+
+    POOL_QUERY = """
+        MATCH (e:{label})-[:MENTIONED_IN]->(c:CHUNK)
+        WITH e, collect(c.content) AS contents
+        ORDER BY rand()
+        LIMIT $pool_size
+        RETURN contents[toInteger(rand() * size(contents))] AS content
+    """
+
+    def __init__(
+        self,
+        driver: Driver,
+        labels: Iterable[str],
+        pool_size: int = 200,
+        refresh_seconds: float = 3600.0,
+        cache_path: str = os.getenv("GENERIC_POOL_PATH", "assets/generic_pool.json"),
+        check_seconds: float = 30.0,
+    ) -> None:
+        """
+        Load pools from the local cache, rebuilding them from the graph if missing or stale.
+
+        Args:
+            driver (Driver): Neo4j driver used to build the pools.
+            labels (Iterable[str]): Entity labels to keep pools for.
+            pool_size (int): Maximum chunks kept per label.
+            refresh_seconds (float): Age after which pools are rebuilt.
+            cache_path (str): Local JSON file the pools are persisted to.
+            check_seconds (float): Interval between checks for a file rewritten by another process.
+        """
+        self.driver = driver
+        self.labels = sorted(set(labels))
+        self.pool_size = pool_size
+        self.refresh_seconds = refresh_seconds
+        self.cache_path = cache_path
+        self.check_seconds = check_seconds
+        self.pools: Dict[str, List[str]] = {}
+        self.built_at = 0.0
+        self._last_attempt = 0.0
+        self._cache_mtime = 0.0
+        self._checked_at = time.time()
+        self._refreshing = threading.Lock()
+
+        self._load_cache()
+        if self._is_stale():
+            self.refresh()
+
+    def _load_cache(self) -> None:
+        if not os.path.exists(self.cache_path):
+            return
+        try:
+            self._cache_mtime = os.path.getmtime(self.cache_path)
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.pools = data["pools"]
+            self.built_at = data["built_at"]
+        except Exception as e:
+            print("Ignoring unreadable generic sample cache:", e)
+
+    def _is_stale(self) -> bool:
+        return any(label not in self.pools for label in self.labels) or \
+            time.time() - self.built_at > self.refresh_seconds
+
+    def _reload_if_rewritten(self) -> None:
+        """
+        Load the cache file if another process (e.g. the entity loader) rewrote it, checking at most every check_seconds.
+        """
+        now = time.time()
+        if now - self._checked_at < self.check_seconds:
+            return
+        self._checked_at = now
+        try:
+            rewritten = os.path.getmtime(self.cache_path) > self._cache_mtime
+        except OSError:
+            return
+        if rewritten:
+            self._load_cache()
+
+    def refresh(self) -> None:
+        """
+        Rebuild every label's pool from the graph and persist it. Concurrent calls are skipped.
+        """
+        if not self._refreshing.acquire(blocking=False):
+            return
+        self._last_attempt = time.time()
+        try:
+            pools: Dict[str, List[str]] = {}
+            with self.driver.session() as session:
+                for label in self.labels:
+                    result = session.run(self.POOL_QUERY.format(label=label), {"pool_size": self.pool_size})
+                    pools[label] = [record["content"] for record in result if record["content"]]
+
+            # Swap in the complete pools at once so readers never see a partial refresh
+            self.pools = pools
+            self.built_at = time.time()
+
+            # Written atomically, since other processes' pools may load the file at any time
+            os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+            tmp_path = self.cache_path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"built_at": self.built_at, "pools": pools}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.cache_path)
+            self._cache_mtime = os.path.getmtime(self.cache_path)
+        except Exception as e:
+            print("Failed to refresh generic sample pools:", e)
+        finally:
+            self._refreshing.release()
+
+    def sample(self, label: str, k: int = 10) -> List[str]:
+        """
+        Draw up to k chunks for a label, scheduling a background refresh if the pools are stale.
+
+        Args:
+            label (str): Entity label, e.g. "PERSON".
+            k (int): Number of chunks to draw.
+
+        Returns:
+            List[str]: Chunk contents.
+        """
+        self._reload_if_rewritten()
+        # Retry failed refreshes at most once a minute rather than on every request
+        if self._is_stale() and time.time() - self._last_attempt > 60 and not self._refreshing.locked():
+            threading.Thread(target=self.refresh, daemon=True).start()
+        pool = self.pools.get(label, [])
+        return random.sample(pool, min(k, len(pool)))
+
 class GraphModel:
     """
     GraphModel interacts with a Neo4j graph to retrieve document chunks 
     related to named entities and generic entity categories found in user queries.
     """
 
-    def __init__(self, max_chunks: int = 25):
+    LABEL_MAP = {
+        "people": "PERSON",
+        "person": "PERSON",
+        "who": "PERSON",
+        "historical figure": "PERSON",
+        "event": "EVENT",
+        "events": "EVENT",
+        "battle": "EVENT",
+        "dynasty": "DATE",
+        "when": "DATE",
+        "period": "DATE",
+        "place": "LOC",
+        "location": "LOC"
+    }
+
+    def __init__(self, max_chunks: int = 25, max_workers: int = 32):
         """
         Initializes the GraphModel with a spaCy helper and Neo4j driver.
 
+        The model holds no per-request state, so one instance can serve concurrent requests;
+        each query runs in its own session borrowed from the driver's connection pool.
+
         Args:
             max_chunks (int): Maximum number of text chunks to return.
+            max_workers (int): Threads shared by all requests for running queries in parallel.
         """
         self.spacy_helper = get_spacy_helper()
-        self.queries: List[Tuple[str, Dict[str, Any]]] = []
         self.MAX_CHUNKS = max_chunks
         self.driver: Driver = GraphDatabase.driver(
             os.getenv('NEO4J_URI'),
             auth=(os.getenv('NEO4J_USER'), os.getenv('NEO4J_PASSWORD'))
         )
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="neo4j")
+        self.generic_pool = GenericSamplePool(self.driver, self.LABEL_MAP.values())
 
-    def build_query(self, entities: List[Dict[str, str]]) -> None:
+    def build_query(self, entities: List[Dict[str, str]]) -> Optional[Tuple[str, Dict[str, Any]]]:
         """
-        Builds and stores a Cypher query for specific named entities.
+        Builds a Cypher query for chunks mentioning all of the given named entities.
 
         Args:
             entities (List[Dict[str, str]]): List of entities with 'text' and 'label' keys.
+
+        Returns:
+            Optional[Tuple[str, Dict[str, Any]]]: The query and its parameters, or None if there are no entities.
         """
         if not entities:
-            return
+            return None
 
         match_clauses = []
         params: Dict[str, str] = {}
@@ -48,115 +225,195 @@ class GraphModel:
                 f"MATCH ({var}:{label} {{name: $name{i}}})-[:MENTIONED_IN]->(c:CHUNK)"
             )
             params[f"name{i}"] = name
-            params[f"label{i}"] = label
 
         query = "\n".join(match_clauses) + "\nRETURN DISTINCT c.content AS content"
-        self.queries.append((query, params))
+        return query, params
 
-    def build_generic_query(self, generics: List[str]) -> int:
+    def generic_labels(self, generics: List[str]) -> List[str]:
         """
-        Builds and stores generic entity queries (e.g., for 'event', 'place').
+        Maps generic words (e.g., 'event', 'place') to distinct entity labels.
 
         Args:
             generics (List[str]): List of generic entity types extracted from the user query.
 
         Returns:
-            int: Number of generic queries added.
-        """
-        label_map = {
-            "people": "PERSON",
-            "person": "PERSON",
-            "who": "PERSON",
-            "historical figure": "PERSON",
-            "event": "EVENT",
-            "events": "EVENT",
-            "battle": "EVENT",
-            "dynasty": "DATE",
-            "when": "DATE",
-            "period": "DATE",
-            "place": "LOC",
-            "location": "LOC"
-        }
-
-        queries_added = 0
-
-        for i, word in enumerate(generics):
-            label = label_map.get(word.lower())
-            if not label:
-                continue
-
-            query = f"""
-                MATCH (e:{label})-[:MENTIONED_IN]->(c:CHUNK)
-                WITH e, c
-                ORDER BY e, rand() 
-                WITH e, collect(c)[0] AS one_chunk 
-                RETURN one_chunk.content AS content
-                LIMIT 10
-            """
-            self.queries.append((query, {}))
-            queries_added += 1
-
-        return queries_added
-
-    def execute_newest_query(self) -> List[str]:
-        """
-        Executes the most recent Cypher query in the queue.
+            List[str]: Entity labels, in first-mentioned order.
+        """
+        labels = []
+        for word in generics:
+            label = self.LABEL_MAP.get(word.lower())
+            if label and label not in labels:
+                labels.append(label)
+        return labels
+
+    def execute_query(self, query: str, params: Dict[str, Any]) -> List[str]:
+        """
+        Executes a single Cypher query in its own session.
+
+        Args:
+            query (str): Cypher query.
+            params (Dict[str, Any]): Query parameters.
 
         Returns:
             List[str]: List of chunk contents.
         """
-        if not self.queries:
+        try:
+            with self.driver.session() as session:
+                return [record["content"] for record in session.run(query, params)]
+        except Exception as e:
+            record_error("neo4j")
+            logger.warning("Neo4j query failed: %s", e)
             return []
 
-        query, params = self.queries[-1]
+    def execute_entity_query(self, entities: List[Dict[str, str]]) -> List[str]:
+        """
+        Retrieves chunks mentioning all given entities, falling back to chunks for each
+        entity separately when they never appear together.
 
-        try:
-            with self.driver.session() as session:
-                result = list(session.run(query, params))
-                chunks = [record["content"] for record in result]
+        Args:
+            entities (List[Dict[str, str]]): List of entities with 'text' and 'label' keys.
 
-                # Fallback if no combined chunk was found
-                if not chunks and len(params.keys()) >= 3:
-                    print('no combined chunks')
-                    for key, value in list(params.items()):
-                        if key.startswith("name"):
-                            label_key = key.replace("name", "label")
-                            label_value = params.get(label_key)
+        Returns:
+            List[str]: List of chunk contents.
+        """
+        plan = self.build_query(entities)
+        if plan is None:
+            return []
+        chunks = self.execute_query(*plan)
 
-                            if label_value is None:
-                                print(f"Could not find label for {key}")
-                                continue
+        # Fallback if no combined chunk was found
+        if not chunks and len(entities) >= 2:
+            logger.debug("No chunk mentions all of %d entities, querying them separately", len(entities))
+            for entity_chunks in self.executor.map(lambda e: self.execute_query(*self.build_query([e])), entities):
+                chunks += entity_chunks
+
+        return chunks
 
-                            self.build_query([{"text": value, "label": label_value}])
-                            chunks += self.execute_newest_query()
+    def run(self, user_message: str) -> List[str]:
+        """
+        Main entry point. Parses user message, runs the entity query, and draws
+        chunks for generic words from the precomputed sample pools.
+        All query state is local to the call.
 
-                return chunks
+        Args:
+            user_message (str): The user's natural language input.
+
+        Returns:
+            List[str]: Text chunks retrieved from the graph, entity matches first.
+        """
+        with span("spacy_parse"):
+            named_entities, generics = self.spacy_helper.parse_user_query_for_entities(user_message)
+
+        # The entity query runs on the calling thread; its fallback fans out on the pool,
+        # so it must not itself occupy a pool worker while waiting
+        with span("neo4j"):
+            chunks = self.execute_entity_query(named_entities)
+        for label in self.generic_labels(generics):
+            chunks += self.generic_pool.sample(label, k=10)
+
+        if len(chunks) > self.MAX_CHUNKS:
+            chunks = chunks[:self.MAX_CHUNKS]
 
+        return chunks
+
+
+class AsyncGraphModel(GraphModel):
+    """
+    Async counterpart of GraphModel for asyncio servers. Builds the same queries, but runs
+    them on Neo4j's async driver, so a request waiting on the graph holds no thread.
+    Generic words are still served from a GenericSamplePool, refreshed in the background
+    over a sync driver.
+    """
+
+    def __init__(self, max_chunks: int = 25):
+        """
+        Initializes the model with a spaCy helper and async Neo4j driver.
+
+        Args:
+            max_chunks (int): Maximum number of text chunks to return.
+        """
+        self.spacy_helper = get_spacy_helper()
+        self.MAX_CHUNKS = max_chunks
+        auth = (os.getenv('NEO4J_USER'), os.getenv('NEO4J_PASSWORD'))
+        self.driver: AsyncDriver = AsyncGraphDatabase.driver(os.getenv('NEO4J_URI'), auth=auth)
+        self.generic_pool = GenericSamplePool(
+            GraphDatabase.driver(os.getenv('NEO4J_URI'), auth=auth), self.LABEL_MAP.values()
+        )
+
+    async def execute_query(self, query: str, params: Dict[str, Any]) -> List[str]:
+        """
+        Executes a single Cypher query in its own async session.
+
+        Args:
+            query (str): Cypher query.
+            params (Dict[str, Any]): Query parameters.
+
+        Returns:
+            List[str]: List of chunk contents.
+        """
+        try:
+            async with self.driver.session() as session:
+                result = await session.run(query, params)
+                return [record["content"] async for record in result]
         except Exception as e:
-            print("Neo4j query failed:", e)
+            record_error("neo4j")
+            logger.warning("Neo4j query failed: %s", e)
             return []
 
-    def run(self, user_message: str) -> List[str]:
+    async def execute_entity_query(self, entities: List[Dict[str, str]]) -> List[str]:
         """
-        Main entry point. Parses user message, builds and runs appropriate queries.
+        Retrieves chunks mentioning all given entities, falling back to chunks for each
+        entity separately (queried concurrently) when they never appear together.
 
         Args:
-            user_message (str): The user's natural language input.
+            entities (List[Dict[str, str]]): List of entities with 'text' and 'label' keys.
 
         Returns:
-            List[str]: Text chunks retrieved from the graph.
+            List[str]: List of chunk contents.
         """
-        named_entities, generics = self.spacy_helper.parse_user_query_for_entities(user_message)
+        plan = self.build_query(entities)
+        if plan is None:
+            return []
+        chunks = await self.execute_query(*plan)
+
+        # Fallback if no combined chunk was found
+        if not chunks and len(entities) >= 2:
+            logger.debug("No chunk mentions all of %d entities, querying them separately", len(entities))
+            results = await asyncio.gather(*(self.execute_query(*self.build_query([e])) for e in entities))
+            for entity_chunks in results:
+                chunks += entity_chunks
+
+        return chunks
+
+    async def run(self, user_message: str) -> List[str]:
+        """
+        Main entry point. Parses user message, runs the entity query, and draws
+        chunks for generic words from the precomputed sample pools.
+
+        Args:
+            user_message (str): The user's natural language input.
 
-        self.build_query(named_entities)
-        chunks = self.execute_newest_query()
+        Returns:
+            List[str]: Text chunks retrieved from the graph, entity matches first.
+        """
+        # Parsing one short question takes a few milliseconds, so it runs on the event loop
+        with span("spacy_parse"):
+            named_entities, generics = self.spacy_helper.parse_user_query_for_entities(user_message)
 
-        if generics:
-            generic_query_count = self.build_generic_query(generics)
-            for _ in range(generic_query_count):
-                chunks += self.execute_newest_query()
+        with span("neo4j"):
+            chunks = await self.execute_entity_query(named_entities)
+        for label in self.generic_labels(generics):
+            # sample() may stat and re-read the pool file, so it runs off the event loop
+            chunks += await asyncio.to_thread(self.generic_pool.sample, label, 10)
 
         if len(chunks) > self.MAX_CHUNKS:
             chunks = chunks[:self.MAX_CHUNKS]
 
         return chunks
+
+    async def close(self) -> None:
+        """
+        Close both drivers.
+        """
+        await self.driver.close()
+        self.generic_pool.driver.close()
@@ -1,8 +1,13 @@
-import os
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Dict, Any, List
 import pandas as pd
-from typing import Dict, Any
-from neo4j import GraphDatabase, Transaction, Driver
+from neo4j import Transaction, Driver
 from dotenv import load_dotenv
+from src.neo4j.scripts.create_schema import get_driver
+from src.neo4j.scripts.graph_retriever import GenericSamplePool, GraphModel
 
 # Load environment variables from .env file
 load_dotenv()
@@ -13,45 +18,164 @@ ENTITIES = [
     "NORP", "EVENT", "LOC", "LAW", "FAC", "LANGUAGE"
 ]
 
-# Load CSV file containing entity data
-df: pd.DataFrame = pd.read_csv("assets/entities.csv")
+CHUNK_QUERY = """
+    UNWIND $chunk_ids AS chunk_id
+    MERGE (:CHUNK {id: chunk_id})
+"""
 
-# Initialize the Neo4j driver
-driver: Driver = GraphDatabase.driver(
-    "bolt://localhost:7687",
-    auth=("neo4j", os.getenv('NEO4J_PASSWORD'))
-)
 
-def load_entities(tx: Transaction, row: Dict[str, Any]) -> None:
+@lru_cache(maxsize=None)
+def build_entity_query(label: str) -> str:
     """
-    Write a row of entity data into the Neo4j database using MERGE statements.
-    
-    Ensures the entity is associated with a chunk and labeled correctly.
+    Build the batched MERGE query for one label. Labels cannot be parameters in Cypher,
+    so there is one query string per label; each is built once and reused for every
+    batch, letting Neo4j cache one plan per label.
 
     Args:
-        tx (Transaction): The Neo4j transaction object.
-        row (Dict[str, Any]): A row from the CSV containing entity data.
+        label (str): Entity label.
+
+    Returns:
+        str: The UNWIND ... MERGE query.
 
     Raises:
         ValueError: If the entity label is not in the expected list.
     """
-    label: str = row["label"]
     if label not in ENTITIES:
         raise ValueError(f"unexpected entity label: {label}")
 
-    query: str = f"""
-        MERGE (c:Chunk {{id: $chunk_id}})
-        MERGE (e:Entity:{label} {{name: $entity_text, type: $entity_type}})
+    return f"""
+        UNWIND $rows AS row
+        MATCH (c:CHUNK {{id: row.chunk_id}})
+        MERGE (e:Entity:{label} {{name: row.entity_text, type: $entity_type}})
         MERGE (e)-[:MENTIONED_IN]->(c)
     """
 
-    tx.run(
-        query,
-        chunk_id=row["chunk_id"],
-        entity_text=row["entity_text"],
-        entity_type=label
-    )
 
-# Apply the entity creation for each row in the dataframe
-with driver.session() as session:
-    for _, row in df.iterrows():
+def ensure_indexes(driver: Driver) -> None:
+    """
+    Create the lookup indexes the MERGE/MATCH clauses rely on; without them every row is a label scan.
+
+    Args:
+        driver (Driver): The Neo4j driver instance.
+    """
+    with driver.session() as session:
+        # Same constraint as create_schema.py; its backing index serves the chunk lookups
+        session.run("CREATE CONSTRAINT IF NOT EXISTS FOR (c:CHUNK) REQUIRE c.id IS UNIQUE")
+        for label in ENTITIES:
+            session.run(f"CREATE INDEX IF NOT EXISTS FOR (e:{label}) ON (e.name)")
+        session.run("CALL db.awaitIndexes()")
+
+
+def load_chunks(tx: Transaction, chunk_ids: List[Any]) -> None:
+    """
+    Merge a batch of chunk nodes.
+
+    Args:
+        tx (Transaction): The Neo4j transaction object.
+        chunk_ids (List[Any]): Chunk ids to merge.
+    """
+    tx.run(CHUNK_QUERY, chunk_ids=chunk_ids)
+
+
+def load_entities(tx: Transaction, label: str, rows: List[Dict[str, Any]]) -> None:
+    """
+    Write a batch of entity rows of a single label, linking each entity to its chunk.
+
+    Args:
+        tx (Transaction): The Neo4j transaction object.
+        label (str): Entity label shared by every row in the batch.
+        rows (List[Dict[str, Any]]): Rows with 'chunk_id' and 'entity_text' keys.
+    """
+    tx.run(build_entity_query(label), rows=rows, entity_type=label)
+
+
+def load_label(driver: Driver, label: str, rows: List[Dict[str, Any]], batch_size: int) -> int:
+    """
+    Load every row of one label in batches, one transaction per batch.
+    Transient failures (e.g. deadlocks with other writers) are retried by execute_write.
+
+    Returns:
+        int: Number of rows written.
+    """
+    with driver.session() as session:
+        for start in range(0, len(rows), batch_size):
+            session.execute_write(load_entities, label, rows[start:start + batch_size])
+    return len(rows)
+
+
+def bulk_load(driver: Driver, df: pd.DataFrame, batch_size: int = 5000, parallel_writers: int = 4) -> None:
+    """
+    Load an entities dataframe: chunks first, then each label's entities in batched
+    UNWIND transactions, with up to parallel_writers labels written concurrently.
+
+    Args:
+        driver (Driver): The Neo4j driver instance.
+        df (pd.DataFrame): Rows with 'chunk_id', 'entity_text' and 'label' columns.
+        batch_size (int): Rows per transaction.
+        parallel_writers (int): Labels loaded concurrently (1 loads them serially).
+    """
+    unexpected = set(df["label"]) - set(ENTITIES)
+    if unexpected:
+        raise ValueError(f"unexpected entity labels: {sorted(unexpected)}")
+
+    start = time.perf_counter()
+    ensure_indexes(driver)
+
+    # Creating every chunk up front means concurrent label writers only MATCH chunks
+    chunk_ids = pd.unique(df["chunk_id"]).tolist()
+    with driver.session() as session:
+        for i in range(0, len(chunk_ids), batch_size):
+            session.execute_write(load_chunks, chunk_ids[i:i + batch_size])
+    print(f"✅ Merged {len(chunk_ids)} chunks")
+
+    df = df.drop_duplicates(subset=["chunk_id", "entity_text", "label"])
+    rows_by_label = {
+        label: [{"chunk_id": c, "entity_text": t}
+                for c, t in zip(group["chunk_id"].tolist(), group["entity_text"].tolist())]
+        for label, group in df.groupby("label")
+    }
+
+    with ThreadPoolExecutor(max_workers=max(1, parallel_writers)) as executor:
+        futures = {label: executor.submit(load_label, driver, label, rows, batch_size)
+                   for label, rows in rows_by_label.items()}
+        for label, future in futures.items():
+            print(f"✅ {label}: {future.result()} rows")
+
+    elapsed = time.perf_counter() - start
+    print(f"Loaded {len(df)} rows in {elapsed:.1f}s ({len(df) / elapsed:,.0f} rows/sec)")
+
+    refresh_generic_pools(driver)
+
+
+def refresh_generic_pools(driver: Driver) -> None:
+    """
+    Rebuild the generic sample pools from the reloaded graph. Running GraphModels pick up
+    the rewritten pool file within GenericSamplePool.check_seconds.
+
+    Args:
+        driver (Driver): The Neo4j driver instance.
+    """
+    started = time.time()
+    pool = GenericSamplePool(driver, GraphModel.LABEL_MAP.values(), refresh_seconds=float("inf"))
+    # The constructor already rebuilt the pools if the file was missing or incomplete
+    if pool.built_at < started:
+        pool.refresh()
+    if pool.built_at >= started:
+        print(f"✅ Rebuilt generic sample pools for {len(pool.pools)} labels")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk load entities.csv into Neo4j.")
+    parser.add_argument("--csv", default="assets/entities.csv")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--writers", type=int, default=4, help="Labels loaded concurrently")
+    args = parser.parse_args()
+
+    # Load CSV file containing entity data
+    df: pd.DataFrame = pd.read_csv(args.csv)
+
+    driver = get_driver()
+    try:
+        bulk_load(driver, df, batch_size=args.batch_size, parallel_writers=args.writers)
+    finally:
+        driver.close()
@@ -0,0 +1,151 @@
+import os
+import json
+import hashlib
+from typing import Any, Dict, List, Optional, Sequence
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEFAULT_SNAPSHOT_PATH = os.getenv("VECTOR_SNAPSHOT_PATH", "assets/vector_snapshot")
+
+
+class NumpyRetriever:
+    """
+    In-process vector search over a snapshot of 'art_of_war_book_english'.
+
+    Embeddings are held as a contiguous, L2-normalized float32 matrix memory-mapped from
+    disk, so cosine similarity is a single matrix product. Implements the same
+    find_similar(embedding, limit) contract as Retriever, with no database round trip.
+
+    Attributes:
+        snapshot_path (str): Directory holding embeddings.npy and chunks.json.
+        embeddings (np.ndarray): (n_chunks, dim) normalized embedding matrix.
+        rows (List[Dict[str, Any]]): id, chunk and chapter for each matrix row.
+        version (str): Digest of the snapshot's chunks, comparable with the PostgreSQL corpus version.
+    """
+
+    EMBEDDINGS_FILE = "embeddings.npy"
+    ROWS_FILE = "chunks.json"
+
+    def __init__(self, snapshot_path: str = DEFAULT_SNAPSHOT_PATH) -> None:
+        """
+        Load a snapshot written by build_snapshot.
+
+        Args:
+            snapshot_path (str): Directory holding the snapshot files.
+        """
+        self.snapshot_path = snapshot_path
+        embeddings_path = os.path.join(snapshot_path, self.EMBEDDINGS_FILE)
+        rows_path = os.path.join(snapshot_path, self.ROWS_FILE)
+        if not os.path.exists(embeddings_path):
+            raise FileNotFoundError(f"Vector snapshot not found: {embeddings_path} (run python -m src.numpy_retriever)")
+
+        self.embeddings: np.ndarray = np.load(embeddings_path, mmap_mode='r')
+        with open(rows_path, 'r', encoding='utf-8') as f:
+            self.rows: List[Dict[str, Any]] = json.load(f)
+        self.version = self._digest(self.rows)
+
+    @staticmethod
+    def _digest(rows: List[Dict[str, Any]]) -> str:
+        """
+        md5 of the sorted content hashes joined by ',', as answer_cache.corpus_version() computes
+        it in PostgreSQL. Content hashes are setup_vector_db.chunk_hash() of chapter and text.
+        """
+        hashes = sorted(
+            hashlib.sha256(f"{row['chapter']}\x00{row['chunk']}".encode('utf-8')).hexdigest() for row in rows
+        )
+        return hashlib.md5(",".join(hashes).encode('utf-8')).hexdigest()
+
+    def corpus_version(self) -> str:
+        """
+        Identify the corpus this snapshot serves, see answer_cache.corpus_version().
+        """
+        return self.version
+
+    @staticmethod
+    def build_snapshot(snapshot_path: str = DEFAULT_SNAPSHOT_PATH) -> int:
+        """
+        Export every chunk and embedding from PostgreSQL into a snapshot directory.
+
+        Args:
+            snapshot_path (str): Directory to write the snapshot files to.
+
+        Returns:
+            int: Number of chunks exported.
+        """
+        from src.db_pool import db_pool
+
+        with db_pool.connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                SELECT id, chunk, chapter, embedding::text
+                FROM art_of_war_book_english
+                WHERE embedding IS NOT NULL
+                ORDER BY id;
+            """)
+            records = cur.fetchall()
+
+        rows = [{"id": r[0], "chunk": r[1], "chapter": r[2]} for r in records]
+        matrix = np.array([np.array(r[3][1:-1].split(','), dtype=np.float32) for r in records], dtype=np.float32)
+        if len(matrix):
+            matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+
+        os.makedirs(snapshot_path, exist_ok=True)
+        np.save(os.path.join(snapshot_path, NumpyRetriever.EMBEDDINGS_FILE), np.ascontiguousarray(matrix))
+        with open(os.path.join(snapshot_path, NumpyRetriever.ROWS_FILE), 'w', encoding='utf-8') as f:
+            json.dump(rows, f, ensure_ascii=False)
+        return len(rows)
+
+    def _top_k(self, scores: np.ndarray, limit: int) -> List[List[Dict[str, Any]]]:
+        """
+        Turn a (n_queries, n_chunks) similarity matrix into ranked result rows.
+        """
+        k = min(limit, scores.shape[1])
+        if k <= 0:
+            return [[] for _ in range(scores.shape[0])]
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+        order = np.argsort(-candidate_scores, axis=1)
+        ranked = np.take_along_axis(candidates, order, axis=1)
+
+        return [
+            [{**self.rows[i], "similarity": float(scores[q, i])} for i in ranked[q]]
+            for q in range(scores.shape[0])
+        ]
+
+    def find_similar_batch(self, embeddings: Sequence[List[float]], limit: int = 5) -> List[List[Dict[str, Any]]]:
+        """
+        Find the most similar chunks for several query embeddings at once.
+
+        Args:
+            embeddings (Sequence[List[float]]): Query embedding vectors.
+            limit (int): Maximum number of results per query.
+
+        Returns:
+            List[List[Dict[str, Any]]]: Matching rows with similarity scores, one list per query.
+        """
+        queries = np.array(embeddings, dtype=np.float32)
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+        return self._top_k(queries @ self.embeddings.T, limit)
+
+    def find_similar(self, embedding: List[float], limit: int = 5) -> Optional[List[Dict[str, Any]]]:
+        """
+        Find the most similar text chunks based on cosine similarity.
+
+        Args:
+            embedding (List[float]): The query embedding vector.
+            limit (int): Maximum number of results to return.
+
+        Returns:
+            Optional[List[Dict[str, Any]]]: A list of matching rows with similarity scores.
+        """
+        try:
+            return self.find_similar_batch([embedding], limit)[0]
+        except Exception as e:
+            print('Error while retrieving similar chunks:', e)
+            return None
+
+
+if __name__ == "__main__":
+    count = NumpyRetriever.build_snapshot()
+    print(f"✅ Wrote {count} chunks to {DEFAULT_SNAPSHOT_PATH}")
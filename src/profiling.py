@@ -0,0 +1,254 @@
+import os
+import sys
+import time
+import uuid
+import random
+import logging
+import cProfile
+import pstats
+import threading
+from collections import Counter
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, TypeVar
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Fraction of enter_query calls profiled without being asked to; e.g. 0.001 in production
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+# "sampling" writes folded stacks (flamegraph.pl, speedscope); "cprofile" writes a pstats file
+PROFILE_MODE = os.getenv("PROFILE_MODE", "sampling")
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL_MS", "2")) / 1000
+PROFILE_DIR = os.getenv("PROFILE_DIR", "assets/profiles")
+# Clients may request a profile with this header only when PROFILE_ALLOW_HEADER is set
+PROFILE_HEADER = os.getenv("PROFILE_HEADER", "x-profile").lower()
+PROFILE_ALLOW_HEADER = os.getenv("PROFILE_ALLOW_HEADER", "").lower() in ("1", "true", "yes")
+
+T = TypeVar("T")
+
+_current_profiler: ContextVar[Optional["RequestProfiler"]] = ContextVar("current_profiler", default=None)
+
+
+def profile_requested(headers: Optional[Any]) -> Optional[bool]:
+    """
+    Reads the profiling header of an HTTP request.
+
+    Args:
+        headers (Optional[Any]): Request headers (FastAPI / Gradio), or None outside a request.
+
+    Returns:
+        Optional[bool]: True if the header asks for a profile and headers are allowed to, otherwise None
+        (leaving the decision to PROFILE_SAMPLE_RATE).
+    """
+    if not PROFILE_ALLOW_HEADER or headers is None:
+        return None
+    value = headers.get(PROFILE_HEADER)
+    return True if value and value.lower() not in ("0", "false", "no") else None
+
+
+def run_attached(fn: Callable[..., T], *args: Any) -> T:
+    """
+    Calls fn, including the current thread in the active request profile (if any) while it runs.
+    Used for work a profiled request hands to a thread pool.
+    """
+    profiler = _current_profiler.get()
+    if profiler is None:
+        return fn(*args)
+    with profiler.attached():
+        return fn(*args)
+
+
+class _Attachment:
+    __slots__ = ("profiler", "token", "profile")
+
+    def __init__(self, profiler: "RequestProfiler") -> None:
+        self.profiler = profiler
+
+    def __enter__(self) -> None:
+        self.token = _current_profiler.set(self.profiler)
+        self.profile = self.profiler._attach(threading.get_ident())
+
+    def __exit__(self, *exc) -> None:
+        self.profiler._detach(threading.get_ident(), self.profile)
+        _current_profiler.reset(self.token)
+
+
+class RequestProfiler:
+    """
+    Profiles one request while its code runs, following it across the threads it is resumed
+    on and the retrieval threads it attaches (see run_attached).
+
+    In "sampling" mode a background thread records the attached threads' stacks every
+    interval seconds, and the result is written as folded stacks ("a;b;c count" per line)
+    for flamegraph.pl or speedscope. In "cprofile" mode each attached stretch is traced by
+    cProfile and the merged stats are written as a .prof file (snakeviz, flameprof).
+
+    On the async machine, a request's steps share the event loop thread, so while it awaits,
+    the profile also sees the other coroutines running on the loop.
+
+    Attributes:
+        name (str): Label used in the output file name.
+        mode (str): "sampling" or "cprofile".
+        interval (float): Seconds between samples in sampling mode.
+        output_dir (str): Directory profiles are written to.
+    """
+
+    def __init__(self, name: str = "request", mode: str = PROFILE_MODE, interval: float = PROFILE_INTERVAL, output_dir: str = PROFILE_DIR) -> None:
+        if mode not in ("sampling", "cprofile"):
+            raise ValueError(f"unexpected profile mode: {mode}")
+        self.name = name
+        self.mode = mode
+        self.interval = interval
+        self.output_dir = output_dir
+        self.samples: Counter = Counter()
+        self._threads: Dict[int, int] = {}
+        self._profiles: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+
+    @classmethod
+    def for_request(cls, requested: Optional[bool] = None, name: str = "request") -> Optional["RequestProfiler"]:
+        """
+        Returns a profiler if this request should be profiled: when explicitly requested,
+        or otherwise with probability PROFILE_SAMPLE_RATE.
+
+        Args:
+            requested (Optional[bool]): True or False to force the decision, None to sample.
+            name (str): Label used in the output file name.
+
+        Returns:
+            Optional[RequestProfiler]: A profiler, or None (the common, zero-cost case).
+        """
+        if requested is None:
+            requested = PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+        return cls(name=name) if requested else None
+
+    def attached(self) -> _Attachment:
+        """
+        Includes the current thread in the profile, and makes this the active profiler, for a with block.
+        """
+        return _Attachment(self)
+
+    def _attach(self, thread_id: int) -> Optional[cProfile.Profile]:
+        if self.mode == "cprofile":
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # Python 3.12+ allows one active cProfile per process, and it traces every thread
+                return None
+            return profile
+        with self._lock:
+            self._threads[thread_id] = self._threads.get(thread_id, 0) + 1
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample, name="request-profiler", daemon=True)
+                self._sampler.start()
+        return None
+
+    def _detach(self, thread_id: int, profile: Optional[cProfile.Profile]) -> None:
+        if self.mode == "cprofile":
+            if profile is not None:
+                profile.disable()
+                with self._lock:
+                    self._profiles.append(profile)
+            return
+        with self._lock:
+            remaining = self._threads.get(thread_id, 0) - 1
+            if remaining > 0:
+                self._threads[thread_id] = remaining
+            else:
+                self._threads.pop(thread_id, None)
+
+    @staticmethod
+    def _fold(frame: Any) -> str:
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        return ";".join(reversed(stack))
+
+    def _sample(self) -> None:
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                thread_ids = list(self._threads)
+            if not thread_ids:
+                continue
+            frames = sys._current_frames()
+            for thread_id in thread_ids:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    self.samples[self._fold(frame)] += 1
+
+    def profile_iterator(self, items: Iterator[T]) -> Iterator[T]:
+        """
+        Profiles a generator while it computes each item, not while the consumer holds it,
+        then writes the profile once it is exhausted or closed.
+
+        Args:
+            items (Iterator[T]): E.g. the coalesced answer deltas of one request.
+
+        Yields:
+            T: The items, unchanged.
+        """
+        try:
+            while True:
+                with self.attached():
+                    try:
+                        item = next(items)
+                    except StopIteration:
+                        return
+                yield item
+        finally:
+            self.write()
+
+    async def profile_async_iterator(self, items: AsyncIterator[T]) -> AsyncIterator[T]:
+        """
+        Async counterpart of profile_iterator.
+        """
+        try:
+            while True:
+                with self.attached():
+                    try:
+                        item = await items.__anext__()
+                    except StopAsyncIteration:
+                        return
+                yield item
+        finally:
+            self.write()
+
+    def write(self) -> Optional[str]:
+        """
+        Stops sampling and writes the profile to output_dir.
+
+        Returns:
+            Optional[str]: Path of the written file, or None if nothing was recorded or writing failed.
+        """
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(self.output_dir, f"{stamp}-{self.name}-{uuid.uuid4().hex[:8]}")
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            if self.mode == "cprofile":
+                if not self._profiles:
+                    return None
+                path += ".prof"
+                pstats.Stats(*self._profiles).dump_stats(path)
+            else:
+                if not self.samples:
+                    return None
+                path += ".folded"
+                with open(path, "w") as f:
+                    for stack, count in self.samples.most_common():
+                        f.write(f"{stack} {count}\n")
+        except OSError as e:
+            logger.warning("Could not write profile: %s", e)
+            return None
+        logger.info("Wrote %s profile to %s", self.mode, path)
+        return path
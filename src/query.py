@@ -1,17 +1,68 @@
 import os
-from typing import Generator, List, Optional, Union
+import time
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, Future, TimeoutError as FutureTimeoutError
+from typing import Any, Dict, Generator, Iterable, List, Optional, Tuple, Union
 
 from dotenv import load_dotenv
 from openai import OpenAI
 from openai.types.chat import ChatCompletionChunk
 
-from src.vector_retriever import Retriever
+from src.vector_retriever import get_retriever
 from src.embeddings_generator import Generator as EmbeddingsGenerator
 from src.spacy_helper import get_spacy_helper
 from src.neo4j.scripts.graph_retriever import GraphModel
+from src.answer_cache import SemanticAnswerCache
+from src.context_builder import ContextBuilder, DEFAULT_TOKEN_BUDGET, load_chapters
+from src.metrics import CACHE_LOOKUPS, RequestTrace, record_error, record_stage, record_usage, registry, span
+from src.profiling import RequestProfiler, run_attached
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# get_answer_stream reports failures in-band; answers ending in this are never cached
+ANSWER_ERROR_PREFIX = "\n[Error while generating answer"
+
+
+class TokenCoalescer:
+    """
+    Buffers streamed tokens into larger deltas, releasing one once flush_interval has passed
+    since the last flush or flush_chars characters are buffered. Sync and async streams feed
+    it the same way and differ only in how they iterate.
+    """
+
+    def __init__(self, flush_interval: float, flush_chars: int) -> None:
+        self.flush_interval = flush_interval
+        self.flush_chars = flush_chars
+        self.buffer: List[str] = []
+        self.buffered_chars = 0
+        self.last_flush = time.monotonic()
+
+    def add(self, token: str) -> Optional[str]:
+        """
+        Buffer a token, returning the buffered delta if it is due to be sent.
+        """
+        self.buffer.append(token)
+        self.buffered_chars += len(token)
+        now = time.monotonic()
+        if now - self.last_flush >= self.flush_interval or self.buffered_chars >= self.flush_chars:
+            self.last_flush = now
+            return self.flush()
+        return None
+
+    def flush(self) -> Optional[str]:
+        """
+        Return whatever is buffered as one delta, or None if nothing is.
+        """
+        if not self.buffer:
+            return None
+        delta = "".join(self.buffer)
+        self.buffer.clear()
+        self.buffered_chars = 0
+        return delta
+
 
 class QueryMachine:
     """
@@ -20,19 +71,37 @@ class QueryMachine:
     using OpenAI's chat completion API.
     """
 
-    def __init__(self, model: str = 'gpt-4.1') -> None:
+    def __init__(
+        self,
+        model: str = 'gpt-4.1',
+        graph_timeout: float = 5.0,
+        vector_timeout: float = 5.0,
+        retrieval_workers: int = 16,
+        flush_interval: float = 0.05,
+        flush_chars: int = 512,
+        use_answer_cache: bool = True,
+        context_token_budget: int = DEFAULT_TOKEN_BUDGET,
+    ) -> None:
         """
         Initializes all required components and clients.
         
         Args:
             model (str): OpenAI model to use for completions.
+            graph_timeout (float): Seconds to wait for the Neo4j branch before answering without it.
+            vector_timeout (float): Seconds to wait for the embedding + pgvector branch before answering without it.
+            retrieval_workers (int): Threads shared by concurrent retrieval branches across requests.
+            flush_interval (float): Seconds to coalesce streamed tokens before sending an update.
+            flush_chars (int): Buffered characters that force an update before flush_interval elapses.
+            use_answer_cache (bool): Replay stored answers to near-duplicate questions instead of generating them.
+            context_token_budget (int): Maximum tokens of retrieved context in the prompt.
         """
-        self.db_search = Retriever()
-        self.spacy_helper = get_spacy_helper()
-        self.embeddings_generator = EmbeddingsGenerator()
-        self.graph_db_retriever = GraphModel()
-        self.openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
         self.MODEL = model
+        self.graph_timeout = graph_timeout
+        self.vector_timeout = vector_timeout
+        self.retrieval_workers = retrieval_workers
+        self.flush_interval = flush_interval
+        self.flush_chars = flush_chars
+        self.context_builder = ContextBuilder(token_budget=context_token_budget, model=model)
 
         self.prompt_template = """
         You are an expert on Sun-Tzu's The Art of War.
@@ -40,7 +109,7 @@ class QueryMachine:
         You will helpfully answer users' questions about the Art of War,
         with close reference to relevant context from a book-length modern commentary on the Art of War by Hua Shan.
         Make sure to explicitly reference at least 2 passages from the context provided to illustrate
-        your points. In each reference, you should quote from the 'chunk' field, and include the chapter title, and clearly
+        your points. In each reference, you should quote from the passage text, and include its chapter title, and clearly
         distinguish between Hua Shan's own words and Sun Tzu's original text whenever you cite a quote. You should loosely follow this format:
         "<point>, as pointed out by Hua Shan in the chapter entitled <chapter title> - <quotation from the chunk text>"
 
@@ -56,38 +125,355 @@ class QueryMachine:
         question: {question}
         """
 
-    def get_answer_stream(self, question: str, context: Union[str, List[dict]]) -> Generator[str, None, None]:
+        self._create_clients()
+        # Versioned by the retriever actually serving, e.g. the NumPy snapshot rather than PostgreSQL
+        self.answer_cache: Optional[SemanticAnswerCache] = (
+            SemanticAnswerCache.from_env(self.prompt_template, self.MODEL, self.db_search) if use_answer_cache else None
+        )
+        # The prompt asks for chapter titles; graph results are bare texts, so look theirs up
+        self.context_builder.chapters = load_chapters(getattr(self.db_search, "rows", None))
+        self.register_metrics()
+
+    def _create_clients(self) -> None:
+        """
+        Creates the retrieval and OpenAI clients. Subclasses override this to swap in other clients.
+        """
+        self.db_search = get_retriever()
+        self.spacy_helper = get_spacy_helper()
+        self.embeddings_generator = EmbeddingsGenerator()
+        self.graph_db_retriever = GraphModel()
+        self.openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.retrieval_executor = ThreadPoolExecutor(max_workers=self.retrieval_workers, thread_name_prefix="retrieval")
+
+    def query_embedding_cache(self) -> Optional[Any]:
+        """
+        Returns the embedding cache used for questions, if any.
+        """
+        return self.embeddings_generator.cache
+
+    def register_metrics(self) -> None:
+        """
+        Exports answer cache, embedding cache and connection pool statistics as gauges on /metrics.
+        """
+        if self.answer_cache:
+            registry.register_stats("answer_cache", self.answer_cache.stats)
+        embedding_cache = self.query_embedding_cache()
+        if embedding_cache:
+            registry.register_stats("embedding_cache", embedding_cache.stats)
+        if hasattr(self.db_search, "stats"):
+            registry.register_stats("db_pool", self.db_search.stats)
+
+    def vector_search(self, query: str, limit: int = 6) -> Optional[List[Dict[str, Any]]]:
+        """
+        Embeds the query and retrieves the most similar chunks from the vector database.
+
+        Args:
+            query (str): The user question.
+            limit (int): Maximum number of chunks to return.
+
+        Returns:
+            Optional[List[Dict[str, Any]]]: Matching rows, or None if either step failed.
+        """
+        with span("embed"):
+            query_embedding = self.embeddings_generator.generate_single_embedding(query)
+        if query_embedding is None:
+            return None
+        with span("pgvector"):
+            return self.db_search.find_similar(query_embedding, limit=limit)
+
+    @staticmethod
+    def _branch_failed(branch: str, error: Optional[Exception] = None) -> None:
+        """
+        Records a retrieval branch that timed out (no error) or failed, which is answered without.
+        """
+        if error is None:
+            record_error(branch, "timeout")
+            logger.warning("%s retrieval timed out, answering without it", branch)
+        else:
+            record_error(branch)
+            logger.warning("%s retrieval failed, answering without it: %s", branch, error)
+
+    @staticmethod
+    def _retrieved(
+        graph_db_chunks: Optional[List[str]],
+        vector_context: Optional[List[Dict[str, Any]]],
+    ) -> Tuple[List[str], List[Dict[str, Any]], bool]:
+        """
+        Combines the branch results (None for a missing branch) into retrieve_context's return value.
+        """
+        complete = graph_db_chunks is not None and vector_context is not None
+        return graph_db_chunks or [], vector_context or [], complete
+
+    def _result_within(self, future: Future, deadline: float, branch: str) -> Optional[Any]:
+        """
+        Waits for a retrieval branch until the deadline, returning None if it timed out or failed.
+        """
+        try:
+            return future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FutureTimeoutError:
+            self._branch_failed(branch)
+        except Exception as e:
+            self._branch_failed(branch, e)
+        return None
+
+    def retrieve_context(self, query: str) -> Tuple[List[str], List[Dict[str, Any]], bool]:
+        """
+        Runs graph retrieval and embedding + vector retrieval concurrently, each with its own timeout.
+        A branch that is slow or fails contributes nothing rather than blocking the answer.
+
+        Args:
+            query (str): The user question.
+
+        Returns:
+            Tuple[List[str], List[Dict[str, Any]], bool]: Graph chunks, vector rows, and whether
+            both branches answered in time.
+        """
+        start = time.monotonic()
+        # Each branch runs in a copy of the caller's context, so its spans reach the request trace
+        # and, for a profiled request, its thread is included in the profile
+        graph_future = self.retrieval_executor.submit(
+            contextvars.copy_context().run, run_attached, self.graph_db_retriever.run, query
+        )
+        vector_future = self.retrieval_executor.submit(
+            contextvars.copy_context().run, run_attached, self.vector_search, query
+        )
+
+        graph_db_chunks = self._result_within(graph_future, start + self.graph_timeout, "graph")
+        vector_context = self._result_within(vector_future, start + self.vector_timeout, "vector")
+        return self._retrieved(graph_db_chunks, vector_context)
+
+    def _completion_request(self, question: str, context: Union[str, List[dict]]) -> Dict[str, Any]:
+        """
+        Returns the arguments of the streamed chat completion answering a question from its context.
+        """
+        return {
+            "model": self.MODEL,
+            "temperature": 0.7,
+            "messages": [{"role": "user", "content": self.prompt_template.format(context=context, question=question)}],
+            "stream": True,
+            "stream_options": {"include_usage": True},
+        }
+
+    @staticmethod
+    def _event_text(event: ChatCompletionChunk, trace: Optional[RequestTrace]) -> Optional[str]:
+        """
+        Records the token usage a stream event carries and returns its text, if any.
+        """
+        # With include_usage, the last chunk carries token counts and no choices
+        if event.usage:
+            record_usage(event.usage, trace)
+        if event.choices and event.choices[0].delta.content:
+            return event.choices[0].delta.content
+        return None
+
+    @staticmethod
+    def _stream_error(error: Exception, trace: Optional[RequestTrace]) -> str:
+        """
+        Records a failed completion and returns the in-band error text ending the answer.
+        """
+        record_error("llm", trace=trace)
+        return f"{ANSWER_ERROR_PREFIX}: {error}]"
+
+    def get_answer_stream(
+        self,
+        question: str,
+        context: Union[str, List[dict]],
+        trace: Optional[RequestTrace] = None,
+    ) -> Generator[str, None, None]:
         """
         Streams the response from the OpenAI chat completion API.
 
         Args:
             question (str): The user question.
             context (Union[str, List[dict]]): Retrieved context relevant to the question.
+            trace (Optional[RequestTrace]): Request trace receiving the LLM timings and token usage.
 
         Yields:
             str: Partial tokens from the streamed response.
         """
+        start = time.perf_counter()
+        first_token = True
         try:
-            final_prompt = self.prompt_template.format(context=context, question=question)
-
             response_stream: Generator[ChatCompletionChunk, None, None] = self.openai_client.chat.completions.create(
-                model=self.MODEL,
-                temperature=0.7,
-                messages=[{"role": "user", "content": final_prompt}],
-                stream=True,
+                **self._completion_request(question, context)
             )
 
             for event in response_stream:
-                if event.choices[0].delta.content:
-                    yield event.choices[0].delta.content
+                text = self._event_text(event, trace)
+                if text:
+                    if first_token:
+                        record_stage("llm_first_token", time.perf_counter() - start, trace)
+                        first_token = False
+                    yield text
 
         except Exception as e:
-            yield f"\n[Error while generating answer: {e}]"
+            yield self._stream_error(e, trace)
+
+        finally:
+            record_stage("llm_stream", time.perf_counter() - start, trace)
+
+    def coalesce_tokens(self, tokens: Iterable[str]) -> Generator[str, None, None]:
+        """
+        Groups streamed tokens into larger deltas, flushing once flush_interval has passed
+        since the last flush or flush_chars characters are buffered, and at the end of the stream.
+
+        Args:
+            tokens (Iterable[str]): Token stream, e.g. from get_answer_stream.
+
+        Yields:
+            str: Concatenated deltas.
+        """
+        coalescer = TokenCoalescer(self.flush_interval, self.flush_chars)
+        for token in tokens:
+            delta = coalescer.add(token)
+            if delta:
+                yield delta
+        delta = coalescer.flush()
+        if delta:
+            yield delta
+
+    def _assemble_context(
+        self,
+        graph_db_chunks: List[str],
+        vector_context: List[Dict[str, Any]],
+        complete: bool,
+    ) -> Tuple[str, bool]:
+        """
+        Renders retrieved context for the prompt. It is complete if both branches answered
+        and something was retrieved.
+        """
+        with span("context_assembly"):
+            context = self.context_builder.build(graph_db_chunks, vector_context)
+        return context, complete and bool(graph_db_chunks or vector_context)
+
+    def build_context(self, query: str) -> Tuple[str, bool]:
+        """
+        Retrieves graph and vector context for a question and assembles it into a
+        deduplicated, token-budgeted context block.
+
+        Args:
+            query (str): The user question.
+
+        Returns:
+            Tuple[str, bool]: Rendered context passed to the prompt, and whether it is complete:
+            both branches answered and something was retrieved.
+        """
+        with span("retrieval"):
+            graph_db_chunks, vector_context, complete = self.retrieve_context(query)
+        return self._assemble_context(graph_db_chunks, vector_context, complete)
+
+    @staticmethod
+    def _record_cache_lookup(trace: RequestTrace, cached: Optional[str]) -> None:
+        """
+        Records an answer cache hit or miss on the request trace and in /metrics.
+        """
+        trace.fields["answer_cache"] = "miss" if cached is None else "hit"
+        CACHE_LOOKUPS.inc(cache="answer", result=trace.fields["answer_cache"])
+
+    @staticmethod
+    def _answer_outcome(answer_parts: List[str], embedding: Optional[List[float]], complete: bool) -> Tuple[str, bool]:
+        """
+        Classifies a generated answer once its stream has ended.
+
+        Args:
+            answer_parts (List[str]): The streamed tokens.
+            embedding (Optional[List[float]]): Embedding of the question, None if the cache was not consulted.
+            complete (bool): Whether the answer was built from complete context.
+
+        Returns:
+            Tuple[str, bool]: The request outcome ("ok" or "error"), and whether to store the answer in the cache.
+        """
+        failed = not answer_parts or answer_parts[-1].startswith(ANSWER_ERROR_PREFIX)
+        # An answer built from partial or empty context is not worth replaying
+        return ("error" if failed else "ok"), embedding is not None and not failed and complete
+
+    def answer_tokens(self, question: str) -> Generator[str, None, None]:
+        """
+        Streams the answer to a question, replaying a cached answer when a near-duplicate
+        question was answered before, and otherwise retrieving context and generating one.
+        Completed answers are added to the cache; failed or abandoned streams, and answers
+        given while a retrieval branch was missing, are not.
+
+        Each stage is timed into the /metrics histograms, and the request's breakdown is logged
+        as one JSON line when the stream ends. The trace is activated only around blocking
+        calls, never across a yield, since the consumer may resume this generator elsewhere.
+
+        Args:
+            question (str): The user question.
+
+        Yields:
+            str: Partial tokens of the answer.
+        """
+        trace = RequestTrace()
+        outcome = "abandoned"
+        try:
+            embedding = None
+            if self.answer_cache:
+                with trace.active():
+                    # The vector branch embeds the same text, and is then served from the embedding cache
+                    with span("embed"):
+                        embedding = self.embeddings_generator.generate_single_embedding(question)
+                    with span("answer_cache"):
+                        cached = self.answer_cache.lookup(embedding) if embedding is not None else None
+                self._record_cache_lookup(trace, cached)
+                if cached is not None:
+                    for piece in self.answer_cache.replay(cached):
+                        trace.first_token()
+                        yield piece
+                    outcome = "cached"
+                    return
+
+            with trace.active():
+                context, complete = self.build_context(question)
+
+            answer_parts: List[str] = []
+            for token in self.get_answer_stream(question, context, trace):
+                trace.first_token()
+                answer_parts.append(token)
+                yield token
+
+            outcome, store = self._answer_outcome(answer_parts, embedding, complete)
+            if store:
+                self.answer_cache.store(question, embedding, "".join(answer_parts))
+        finally:
+            trace.finish(outcome)
+
+    def stream_answer_deltas(self, question: str, profile: Optional[bool] = None) -> Generator[str, None, None]:
+        """
+        Answers a question as a stream of coalesced text deltas, for clients that append
+        deltas themselves rather than re-rendering the full history on every update.
+
+        Args:
+            question (str): The user question.
+            profile (Optional[bool]): Force (True) or skip (False) profiling this request;
+                None profiles it with probability PROFILE_SAMPLE_RATE.
+
+        Yields:
+            str: Answer text deltas.
+        """
+        deltas = self.coalesce_tokens(self.answer_tokens(question))
+        profiler = RequestProfiler.for_request(profile, name="enter_query")
+        yield from profiler.profile_iterator(deltas) if profiler else deltas
+
+    @staticmethod
+    def _history_with_question(history: Optional[List[dict]], query: str) -> List[dict]:
+        """
+        Returns the chat history with the user's question appended.
+        """
+        return (history or []) + [{"role": "user", "content": query}]
+
+    @staticmethod
+    def _history_with_answer(updated_history: List[dict], answer_parts: List[str]) -> List[dict]:
+        """
+        Returns the chat history with the answer streamed so far as the assistant's turn.
+        """
+        return updated_history + [{"role": "assistant", "content": "".join(answer_parts)}]
 
     def enter_query(
         self,
         website_input: Optional[str] = None,
-        history: Optional[List[dict]] = None
+        history: Optional[List[dict]] = None,
+        profile: Optional[bool] = None,
     ) -> Generator[List[dict], None, None]:
         """
         Orchestrates the full query process: embedding generation, context retrieval, and response streaming.
@@ -95,6 +481,8 @@ class QueryMachine:
         Args:
             website_input (Optional[str]): User input from a website, or None for CLI input.
             history (Optional[List[dict]]): Previous messages for multi-turn dialogue.
+            profile (Optional[bool]): Force (True) or skip (False) profiling this request;
+                None profiles it with probability PROFILE_SAMPLE_RATE.
 
         Yields:
             List[dict]: Chat history updated with streaming assistant content.
@@ -106,22 +494,17 @@ class QueryMachine:
                 while not query:
                     query = input('Please enter a question about the Art of War:\n')
 
-            # Step 2: Retrieve related graph knowledge and vector-based context
-            graph_db_chunks = self.graph_db_retriever.run(query)
-            query_embedding = self.embeddings_generator.generate_single_embedding(query)
-            vector_context = self.db_search.find_similar(query_embedding, limit=6)
-
-            # Combine graph and vector context
-            full_context = graph_db_chunks + vector_context if graph_db_chunks else vector_context
-
-            # Step 3: Manage history and stream OpenAI response
-            answer_so_far = ""
-            history = history or []
-            updated_history = history + [{"role": "user", "content": query}]
+            # Step 2: Manage history and stream the answer: replayed from the answer cache, or
+            # generated from graph and vector context retrieved concurrently. Tokens are coalesced
+            # so the answer is re-joined and the history re-sent a few times per second, not per
+            # token; Gradio diffs consecutive values and sends only the appended text.
+            answer_parts: List[str] = []
+            updated_history = self._history_with_question(history, query)
 
-            for token in self.get_answer_stream(query, full_context):
-                answer_so_far += token
-                yield updated_history + [{"role": "assistant", "content": answer_so_far}]
+            for delta in self.stream_answer_deltas(query, profile):
+                answer_parts.append(delta)
+                yield self._history_with_answer(updated_history, answer_parts)
 
         except Exception as e:
-            print(f"[Error while prompting {self.MODEL}]: {e}")
+            record_error("query")
+            logger.error("Error while prompting %s: %s", self.MODEL, e)
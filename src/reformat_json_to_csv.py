@@ -15,6 +15,28 @@ def load_json_file(filepath: str) -> List[Dict[str, Any]]:
     with open(filepath, 'r', encoding='utf-8') as f:
         return json.load(f)
 
+CSV_HEADER = ['chunk_id', 'entity_text', 'label']
+EXCLUDED_LABELS = {'CARDINAL', 'ORDINAL', 'QUANTITY', 'TIME', 'MONEY', 'PERCENT'}
+
+def entity_rows(item: Dict[str, Any], index: int) -> List[List[Any]]:
+    """
+    Turn one chunk's entry from entities.json into CSV rows, dropping numeric and similar labels.
+
+    Args:
+        item (Dict[str, Any]): Chunk entry with 'entities' and optionally 'chunk_id'.
+        index (int): Position of the entry, used when it has no chunk_id.
+
+    Returns:
+        List[List[Any]]: Rows of chunk_id, entity_text, label.
+    """
+    chunk_id = item.get('chunk_id', index)
+    rows = []
+    for entity in item.get('entities', []):
+        label = entity.get('label')
+        if label and label not in EXCLUDED_LABELS:
+            rows.append([entity.get('chunk_id', chunk_id), entity['text'], label])
+    return rows
+
 def write_entities_to_csv(data: List[Dict[str, Any]], csv_path: str) -> None:
     """
     Write filtered entity data from JSON to a CSV file.
@@ -23,24 +45,12 @@ def write_entities_to_csv(data: List[Dict[str, Any]], csv_path: str) -> None:
         data (List[Dict[str, Any]]): The JSON data loaded from file.
         csv_path (str): Path to the output CSV file.
     """
-    excluded_labels = {'CARDINAL', 'ORDINAL', 'QUANTITY', 'TIME', 'MONEY', 'PERCENT'}
-
     with open(csv_path, 'w', newline='', encoding='utf-8') as f:
         writer = csv.writer(f)
-        writer.writerow(['chunk_id', 'entity_text', 'label'])  # Write header
+        writer.writerow(CSV_HEADER)  # Write header
 
         for i, item in enumerate(data):
-            chunk_id = item.get('chunk_id', i)
-            entities = item.get('entities', [])
-
-            for entity in entities:
-                label = entity.get('label')
-                if label and label not in excluded_labels:
-                    writer.writerow([
-                        entity.get('chunk_id', chunk_id),
-                        entity['text'],
-                        label
-                    ])
+            writer.writerows(entity_rows(item, i))
 
 if __name__ == "__main__":
     json_data = load_json_file('assets/entities.json')
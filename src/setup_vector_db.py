@@ -1,50 +1,176 @@
+import io
 import os
 import json
-from typing import List, Dict, Any
+import time
+import struct
+import hashlib
+import argparse
+from typing import List, Dict, Any, Optional, Iterable, Tuple
 
+import numpy as np
+
+from src.db_pool import db_pool
 from src.embeddings_generator import Generator
 from src.chunker import Chunker
 
 # --- Database setup helper class ---
 
+PGCOPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0)
+PGCOPY_TRAILER = struct.pack("!h", -1)
+
+
+def encode_copy_rows(rows: Iterable[Tuple[str, str, Optional[List[float]], str]]) -> bytes:
+    """
+    Encode (chunk, chapter, embedding, content_hash) rows in PostgreSQL's binary COPY format.
+    Vectors use pgvector's binary representation (int16 dim, int16 unused, big-endian float4s),
+    so no float is ever rendered as text.
+
+    Args:
+        rows (Iterable[Tuple[str, str, Optional[List[float]], str]]): Rows to encode.
+
+    Returns:
+        bytes: A complete binary COPY payload.
+    """
+    out = io.BytesIO()
+    out.write(PGCOPY_HEADER)
+    for chunk, chapter, embedding, digest in rows:
+        out.write(struct.pack("!h", 4))
+        for text in (chunk, chapter):
+            data = text.encode('utf-8')
+            out.write(struct.pack("!i", len(data)))
+            out.write(data)
+        if embedding is None:
+            out.write(struct.pack("!i", -1))
+        else:
+            vector = np.asarray(embedding, dtype='>f4')
+            out.write(struct.pack("!ihh", 4 + vector.nbytes, vector.shape[0], 0))
+            out.write(vector.tobytes())
+        data = digest.encode('utf-8')
+        out.write(struct.pack("!i", len(data)))
+        out.write(data)
+    out.write(PGCOPY_TRAILER)
+    out.seek(0)
+    return out.getvalue()
+
+
+def chunk_hash(chunk: Dict[str, str]) -> str:
+    """
+    Content hash identifying a chunk across ingests (chapter title and text).
+
+    Args:
+        chunk (Dict[str, str]): Chunk dictionary with 'chapter' and 'content' keys.
+
+    Returns:
+        str: Hex sha256 digest.
+    """
+    return hashlib.sha256(f"{chunk['chapter']}\x00{chunk['content']}".encode('utf-8')).hexdigest()
+
+
 class DB_setup_helper:
     """
     Helper class to create and populate the database table for storing book chunks and embeddings.
     """
 
+    INDEX_NAME = "art_of_war_book_english_embedding_idx"
+
     def __init__(self) -> None:
         """
         Initialize the insert query for the table.
         """
         self.insert_chunk_query: str = """
-        INSERT INTO art_of_war_book_english (chunk, chapter, embedding)
-        VALUES (%s, %s, %s)
+        INSERT INTO art_of_war_book_english (chunk, chapter, embedding, content_hash)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT (content_hash) DO UPDATE
+        SET chunk = EXCLUDED.chunk, chapter = EXCLUDED.chapter, embedding = EXCLUDED.embedding
         """
 
     def create_table(self) -> None:
         """
-        Create the required table and vector extension in the PostgreSQL database if they don't exist.
+        Create the required table and vector extension in the PostgreSQL database if they don't exist,
+        and add the content_hash column (with a unique index) to tables created before it existed.
         """
         try:
-            self.conn = db_pool.getconn()
-            self.cur = self.conn.cursor()
-
-            self.cur.execute("CREATE EXTENSION IF NOT EXISTS vector;")
-            self.cur.execute("""
-                CREATE TABLE IF NOT EXISTS art_of_war_book_english (
-                    id SERIAL PRIMARY KEY,
-                    chapter TEXT NOT NULL,
-                    chunk TEXT NOT NULL,
-                    embedding vector(1536)
-                );
-            """)
-            self.conn.commit()
+            with db_pool.connection() as conn, conn.cursor() as cur:
+                cur.execute("CREATE EXTENSION IF NOT EXISTS vector;")
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS art_of_war_book_english (
+                        id SERIAL PRIMARY KEY,
+                        chapter TEXT NOT NULL,
+                        chunk TEXT NOT NULL,
+                        embedding vector(1536),
+                        content_hash TEXT
+                    );
+                """)
+                cur.execute("ALTER TABLE art_of_war_book_english ADD COLUMN IF NOT EXISTS content_hash TEXT;")
+                cur.execute("""
+                    CREATE UNIQUE INDEX IF NOT EXISTS art_of_war_book_english_content_hash_idx
+                    ON art_of_war_book_english (content_hash);
+                """)
+                conn.commit()
             print("Database setup complete!")
         except Exception as e:
             print("Error during setup:", e)
-        finally:
-            self.cur.close()
-            self.conn.close()
+
+    def create_vector_index(
+        self,
+        method: str = "hnsw",
+        m: int = 16,
+        ef_construction: int = 64,
+        lists: Optional[int] = None,
+        rebuild: bool = False,
+        maintenance_work_mem: str = "1GB",
+    ) -> None:
+        """
+        Create (or rebuild) the ANN index on the embedding column for cosine-distance search.
+        Build it after bulk loading: indexing an empty table and inserting afterwards is slower
+        and, for IVFFlat, produces poor list centroids.
+
+        Args:
+            method (str): "hnsw" (better recall/latency, slower build) or "ivfflat" (fast build).
+            m (int): HNSW max connections per node.
+            ef_construction (int): HNSW candidate list size during build.
+            lists (Optional[int]): IVFFlat list count; defaults to rows/1000 up to 1M rows, sqrt(rows) beyond.
+            rebuild (bool): Drop any existing index first (e.g. after changing parameters).
+            maintenance_work_mem (str): Memory for the build; HNSW builds much faster when the graph fits.
+        """
+        if method not in ("hnsw", "ivfflat"):
+            raise ValueError(f"unexpected index method: {method}")
+        try:
+            with db_pool.connection() as conn, conn.cursor() as cur:
+                if rebuild:
+                    cur.execute(f"DROP INDEX IF EXISTS {self.INDEX_NAME};")
+                cur.execute("SET LOCAL maintenance_work_mem = %s;", (maintenance_work_mem,))
+
+                if method == "hnsw":
+                    options = f"m = {int(m)}, ef_construction = {int(ef_construction)}"
+                else:
+                    if lists is None:
+                        cur.execute("SELECT count(*) FROM art_of_war_book_english;")
+                        rows = cur.fetchone()[0]
+                        lists = max(1, rows // 1000) if rows <= 1_000_000 else int(rows ** 0.5)
+                    options = f"lists = {int(lists)}"
+
+                start = time.perf_counter()
+                cur.execute(f"""
+                    CREATE INDEX IF NOT EXISTS {self.INDEX_NAME}
+                    ON art_of_war_book_english USING {method} (embedding vector_cosine_ops)
+                    WITH ({options});
+                """)
+                conn.commit()
+            print(f"✅ {method} index ready in {time.perf_counter() - start:.1f}s ({options})")
+        except Exception as e:
+            print("Error while creating vector index:", e)
+
+    def drop_vector_index(self) -> None:
+        """
+        Drop the ANN index, e.g. before a large bulk load.
+        """
+        try:
+            with db_pool.connection() as conn, conn.cursor() as cur:
+                cur.execute(f"DROP INDEX IF EXISTS {self.INDEX_NAME};")
+                conn.commit()
+        except Exception as e:
+            print("Error while dropping vector index:", e)
 
     def insert_chunks_to_db(self, generator: Generator, batch_size: int = 100) -> None:
         """
@@ -55,29 +181,203 @@ class DB_setup_helper:
             batch_size (int): Number of records to insert per batch.
         """
         try:
-            self.conn = db_pool.getconn()
-            self.cur = self.conn.cursor()
-            batch: List[tuple] = []
+            with db_pool.connection() as conn, conn.cursor() as cur:
+                batch: List[tuple] = []
+                skipped = 0
 
-            for chunk, embedding in generator.generate_chunk_embeddings():
-                batch.append((chunk['content'], chunk['chapter'], embedding))
+                for chunk, embedding in generator.generate_chunk_embeddings():
+                    # A chunk stored without its embedding would count as synced but never be found
+                    if embedding is None:
+                        skipped += 1
+                        continue
+                    batch.append((chunk['content'], chunk['chapter'], embedding, chunk_hash(chunk)))
 
-                if len(batch) > batch_size:
-                    self.cur.executemany(self.insert_chunk_query, batch)
-                    self.conn.commit()
-                    print(f"Inserted batch of {len(batch)}")
-                    batch = []
+                    if len(batch) > batch_size:
+                        cur.executemany(self.insert_chunk_query, batch)
+                        conn.commit()
+                        print(f"Inserted batch of {len(batch)}")
+                        batch = []
 
-            if batch:
-                self.cur.executemany(self.insert_chunk_query, batch)
-                self.conn.commit()
-                print(f"Inserted batch of {len(batch)}")
+                if batch:
+                    cur.executemany(self.insert_chunk_query, batch)
+                    conn.commit()
+                    print(f"Inserted batch of {len(batch)}")
+                if skipped:
+                    print(f"Skipped {skipped} chunks whose embedding failed; rerun to retry them")
 
         except Exception as e:
             print("error while storing chunks in db:", e)
+
+
+    @staticmethod
+    def copy_rows(cur: Any, rows: List[tuple]) -> None:
+        """
+        Upsert (chunk, chapter, embedding, content_hash) rows by streaming them with binary COPY
+        into a temporary staging table (emptied on commit) and merging it into the main table.
+        The caller commits.
+
+        Args:
+            cur (cursor): Cursor of the connection to write with.
+            rows (List[tuple]): Rows to upsert.
+        """
+        cur.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS art_of_war_staging (
+                chunk TEXT, chapter TEXT, embedding vector(1536), content_hash TEXT
+            ) ON COMMIT DELETE ROWS;
+        """)
+        cur.copy_expert(
+            "COPY art_of_war_staging (chunk, chapter, embedding, content_hash) FROM STDIN WITH (FORMAT binary)",
+            io.BytesIO(encode_copy_rows(rows)),
+        )
+        cur.execute("""
+            INSERT INTO art_of_war_book_english (chunk, chapter, embedding, content_hash)
+            SELECT DISTINCT ON (content_hash) chunk, chapter, embedding, content_hash
+            FROM art_of_war_staging
+            ON CONFLICT (content_hash) DO UPDATE
+            SET chunk = EXCLUDED.chunk, chapter = EXCLUDED.chapter, embedding = EXCLUDED.embedding;
+        """)
+
+    def upsert_rows(self, rows: List[tuple], bulk: bool = True) -> None:
+        """
+        Upsert one batch of (chunk, chapter, embedding, content_hash) rows in its own transaction.
+
+        Args:
+            rows (List[tuple]): Rows to upsert.
+            bulk (bool): Write with binary COPY instead of INSERTs.
+        """
+        with db_pool.connection() as conn, conn.cursor() as cur:
+            if bulk:
+                self.copy_rows(cur, rows)
+            else:
+                cur.executemany(self.insert_chunk_query, rows)
+            conn.commit()
+
+    def stored_hashes(self, embedded_only: bool = True) -> set:
+        """
+        Return the content_hash of every stored chunk.
+
+        Args:
+            embedded_only (bool): Leave out rows without an embedding, so they are embedded again.
+
+        Returns:
+            set: Stored content hashes.
+        """
+        query = "SELECT content_hash FROM art_of_war_book_english"
+        if embedded_only:
+            query += " WHERE embedding IS NOT NULL"
+        with db_pool.connection() as conn, conn.cursor() as cur:
+            cur.execute(query + ";")
+            return {row[0] for row in cur.fetchall()}
+
+    def copy_chunks_to_db(self, generator: Generator, batch_size: int = 10_000, rebuild_index: bool = True) -> None:
+        """
+        Bulk-load generated chunks and embeddings with binary COPY. Each batch is streamed into
+        a temporary staging table and merged into the main table with an upsert on content_hash,
+        then committed. The ANN index is dropped for the load and rebuilt once at the end.
+
+        Args:
+            generator (Generator): A Generator instance used to produce embeddings.
+            batch_size (int): Number of records per COPY and commit.
+            rebuild_index (bool): Drop the vector index before loading and rebuild it afterwards.
+        """
+        if rebuild_index:
+            self.drop_vector_index()
+
+        total = 0
+        start = time.perf_counter()
+        try:
+            with db_pool.connection() as conn, conn.cursor() as cur:
+                def flush(batch: List[tuple]) -> None:
+                    self.copy_rows(cur, batch)
+                    conn.commit()
+
+                batch: List[tuple] = []
+                skipped = 0
+                for chunk, embedding in generator.generate_chunk_embeddings():
+                    if embedding is None:
+                        skipped += 1
+                        continue
+                    batch.append((chunk['content'], chunk['chapter'], embedding, chunk_hash(chunk)))
+                    if len(batch) >= batch_size:
+                        flush(batch)
+                        total += len(batch)
+                        print(f"Copied {total} rows ({total / (time.perf_counter() - start):,.0f} rows/sec)")
+                        batch = []
+
+                if batch:
+                    flush(batch)
+                    total += len(batch)
+
+            elapsed = time.perf_counter() - start
+            print(f"✅ Copied {total} rows in {elapsed:.1f}s ({total / max(elapsed, 1e-9):,.0f} rows/sec)")
+            if skipped:
+                print(f"Skipped {skipped} chunks whose embedding failed; rerun to retry them")
+        except Exception as e:
+            print("error while copying chunks to db:", e)
         finally:
-            self.cur.close()
-            self.conn.close()
+            if rebuild_index:
+                self.create_vector_index()
+
+    def backfill_hashes(self) -> None:
+        """
+        Fill content_hash for rows inserted before hashes were stored, deleting rows that
+        duplicate an already-hashed chunk (left behind by earlier non-idempotent ingests).
+        """
+        with db_pool.connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT id, chunk, chapter FROM art_of_war_book_english WHERE content_hash IS NULL ORDER BY id;")
+            legacy = cur.fetchall()
+            if not legacy:
+                return
+
+            cur.execute("SELECT content_hash FROM art_of_war_book_english WHERE content_hash IS NOT NULL;")
+            seen = {row[0] for row in cur.fetchall()}
+            updates, duplicates = [], []
+            for row_id, content, chapter in legacy:
+                digest = chunk_hash({'chapter': chapter, 'content': content})
+                if digest in seen:
+                    duplicates.append(row_id)
+                else:
+                    seen.add(digest)
+                    updates.append((digest, row_id))
+
+            cur.executemany("UPDATE art_of_war_book_english SET content_hash = %s WHERE id = %s;", updates)
+            if duplicates:
+                cur.execute("DELETE FROM art_of_war_book_english WHERE id = ANY(%s);", (duplicates,))
+            conn.commit()
+        print(f"Backfilled {len(updates)} hashes, removed {len(duplicates)} duplicate rows")
+
+    def sync_chunks_to_db(self, chunks: List[Dict[str, Any]], batch_size: int = 100, bulk: bool = False) -> None:
+        """
+        Incrementally bring the table in line with a chunk list: only new or changed chunks are
+        embedded and upserted, and rows whose chunk no longer exists are deleted.
+        Re-running with unchanged chunks does no embedding and no writes.
+
+        Args:
+            chunks (List[Dict[str, Any]]): The full, current list of chunk dictionaries.
+            batch_size (int): Number of records to insert per batch.
+            bulk (bool): Load new chunks with binary COPY (copy_chunks_to_db) instead of INSERTs.
+        """
+        try:
+            self.backfill_hashes()
+            # Rows left without an embedding by an earlier run count as missing and are re-embedded
+            embedded = self.stored_hashes()
+            stored = self.stored_hashes(embedded_only=False)
+
+            wanted = {chunk_hash(chunk): chunk for chunk in chunks}
+            added = [chunk for digest, chunk in wanted.items() if digest not in embedded]
+            removed = [digest for digest in stored if digest not in wanted]
+            print(f"{len(wanted) - len(added)} unchanged, {len(added)} new or changed, {len(removed)} removed")
+
+            if added and bulk:
+                self.copy_chunks_to_db(Generator(added), batch_size=batch_size, rebuild_index=False)
+            elif added:
+                self.insert_chunks_to_db(Generator(added), batch_size=batch_size)
+            if removed:
+                with db_pool.connection() as conn, conn.cursor() as cur:
+                    cur.execute("DELETE FROM art_of_war_book_english WHERE content_hash = ANY(%s);", (removed,))
+                    conn.commit()
+        except Exception as e:
+            print("error while syncing chunks to db:", e)
 
 
 # --- Load or generate chunks ---
@@ -110,6 +410,13 @@ def load_or_create_chunks(filepath: str, raw_text_path: str) -> List[Dict[str, A
 # --- Main execution ---
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Embed chunks and store them in PostgreSQL.")
+    parser.add_argument("--full", action="store_true", help="Embed and upsert every chunk instead of only new or changed ones")
+    parser.add_argument("--copy", action="store_true", help="Load rows with binary COPY instead of INSERTs")
+    parser.add_argument("--batch-size", type=int, default=None, help="Rows per insert batch (default 100, or 10000 with --copy)")
+    args = parser.parse_args()
+    batch_size = args.batch_size or (10_000 if args.copy else 100)
+
     db_setup_helper = DB_setup_helper()
     db_setup_helper.create_table()
 
@@ -118,5 +425,13 @@ if __name__ == "__main__":
         raw_text_path='assets/art_of_war_for_rag.txt'
     )
 
-    gen = Generator(chunks)
-    db_setup_helper.insert_chunks_to_db(gen, batch_size=100)
+    if args.full and args.copy:
+        # copy_chunks_to_db rebuilds the index itself once the load is done
+        db_setup_helper.copy_chunks_to_db(Generator(chunks), batch_size=batch_size)
+    elif args.full:
+        gen = Generator(chunks)
+        db_setup_helper.insert_chunks_to_db(gen, batch_size=batch_size)
+        db_setup_helper.create_vector_index(method="hnsw")
+    else:
+        db_setup_helper.sync_chunks_to_db(chunks, batch_size=batch_size, bulk=args.copy)
+        db_setup_helper.create_vector_index(method="hnsw")
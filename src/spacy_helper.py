@@ -1,4 +1,8 @@
 import spacy
+import srsly
+import hashlib
+import threading
+from spacy.language import Language
 from spacy.matcher import PhraseMatcher
 from spacy.tokens import Doc
 from typing import List, Dict, Tuple, Optional, Union
@@ -22,49 +26,141 @@ class SpacyHelper:
     """
     A helper class for using spaCy to extract entities from text,
     match against known entities from a JSON file, and identify generic terms.
+
+    Pipelines load lazily and only with the components a call needs: entity matching
+    uses the tokenizer alone, date detection the tagger, parser and lemmatizer, and
+    entity extraction the NER model. The PhraseMatcher patterns are read from a msgpack
+    artifact holding each entity's tokens, rebuilt only when entities.json, the spaCy
+    version or the model change.
     """
 
     GENERICS = ['event', 'people', 'person', 'who', 'when', 'period', 'place',
                 'location', 'battle', 'dynasty', 'historical figure']
 
-    def __init__(self, model: str = "en_core_web_sm") -> None:
+    # Components of the en_core_web_* pipelines; names missing from a model are ignored
+    PIPES = ("tok2vec", "tagger", "morphologizer", "parser", "senter", "attribute_ruler", "lemmatizer", "ner")
+    PARSE_PIPES = ("tok2vec", "tagger", "parser", "attribute_ruler", "lemmatizer")
+    NER_PIPES = ("tok2vec", "ner")
+
+    PATTERNS_FORMAT = 1
+
+    def __init__(
+        self,
+        model: str = "en_core_web_sm",
+        entities_path: str = 'assets/entities.json',
+        patterns_path: str = 'assets/phrase_patterns.msgpack',
+    ) -> None:
+        """
+        Loads the tokenizer and the phrase matcher for known entities. Other pipeline
+        components are loaded on first use.
+
+        Args:
+            model (str): spaCy model name.
+            entities_path (str): JSON file of chunks with their extracted entities.
+            patterns_path (str): Serialized matcher patterns, rebuilt when stale.
+        """
+        self.model = model
+        self._pipelines: Dict[Tuple[str, ...], Language] = {}
+        self._pipelines_lock = threading.Lock()
+        self.tokenizer_nlp = self._pipeline(())
+        self.matcher = PhraseMatcher(self.tokenizer_nlp.vocab)
+        self._load_phrase_patterns(entities_path, patterns_path)
+
+    def _pipeline(self, pipes: Tuple[str, ...]) -> Language:
         """
-        Initializes the spaCy pipeline and loads matchers from entity definitions.
+        Returns the model loaded with only the given components (plus the tokenizer), loading it once.
         """
-        self.nlp = spacy.load(model)
-        self.matcher = PhraseMatcher(self.nlp.vocab)
-        self._load_phrase_patterns()
+        if pipes not in self._pipelines:
+            with self._pipelines_lock:
+                if pipes not in self._pipelines:
+                    exclude = [name for name in self.PIPES if name not in pipes]
+                    self._pipelines[pipes] = spacy.load(self.model, exclude=exclude)
+        return self._pipelines[pipes]
+
+    @property
+    def nlp(self) -> Language:
+        """
+        The full pipeline, loaded on first access.
+        """
+        return self._pipeline(self.PIPES)
 
-    def _load_phrase_patterns(self, path: str = 'assets/entities.json') -> None:
+    def _patterns_version(self, entities_path: str) -> Dict[str, Union[str, int]]:
+        """
+        Identifies the inputs the serialized patterns were built from.
         """
-        Loads entity patterns from a JSON file and adds them to the matcher.
+        digest = hashlib.sha256()
+        with open(entities_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        return {
+            "format": self.PATTERNS_FORMAT,
+            "entities_sha256": digest.hexdigest(),
+            "spacy": spacy.__version__,
+            "model": self.model,
+            "model_version": self.tokenizer_nlp.meta.get("version", ""),
+        }
+
+    def build_phrase_patterns(self, entities_path: str) -> Dict[str, List[List[str]]]:
+        """
+        Tokenizes every unique entity in entities.json.
 
         Args:
-            path (str): Path to the JSON file containing entity definitions.
-        """
-        if not os.path.exists(path):
-            raise FileNotFoundError(f"Entity file not found: {path}")
+            entities_path (str): JSON file of chunks with their extracted entities.
 
-        with open(path, 'r') as f:
+        Returns:
+            Dict[str, List[List[str]]]: Token texts of each entity, grouped by label.
+        """
+        with open(entities_path, 'r') as f:
             data = json.load(f)
 
         seen: set[Tuple[str, str]] = set()
-        entities: List[Dict[str, str]] = []
+        patterns_by_label: Dict[str, List[List[str]]] = {}
 
         for chunk in data:
             for entity in chunk.get("entities", []):
                 key = (entity["text"].lower(), entity["label"])
                 if key not in seen:
                     seen.add(key)
-                    entities.append(entity)
+                    doc = self.tokenizer_nlp.make_doc(entity["text"])
+                    patterns_by_label.setdefault(entity["label"], []).append([token.text for token in doc])
+
+        return patterns_by_label
+
+    def _load_phrase_patterns(self, path: str = 'assets/entities.json', patterns_path: str = 'assets/phrase_patterns.msgpack') -> None:
+        """
+        Adds the known entity patterns to the matcher, from the serialized artifact when it
+        matches the current entities.json, spaCy version and model, otherwise by tokenizing
+        entities.json and rewriting the artifact.
 
-        patterns_by_label: Dict[str, List[Doc]] = {}
-        for entity in entities:
-            label = entity["label"]
-            patterns_by_label.setdefault(label, []).append(self.nlp.make_doc(entity["text"]))
+        Args:
+            path (str): Path to the JSON file containing entity definitions.
+            patterns_path (str): Path to the serialized patterns.
+        """
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Entity file not found: {path}")
 
+        version = self._patterns_version(path)
+        patterns_by_label: Optional[Dict[str, List[List[str]]]] = None
+        if os.path.exists(patterns_path):
+            try:
+                artifact = srsly.read_msgpack(patterns_path)
+                if artifact.get("version") == version:
+                    patterns_by_label = artifact["patterns"]
+            except Exception as e:
+                print("Ignoring unreadable phrase pattern artifact:", e)
+
+        if patterns_by_label is None:
+            patterns_by_label = self.build_phrase_patterns(path)
+            try:
+                os.makedirs(os.path.dirname(patterns_path) or ".", exist_ok=True)
+                srsly.write_msgpack(patterns_path, {"version": version, "patterns": patterns_by_label})
+            except Exception as e:
+                print("Could not write phrase pattern artifact:", e)
+
+        # Docs built from token texts skip the tokenizer; the matcher compares ORTH only
+        vocab = self.tokenizer_nlp.vocab
         for label, patterns in patterns_by_label.items():
-            self.matcher.add(label, patterns)
+            self.matcher.add(label, [Doc(vocab, words=words) for words in patterns])
 
     def filter_subspan_entities(self, entities: List[Dict[str, int]]) -> List[Dict[str, int]]:
         """
@@ -93,7 +189,7 @@ class SpacyHelper:
         Returns:
             Tuple[List[Dict[str, str]], List[str]]: Matched known entities and generic keywords.
         """
-        doc = self.nlp(query)
+        doc = self.tokenizer_nlp.make_doc(query)
         matches = self.matcher(doc)
         match_spans = [{"match_id": match_id, "start": start, "end": end} for match_id, start, end in matches]
         filtered_spans = self.filter_subspan_entities(match_spans)
@@ -101,7 +197,7 @@ class SpacyHelper:
         entity_results = []
         for match in filtered_spans:
             span = doc[match["start"]:match["end"]]
-            label = self.nlp.vocab.strings[match["match_id"]]
+            label = self.tokenizer_nlp.vocab.strings[match["match_id"]]
             entity_results.append({"text": span.text, "label": label})
 
         generic_results = self.parse_user_query_for_generics(query)
@@ -131,7 +227,7 @@ class SpacyHelper:
         Returns:
             List[Dict[str, str]]: List of entities with labels.
         """
-        doc = self.nlp(text)
+        doc = self._pipeline(self.NER_PIPES)(text)
         return [{'text': ent.text, 'label': ent.label_} for ent in doc.ents]
 
     def is_date_question(self, question: str) -> bool:
@@ -144,7 +240,7 @@ class SpacyHelper:
         Returns:
             bool: True if it's a date-related question, False otherwise.
         """
-        doc = self.nlp(question)
+        doc = self._pipeline(self.PARSE_PIPES)(question)
         for token in doc:
             print('dep:', token.lemma_, token.dep_)
             if token.lemma_ in {'when', 'date', 'year', 'century', 'time', 'period', 'dynasty'} and token.dep_ in {"advmod", "npadvmod"}:
@@ -1,16 +1,122 @@
+import os
+import asyncio
+import logging
 import psycopg2
 import psycopg2.extras
 from contextlib import contextmanager
 from typing import Generator, List, Optional, Dict, Any, Tuple
-from src.db_pool import db_pool
+from src.db_pool import db_pool, connection_settings_from_env
+from src.metrics import record_error
+
+logger = logging.getLogger(__name__)
+
+
+FIND_SIMILAR_SQL = """
+    SELECT 
+        id,
+        chunk,
+        chapter,
+        1 - (embedding <=> $1::vector) AS similarity
+    FROM art_of_war_book_english
+    ORDER BY embedding <=> $1::vector
+    LIMIT $2
+"""
+
+
+def to_vector_literal(embedding: List[float]) -> str:
+    """
+    Render an embedding as a pgvector text literal, e.g. '[0.1,0.2]'.
+
+    Args:
+        embedding (List[float]): The embedding vector.
+
+    Returns:
+        str: Literal accepted wherever a vector value is expected.
+    """
+    return "[" + ",".join(map(str, embedding)) + "]"
+
+
+def get_retriever(backend: Optional[str] = None) -> Any:
+    """
+    Returns the vector search backend selected by RETRIEVER_BACKEND: "pgvector" (default)
+    queries PostgreSQL, "numpy" searches an in-process snapshot and needs no database.
+
+    Args:
+        backend (Optional[str]): Overrides RETRIEVER_BACKEND.
+
+    Returns:
+        Retriever | NumpyRetriever: An object exposing find_similar(embedding, limit).
+    """
+    backend = (backend or os.getenv("RETRIEVER_BACKEND", "pgvector")).lower()
+    if backend == "numpy":
+        from src.numpy_retriever import NumpyRetriever
+        return NumpyRetriever()
+    if backend == "pgvector":
+        return Retriever()
+    raise ValueError(f"unexpected retriever backend: {backend}")
+
+
+def get_async_retriever(backend: Optional[str] = None) -> Any:
+    """
+    Async counterpart of get_retriever. The numpy backend is returned as is: its in-process
+    search is fast enough to run on the event loop.
+
+    Args:
+        backend (Optional[str]): Overrides RETRIEVER_BACKEND.
+
+    Returns:
+        AsyncRetriever | NumpyRetriever: An object exposing find_similar(embedding, limit),
+        awaitable for the pgvector backend.
+    """
+    backend = (backend or os.getenv("RETRIEVER_BACKEND", "pgvector")).lower()
+    if backend == "pgvector":
+        return AsyncRetriever()
+    return get_retriever(backend)
 
 
 class Retriever:
     """
     Provides methods for retrieving vector-based similarity search results
     from PostgreSQL tables using pgvector.
+
+    Attributes:
+        ef_search (Optional[int]): Default HNSW candidate list size (hnsw.ef_search) for find_similar.
+        probes (Optional[int]): Default number of IVFFlat lists probed (ivfflat.probes) for find_similar.
     """
 
+    def __init__(self, ef_search: Optional[int] = None, probes: Optional[int] = None) -> None:
+        """
+        Initialize default ANN search settings, falling back to PGVECTOR_EF_SEARCH / PGVECTOR_PROBES.
+        Unset values leave the server defaults in place.
+
+        Args:
+            ef_search (Optional[int]): HNSW candidate list size; higher trades latency for recall.
+            probes (Optional[int]): IVFFlat lists probed; higher trades latency for recall.
+        """
+        self.ef_search = ef_search or int(os.getenv("PGVECTOR_EF_SEARCH", "0")) or None
+        self.probes = probes or int(os.getenv("PGVECTOR_PROBES", "0")) or None
+
+    @staticmethod
+    def apply_search_settings(cur: psycopg2.extensions.cursor, ef_search: Optional[int], probes: Optional[int]) -> None:
+        """
+        Set ANN search parameters for the current transaction only.
+
+        Args:
+            cur (cursor): Cursor whose transaction the settings apply to.
+            ef_search (Optional[int]): HNSW candidate list size.
+            probes (Optional[int]): IVFFlat lists probed.
+        """
+        if ef_search:
+            cur.execute("SET LOCAL hnsw.ef_search = %s", (int(ef_search),))
+        if probes:
+            cur.execute("SET LOCAL ivfflat.probes = %s", (int(probes),))
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Return saturation metrics of the shared connection pool.
+        """
+        return db_pool.stats()
+
     @contextmanager
     def get_cursor(self) -> Generator[psycopg2.extras.RealDictCursor, None, None]:
         """
@@ -19,40 +125,38 @@ class Retriever:
         Yields:
             Generator[RealDictCursor, None, None]: A database cursor for executing queries.
         """
-        conn = db_pool.getconn()
-        try:
+        with db_pool.connection() as conn:
             with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
                 yield cur
-        finally:
-            conn.close()
 
-    def find_similar(self, embedding: List[float], limit: int = 5) -> Optional[List[Dict[str, Any]]]:
+    def find_similar(
+        self,
+        embedding: List[float],
+        limit: int = 5,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+    ) -> Optional[List[Dict[str, Any]]]:
         """
         Find the most similar text chunks in 'art_of_war_book_english' based on vector similarity.
+        Orders by cosine distance so the planner can use an HNSW or IVFFlat index.
 
         Args:
             embedding (List[float]): The query embedding vector.
             limit (int): Maximum number of results to return.
+            ef_search (Optional[int]): Per-request hnsw.ef_search override.
+            probes (Optional[int]): Per-request ivfflat.probes override.
 
         Returns:
             Optional[List[Dict[str, Any]]]: A list of matching rows with similarity scores.
         """
         try:
-            query = """
-                SELECT 
-                    id,
-                    chunk,
-                    chapter,
-                    1 - (embedding <=> %s::vector) AS similarity
-                FROM art_of_war_book_english
-                ORDER BY similarity DESC
-                LIMIT %s;
-            """
             with self.get_cursor() as cur:
-                cur.execute(query, (embedding, limit))
+                self.apply_search_settings(cur, ef_search or self.ef_search, probes or self.probes)
+                db_pool.execute_prepared(cur, "find_similar_chunks", FIND_SIMILAR_SQL, (to_vector_literal(embedding), limit))
                 return cur.fetchall()
         except Exception as e:
-            print('Error while retrieving similar chunks:', e)
+            record_error("pgvector")
+            logger.warning("Error while retrieving similar chunks: %s", e)
             return None
 
     def find_similar_above_threshold(
@@ -141,3 +245,114 @@ class Retriever:
         with self.get_cursor() as cur:
             cur.execute(query, (limit,))
             return cur.fetchall()
+
+
+class AsyncRetriever(Retriever):
+    """
+    Vector similarity search over asyncpg, for asyncio servers: a request waiting on
+    PostgreSQL holds no thread. The asyncpg pool is created on first use inside the
+    running event loop and caches prepared statements per connection.
+
+    Attributes:
+        min_size (int): Connections opened when the pool is created.
+        max_size (int): Upper bound on open connections.
+    """
+
+    def __init__(
+        self,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        min_size: int = int(os.getenv("DB_POOL_MIN", "1")),
+        max_size: int = int(os.getenv("DB_POOL_MAX", "22")),
+    ) -> None:
+        """
+        Args:
+            ef_search (Optional[int]): HNSW candidate list size; higher trades latency for recall.
+            probes (Optional[int]): IVFFlat lists probed; higher trades latency for recall.
+            min_size (int): Connections opened when the pool is created.
+            max_size (int): Upper bound on open connections.
+        """
+        super().__init__(ef_search=ef_search, probes=probes)
+        self.min_size = min_size
+        self.max_size = max_size
+        self._pool = None
+        self._pool_lock = asyncio.Lock()
+
+    @staticmethod
+    async def _init_connection(conn: Any) -> None:
+        # asyncpg has no codec for pgvector's type; send embeddings in its text format
+        await conn.set_type_codec("vector", encoder=to_vector_literal, decoder=str, format="text")
+
+    async def get_pool(self) -> Any:
+        """
+        Returns the asyncpg pool, creating it on first use.
+        """
+        if self._pool is None:
+            async with self._pool_lock:
+                if self._pool is None:
+                    import asyncpg
+                    self._pool = await asyncpg.create_pool(
+                        min_size=self.min_size,
+                        max_size=self.max_size,
+                        init=self._init_connection,
+                        **connection_settings_from_env(),
+                    )
+        return self._pool
+
+    async def find_similar(
+        self,
+        embedding: List[float],
+        limit: int = 5,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        Find the most similar text chunks in 'art_of_war_book_english' based on vector similarity.
+
+        Args:
+            embedding (List[float]): The query embedding vector.
+            limit (int): Maximum number of results to return.
+            ef_search (Optional[int]): Per-request hnsw.ef_search override.
+            probes (Optional[int]): Per-request ivfflat.probes override.
+
+        Returns:
+            Optional[List[Dict[str, Any]]]: A list of matching rows with similarity scores.
+        """
+        ef_search = ef_search or self.ef_search
+        probes = probes or self.probes
+        try:
+            pool = await self.get_pool()
+            async with pool.acquire() as conn, conn.transaction():
+                # SET does not take bind parameters; the values are cast to int first
+                if ef_search:
+                    await conn.execute(f"SET LOCAL hnsw.ef_search = {int(ef_search)}")
+                if probes:
+                    await conn.execute(f"SET LOCAL ivfflat.probes = {int(probes)}")
+                rows = await conn.fetch(FIND_SIMILAR_SQL, embedding, limit)
+            return [dict(row) for row in rows]
+        except Exception as e:
+            record_error("pgvector")
+            logger.warning("Error while retrieving similar chunks: %s", e)
+            return None
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Return asyncpg pool occupancy; all zero until the pool is first used.
+        """
+        pool = self._pool
+        size = pool.get_size() if pool is not None else 0
+        idle = pool.get_idle_size() if pool is not None else 0
+        return {
+            "maxconn": self.max_size,
+            "open": size,
+            "in_use": size - idle,
+            "saturation": (size - idle) / self.max_size,
+        }
+
+    async def close(self) -> None:
+        """
+        Close every pooled connection.
+        """
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None